@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+This program contains the asyncio scanner for shipment directories on
+high-latency network storage. Cruise and device directories are listed in
+a pool of threads that keeps a bounded number of listings in flight, and
+each device is parsed as soon as its listing comes back, so the round trips
+of the listings overlap instead of adding up. Results are still written in
+unit order, so the output matches a serial run.
+
+Needs Python 3; parseDate.py only imports it for -n.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from parseFunctions import unit_path, read_listing
+from runFunctions import (list_cruise_units_checked, listed_units,
+                          is_finished, finished_unit, parse_unit_checked,
+                          write_unit, finish_run)
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+DEFAULT_LISTINGS = 16
+
+
+def run_units_async(cruise_args, csvlog, datelog, filelog,
+                    listings=DEFAULT_LISTINGS):
+    """
+    run_units with directory listings overlapped by the asyncio scanner
+
+    cruise_args: A list of list_units argument tuples, one per cruise
+    csvlog: True if logging dates to csv log file, false otherwise
+    datelog: True if creating SQL of min/max cruise range, false otherwise
+    filelog: True if logging SQL to files, false otherwise
+    listings: The most directory listings in flight at once
+    """
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(listings)
+    try:
+        loop.run_until_complete(scan_units(loop, executor, cruise_args,
+                                           csvlog, datelog, filelog))
+    finally:
+        executor.shutdown(wait=True)
+        loop.close()
+        finish_run()
+
+
+async def scan_units(loop, executor, cruise_args, csvlog, datelog, filelog):
+    """
+    Lists the units of every cruise and the directory of every unit in the
+    executor, parses each unit in the event loop thread as its listing
+    arrives, and writes the results in unit order
+
+    loop: The event loop
+    executor: The executor the listings run in, sized to the listing bound
+    cruise_args: A list of list_units argument tuples, one per cruise
+    csvlog, datelog, filelog: As for write_result
+    """
+    listed = asyncio.Queue()
+    unit_counts = {}  # cruise index: number of units, once listed
+    parsed = {}       # (cruise index, unit index): results not written yet
+    next_cruise, next_unit = 0, 0
+
+    async def list_unit(key, unit):
+        try:
+            listing = await loop.run_in_executor(executor, read_listing,
+                                                 unit_path(unit))
+        except OSError:
+            listing = None  # parse_unit lists it again and reports the error
+        await listed.put((key, unit, listing))
+
+    async def list_cruise(index, args):
+        units = listed_units(await loop.run_in_executor(
+            executor, list_cruise_units_checked, args))
+        pending = []
+        for i, unit in enumerate(units):
+            if is_finished(unit):  # written again in its place, unlisted
+                parsed[(index, i)] = finished_unit(unit)
+            else:
+                pending.append(list_unit((index, i), unit))
+        unit_counts[index] = len(units)
+        await asyncio.gather(*pending)
+
+    async def list_all():
+        try:
+            await asyncio.gather(*[list_cruise(index, args)
+                                   for index, args in enumerate(cruise_args)])
+        finally:
+            await listed.put(None)
+
+    def write_ready():
+        nonlocal next_cruise, next_unit
+        while next_cruise in unit_counts:
+            if next_unit == unit_counts[next_cruise]:
+                next_cruise, next_unit = next_cruise + 1, 0
+                continue
+            checked = parsed.pop((next_cruise, next_unit), None)
+            if checked is None:
+                return
+            write_unit(checked, csvlog, datelog, filelog)
+            next_unit += 1
+
+    listers = loop.create_task(list_all())
+    while True:
+        item = await listed.get()
+        if item is None:
+            break
+        key, unit, listing = item
+        parsed[key] = parse_unit_checked(unit, listing)
+        write_ready()
+    await listers  # raises the first listing error, if any
+    write_ready()
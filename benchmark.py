@@ -0,0 +1,762 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the date parsers. Each benchmark builds its own synthetic
+data in a temporary directory, times the code under test, and prints the
+results.
+
+./benchmark.py scan [entries]: listdir + isfile against scan_files on one
+    directory holding [entries] files (default 100000)
+./benchmark.py parse [names]: files/sec of every parser in parserRegistry,
+    one file at a time and in NumPy batches, on [names] synthetic filenames
+    (default 1000000)
+./benchmark.py sql [files]: SQLite apply time of the "line" and "values"
+    file update SQL, and of the database sink, for one cruise of [files]
+    files (default 5000)
+./benchmark.py stream [files]: peak RSS of parsing one device of [files]
+    files (default 200000) with and without streamed SQL
+./benchmark.py store [files]: peak RSS of holding the start times of one
+    device of [files] files (default 1000000) as a list of (datetime,
+    filename) pairs with their line SQL, as a list of pairs, and as a
+    resultStore.FileDates, and the time to render its line SQL
+./benchmark.py tree [files] [output]: builds a shipment tree in every
+    supported ship layout with [files] files per device (default 2000) and
+    runs dateparser, RC_dateparser, BH_dateparser and cruiseDateParse over
+    it end to end. Files/sec, peak RSS and filesystem call counts are
+    printed and written as JSON to [output] (default
+    benchmark_results.json)
+./benchmark.py latency [ms] [cruises]: runs every device of [cruises] RR
+    cruises (default 8) serially and with the asyncio scanner, on a local
+    tree where every directory call sleeps [ms] milliseconds (default 20)
+    to stand in for a network mount, and checks the outputs match
+./benchmark.py tar [files]: wall time and disk written to date parse an
+    archived cruise with [files] 16 KB files per device (default 2000) by
+    extracting it first, and read in place with tarScan
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+import threading
+import time
+import datetime
+import re
+import sqlite3
+import multiprocessing
+import json
+import platform
+import tarfile
+import scanFunctions
+import tarScan
+from scanFunctions import scan_files
+import parserRegistry
+import parseFunctions
+from parseFunctions import file_time_sql, generate_staged_update_sql
+from resultStore import FileDates
+from dbSink import DatabaseSink
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+
+class StatCounter(object):
+    """
+    Counts os.stat and os.lstat calls made while it is active. These are
+    the per-file syscalls that scan_files avoids.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self._stat = os.stat
+        self._lstat = os.lstat
+
+    def _wrap(self, func):
+        def counted(*args, **kwargs):
+            self.calls += 1
+            return func(*args, **kwargs)
+        return counted
+
+    def __enter__(self):
+        os.stat = self._wrap(self._stat)
+        os.lstat = self._wrap(self._lstat)
+        return self
+
+    def __exit__(self, *exc_info):
+        os.stat = self._stat
+        os.lstat = self._lstat
+
+
+def make_flat_directory(path, entries, device="gps"):
+    """
+    Fills a directory with hourly serial logger files
+
+    path: The directory to fill
+    entries: The number of files to create
+    device: The device name used as the file prefix
+    """
+    start = time.mktime((2019, 1, 1, 0, 0, 0, 0, 0, -1))
+    for i in range(entries):
+        stamp = time.strftime('%Y%m%d%H%M%S', time.localtime(start + i * 3600))
+        open(os.path.join(path, "{0}_{1}".format(device, stamp)), "w").close()
+
+
+def time_call(func):
+    """
+    Runs func under a StatCounter and returns (seconds, stat calls, result)
+
+    func: A function taking no arguments
+    """
+    with StatCounter() as counter:
+        begin = time.time()
+        result = func()
+        elapsed = time.time() - begin
+    return elapsed, counter.calls, result
+
+
+def bench_scan(entries=100000):
+    """
+    Compares listdir + isfile against scan_files on one flat directory
+
+    entries: The number of files in the directory
+    """
+    tmp = tempfile.mkdtemp()
+    try:
+        make_flat_directory(tmp, entries)
+
+        def listdir_isfile():
+            return [f for f in os.listdir(tmp)
+                    if os.path.isfile(os.path.join(tmp, f))]
+
+        def scandir_stream():
+            return list(scan_files(tmp))
+
+        for name, func in (("listdir+isfile", listdir_isfile),
+                           ("scan_files", scandir_stream)):
+            elapsed, calls, files = time_call(func)
+            print("{0}: {1} files, {2:.3f}s, {3} stat calls".format(
+                name, len(files), elapsed, calls))
+    finally:
+        shutil.rmtree(tmp)
+
+
+# filename formats matching each parser, filled with a datetime
+name_formats = [
+    (parserRegistry.MULTIBEAM, "0001_%Y%m%d_%H%M%S_EM122.all"),
+    (parserRegistry.DATE_DASH_TIME, "gps_%Y%m%d-%H%M%S.dat"),
+    (parserRegistry.SKQ, "gps.%Y%m%dT%H%MZ"),
+    (parserRegistry.DEFAULT, "gps_%Y%m%d%H%M%S"),
+    (parserRegistry.RC_SCS, "gps_%Y%m%d-%H%M.Raw"),
+]
+
+
+def synthetic_names(name_format, count):
+    """
+    Returns count hourly filenames in the given strftime format
+
+    name_format: The strftime format of the names
+    count: The number of names
+    """
+    start = datetime.datetime(2019, 1, 1)
+    hour = datetime.timedelta(hours=1)
+    return [(start + i * hour).strftime(name_format) for i in range(count)]
+
+
+def legacy_default_parse(filename):
+    """
+    The per-file split and re.match parse dateparser used before the
+    parser registry, kept to compare against
+    """
+    if (len(filename) >= 8
+        and (re.match("^[0-9]*$", filename.split('_')[-1][:8]) or
+             re.match("^[0-9]*$", filename.split('T')[0][-8:]))):
+        file_date = filename.split('_')[-1]
+        return datetime.datetime(int(file_date[0:4]), int(file_date[4:6]),
+                                 int(file_date[6:8]), int(file_date[8:10]),
+                                 int(file_date[10:12]), int(file_date[12:14]))
+    return None
+
+
+def bench_parse(names=1000000):
+    """
+    Times every registry parser, and the legacy default parse, on
+    synthetic filenames
+
+    names: The number of filenames per parser
+    """
+    def run(parse, filenames):
+        begin = time.time()
+        for filename in filenames:
+            parse(filename)
+        return time.time() - begin
+
+    default_names = None
+    for parser, name_format in name_formats:
+        filenames = synthetic_names(name_format, names)
+        if parser is parserRegistry.DEFAULT:
+            default_names = filenames
+        elapsed = run(parser.parse, filenames)
+        print("{0}: {1:.0f} files/sec".format(parser.name, names / elapsed))
+        if parserRegistry.load_numpy() is not None:
+            begin = time.time()
+            parser.parse_batch(filenames)
+            elapsed = time.time() - begin
+            print("{0} batch: {1:.0f} files/sec".format(parser.name,
+                                                       names / elapsed))
+    start = datetime.datetime(2019, 1, 1)
+    filenames = ["gp90{0}_{1:05d}.raw".format(
+        (start + datetime.timedelta(hours=i)).strftime('%y_%j'),
+        (i % 24) * 3600) for i in range(names)]
+    elapsed = run(parserRegistry.BH_GP90.parse, filenames)
+    print("{0}: {1:.0f} files/sec".format(parserRegistry.BH_GP90.name,
+                                          names / elapsed))
+    if parserRegistry.load_numpy() is not None:
+        begin = time.time()
+        parserRegistry.BH_GP90.parse_batch(filenames)
+        elapsed = time.time() - begin
+        print("{0} batch: {1:.0f} files/sec".format(
+            parserRegistry.BH_GP90.name, names / elapsed))
+    elapsed = run(legacy_default_parse, default_names)
+    print("legacy default: {0:.0f} files/sec".format(names / elapsed))
+
+
+def make_file_table(db, cruises, files):
+    """
+    Creates and fills a file table shaped like the one the SQL updates
+
+    db: An open sqlite3 connection
+    cruises: The cruise IDs to add files for
+    files: The number of files per cruise
+    """
+    db.execute("CREATE TABLE file (id INTEGER PRIMARY KEY, cruise_id TEXT, "
+               "path TEXT, start_time TIMESTAMP)")
+    db.execute("CREATE INDEX file_cruise_id ON file (cruise_id)")
+    names = synthetic_names("gps_%Y%m%d%H%M%S", files)
+    for cruise in cruises:
+        db.executemany(
+            "INSERT INTO file (cruise_id, path) VALUES (?, ?)",
+            [(cruise, "{0}/data/SerialInstruments/gps/{1}".format(cruise, name))
+             for name in names])
+    db.commit()
+    return names
+
+
+def bench_sql(files=5000):
+    """
+    Applies the per-line and the set-based file update SQL to the same
+    SQLite file table and compares apply times
+
+    files: The number of files in the updated cruise
+    """
+    cruise = "RR1901"
+    tmp = tempfile.mkdtemp()
+    try:
+        db = sqlite3.connect(os.path.join(tmp, "bench.db"))
+        names = make_file_table(db, [cruise, "RR1902", "RR1903"], files)
+        file_dates = [(parserRegistry.DEFAULT.parse(name), name)
+                      for name in names]
+        modes = (
+            ("line", [file_time_sql(filedate, cruise, filename)
+                      for filedate, filename in file_dates]),
+            ("values", generate_staged_update_sql(file_dates, cruise)),
+        )
+        for mode, sql_lines in modes:
+            db.execute("UPDATE file SET start_time = NULL")
+            db.commit()
+            begin = time.time()
+            db.executescript("BEGIN;\n" + "\n".join(sql_lines) + "\nCOMMIT;")
+            elapsed = time.time() - begin
+            updated = db.execute("SELECT COUNT(*) FROM file "
+                                 "WHERE start_time IS NOT NULL").fetchone()[0]
+            print("{0}: {1} rows updated, {2:.3f}s".format(mode, updated,
+                                                           elapsed))
+        db.execute("UPDATE file SET start_time = NULL")
+        db.commit()
+        db.close()
+        sink = DatabaseSink(
+            lambda: sqlite3.connect(os.path.join(tmp, "bench.db")))
+        sink.apply_file_dates(cruise, "gps", file_dates)
+        sink.close()
+        print("sink: " + sink.summary())
+    finally:
+        shutil.rmtree(tmp)
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of this process in KB, or None
+    where the resource module is not available
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':  # bytes on macOS, KB elsewhere
+        peak //= 1024
+    return peak
+
+
+def _stream_child(queue, shipment_path, output_dir, order, memory_rows):
+    """
+    Parses the synthetic device in a fresh process and reports its peak RSS
+    """
+    os.chdir(output_dir)
+    parseFunctions.stream_order = order
+    parseFunctions.sql_memory_rows = memory_rows
+    begin = time.time()
+    result = parseFunctions.parse_device("RR1901", shipment_path, "gps")
+    parseFunctions.write_result(result, False, False, True)
+    queue.put((time.time() - begin, peak_rss()))
+
+
+def bench_stream(files=200000):
+    """
+    Compares peak RSS of one large device parsed with in-memory SQL and
+    with streamed SQL in each order
+
+    files: The number of files in the device directory
+    """
+    tmp = tempfile.mkdtemp()
+    try:
+        device_path = os.path.join(tmp, "RR1901", "data", "SerialInstruments",
+                                   "gps")
+        os.makedirs(device_path)
+        make_flat_directory(device_path, files)
+        for order in (None, "none", "date", "filename"):
+            queue = multiprocessing.Queue()
+            child = multiprocessing.Process(
+                target=_stream_child,
+                args=(queue, tmp + "/", tmp, order, 10000))
+            child.start()
+            elapsed, peak = queue.get()
+            child.join()
+            print("{0}: {1:.3f}s, peak RSS {2} KB".format(
+                order or "in memory", elapsed, peak))
+    finally:
+        shutil.rmtree(tmp)
+
+
+def synthetic_file_dates(files):
+    """
+    Yields (start date, filename) pairs of one hourly gps device
+    """
+    start = datetime.datetime(2019, 1, 1)
+    for i in range(files):
+        filedate = start + datetime.timedelta(hours=i)
+        yield filedate, filedate.strftime("gps_%Y%m%d%H%M%S")
+
+
+def _store_child(queue, files, holder):
+    """
+    Holds the synthetic start times the way holder names in a fresh
+    process, and reports the peak RSS they took and the time to render
+    their line SQL
+    """
+    before = peak_rss()
+    if holder == "pairs + SQL":
+        file_dates = list(synthetic_file_dates(files))
+        sql = [file_time_sql(filedate, "RR1901", filename)
+               for filedate, filename in file_dates]
+    elif holder == "pairs":
+        file_dates = list(synthetic_file_dates(files))
+    else:
+        file_dates = FileDates(synthetic_file_dates(files))
+    held = peak_rss() - before
+    begin = time.time()
+    for filedate, filename in file_dates:
+        file_time_sql(filedate, "RR1901", filename)
+    queue.put((time.time() - begin, held))
+
+
+def bench_store(files=1000000):
+    """
+    Compares the memory of the ways start times of one device can be held
+
+    files: The number of files of the device
+    """
+    for holder in ("pairs + SQL", "pairs", "FileDates"):
+        queue = multiprocessing.Queue()
+        child = multiprocessing.Process(target=_store_child,
+                                        args=(queue, files, holder))
+        child.start()
+        elapsed, peak = queue.get()
+        child.join()
+        print("{0}: {1} KB, {2:.0f} bytes/file, SQL rendered in {3:.3f}s".format(
+            holder, peak, peak * 1024.0 / files, elapsed))
+
+
+class FsCallCounter(object):
+    """
+    Counts the filesystem calls made from Python while it is active, by
+    name: stat, lstat, listdir, scandir and open. Calls made inside C
+    code (the stat scandir does for DirEntry.is_file) are not seen.
+    """
+
+    def __init__(self):
+        self.calls = dict.fromkeys(
+            ("stat", "lstat", "listdir", "scandir", "open"), 0)
+        try:
+            import builtins
+        except ImportError:  # Python 2
+            import __builtin__ as builtins
+        self._targets = [(os, "stat"), (os, "lstat"), (os, "listdir"),
+                         (builtins, "open")]
+        if getattr(os, "scandir", None) is not None:
+            self._targets.append((os, "scandir"))
+        if scanFunctions.scandir is not None:
+            self._targets.append((scanFunctions, "scandir"))
+        self._saved = [getattr(module, name) for module, name in self._targets]
+
+    def _wrap(self, name, func):
+        def counted(*args, **kwargs):
+            self.calls[name] += 1
+            return func(*args, **kwargs)
+        return counted
+
+    def __enter__(self):
+        for (module, name), func in zip(self._targets, self._saved):
+            setattr(module, name, self._wrap(name, func))
+        return self
+
+    def __exit__(self, *exc_info):
+        for (module, name), func in zip(self._targets, self._saved):
+            setattr(module, name, func)
+
+
+# one cruise in every ship layout the parsers support:
+# (cruise, dateparse method, device directory, filename format). Directory
+# and filename formats are filled with str.format (device, adcp, seconds
+# of the day) after strftime.
+shipment_layouts = [
+    ("RR1901", "1", "data/SerialInstruments/{device}",
+     "{device}_%Y%m%d%H%M%S"),
+    ("HLY1901", "1", "data/sensor/serial_logger/{device}",
+     "{device}_%Y%m%d%H%M%S"),
+    ("oc1901", "1", "das/{device}", "{device}_%Y%m%d-%H%M%S.dat"),
+    ("SKQ201901", "1", "lds/raw/{device}", "{device}.%Y%m%dT%H%MZ"),
+    ("SP1901", "1", "SerialInstruments/{device}", "{device}_%Y%m%d%H%M%S"),
+    ("TN101", "1", "scs/{device}", "{device}_%Y%m%d-%H%M%S.Raw"),
+    ("RC0101", "2", "01scs", "{device}_%Y%m%d-%H%M.Raw"),
+    ("BH1901", "3", "ADCP{adcp}/raw/gp90", "gp90%y_%j_{seconds:05d}.raw"),
+]
+
+
+def make_shipment_tree(root, files=2000, devices=("gps", "met"),
+                       layouts=None, interval=3600):
+    """
+    Builds a synthetic shipment tree and returns {cruise: files created}
+
+    root: The shipment directory to build under
+    files: The number of files per device
+    devices: The device names. RC devices share the scs directory as file
+        prefixes, BH devices become ADCP1, ADCP2, ...
+    layouts: (cruise, method, directory, name format) tuples, default
+        shipment_layouts
+    interval: Seconds between consecutive file timestamps
+    """
+    start = datetime.datetime(2019, 1, 1)
+    step = datetime.timedelta(seconds=interval)
+    created = {}
+    for cruise, method, directory, name_format in layouts or shipment_layouts:
+        created[cruise] = 0
+        for adcp, device in enumerate(devices, 1):
+            path = os.path.join(root, cruise,
+                                directory.format(device=device, adcp=adcp))
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            for i in range(files):
+                stamp = start + i * step
+                name = stamp.strftime(name_format).format(
+                    device=device,
+                    seconds=stamp.hour * 3600 + stamp.minute * 60 +
+                    stamp.second)
+                open(os.path.join(path, name), "w").close()
+            created[cruise] += files
+    return created
+
+
+def _tree_child(queue, function, args, output_dir):
+    """
+    Runs one parser entry point in a fresh process, so peak RSS belongs to
+    that run alone, and reports its time, peak RSS and filesystem calls
+    """
+    os.chdir(output_dir)
+    try:
+        with FsCallCounter() as counter:
+            begin = time.time()
+            getattr(parseFunctions, function)(*args)
+            elapsed = time.time() - begin
+    except Exception as e:
+        queue.put((None, None, repr(e)))
+        return
+    queue.put((elapsed, peak_rss(), counter.calls))
+
+
+def bench_tree(files=2000, output="benchmark_results.json"):
+    """
+    Times every parser entry point end to end on a synthetic shipment tree
+    holding every supported ship layout, and writes the results as JSON
+
+    files: The number of files per device
+    output: The JSON results file
+    """
+    devices = ("gps", "met")
+    tmp = tempfile.mkdtemp()
+    results = []
+    try:
+        shipment_path = tmp + "/"
+        created = make_shipment_tree(shipment_path, files, devices)
+        output_dir = os.path.join(tmp, "output")
+        os.mkdir(output_dir)
+        for cruise, method, directory, name_format in shipment_layouts:
+            if method == '1':
+                SI_path = parseFunctions.find_path(
+                    parseFunctions.get_ship_abbreviation(cruise.upper()))
+                cases = [("dateparser", (cruise, shipment_path, devices[0],
+                                         False, True, True, SI_path), files),
+                         ("cruiseDateParse", (cruise, shipment_path,
+                                              False, True, True, SI_path),
+                          created[cruise])]
+            elif method == '2':
+                cases = [("RC_dateparser", (cruise, shipment_path,
+                                            False, True, True),
+                          created[cruise])]
+            else:
+                cases = [("BH_dateparser", (cruise, shipment_path,
+                                            False, True, True),
+                          created[cruise])]
+            for function, args, parsed in cases:
+                queue = multiprocessing.Queue()
+                child = multiprocessing.Process(
+                    target=_tree_child,
+                    args=(queue, function, args, output_dir))
+                child.start()
+                elapsed, peak, calls = queue.get()
+                child.join()
+                if elapsed is None:
+                    print("{0} {1}: failed, {2}".format(function, cruise,
+                                                        calls))
+                    continue
+                result = {
+                    "benchmark": function,
+                    "cruise": cruise,
+                    "layout": directory,
+                    "files": parsed,
+                    "elapsed": round(elapsed, 6),
+                    "files_per_sec": round(parsed / elapsed, 1)
+                    if elapsed else None,
+                    "peak_rss_kb": peak,
+                    "fs_calls": calls,
+                }
+                results.append(result)
+                print("{0} {1}: {2} files, {3:.3f}s, {4} files/sec, "
+                      "peak RSS {5} KB, fs calls {6}".format(
+                          function, cruise, parsed, elapsed,
+                          result["files_per_sec"], peak,
+                          sum(calls.values())))
+    finally:
+        shutil.rmtree(tmp)
+    f = open(output, "w")
+    json.dump({"python": platform.python_version(),
+               "platform": sys.platform,
+               "run_at": datetime.datetime.now().isoformat(),
+               "files_per_device": files,
+               "results": results}, f, indent=2, sort_keys=True)
+    f.close()
+    print("Results written to {0}".format(output))
+
+
+class LatencyFS(object):
+    """
+    Makes every directory listing and stat sleep for a fixed latency while
+    active, a local stand-in for shipment directories on a network mount.
+    The sleep releases the GIL, as waiting on a real round trip does.
+    most_in_flight is the most calls that were waiting at once.
+
+    latency: Seconds each call waits
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.in_flight = 0
+        self.most_in_flight = 0
+        self._lock = threading.Lock()
+        self._targets = [(os, "stat"), (os, "listdir")]
+        if scanFunctions.scandir is not None:
+            self._targets.append((scanFunctions, "scandir"))
+        self._saved = [getattr(module, name) for module, name in self._targets]
+
+    def _wrap(self, func):
+        def slow(*args, **kwargs):
+            with self._lock:
+                self.in_flight += 1
+                self.most_in_flight = max(self.most_in_flight,
+                                          self.in_flight)
+            try:
+                time.sleep(self.latency)
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+        return slow
+
+    def __enter__(self):
+        for (module, name), func in zip(self._targets, self._saved):
+            setattr(module, name, self._wrap(func))
+        return self
+
+    def __exit__(self, *exc_info):
+        for (module, name), func in zip(self._targets, self._saved):
+            setattr(module, name, func)
+
+
+def bench_latency(latency_ms=20, cruises=8):
+    """
+    Compares a serial run with asyncio scanner runs on a tree with
+    simulated per-call latency, and checks their SQL is the same
+
+    latency_ms: Milliseconds each directory call waits
+    cruises: The number of RR cruises in the tree
+    """
+    try:
+        from asyncScan import run_units_async
+    except (ImportError, SyntaxError):
+        print("latency needs Python 3")
+        return
+    from runFunctions import run_units
+    layouts = [("RR19{0:02d}".format(i), "1",
+                "data/SerialInstruments/{device}", "{device}_%Y%m%d%H%M%S")
+               for i in range(1, cruises + 1)]
+    tmp = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        shipment_path = os.path.join(tmp, "shipment") + "/"
+        make_shipment_tree(shipment_path, 200, ("gps", "met", "gyro", "wind"),
+                           layouts)
+        cruise_args = [(cruise, shipment_path, "", "1", True, "")
+                       for cruise, method, directory, name_format in layouts]
+        runs = [("serial", lambda: run_units(cruise_args, False, True, True))]
+        for listings in (4, 16):
+            runs.append(("asyncio, {0} in flight".format(listings),
+                         lambda listings=listings: run_units_async(
+                             cruise_args, False, True, True, listings)))
+        outputs = []
+        for name, run in runs:
+            output_dir = os.path.join(tmp, "output{0}".format(len(outputs)))
+            os.mkdir(output_dir)
+            os.chdir(output_dir)
+            with LatencyFS(latency_ms / 1000.0) as latency:
+                begin = time.time()
+                run()
+                elapsed = time.time() - begin
+            os.chdir(cwd)
+            output = {}
+            for filename in os.listdir(output_dir):
+                f = open(os.path.join(output_dir, filename))
+                output[filename] = f.read()
+                f.close()
+            outputs.append(output)
+            print("{0}: {1:.3f}s, {2} calls at once, output {3}".format(
+                name, elapsed, latency.most_in_flight,
+                "matches" if output == outputs[0] else "DIFFERS"))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp)
+
+
+def bench_tar(files=2000):
+    """
+    Compares extracting an archived cruise and parsing the extracted tree
+    with parsing the archive in place
+
+    files: The number of files per device
+    """
+    from runFunctions import run_units
+    cruise = "RR1901"
+    devices = ("gps", "met", "gyro", "wind")
+    layouts = [(cruise, "1", "data/SerialInstruments/{device}",
+                "{device}_%Y%m%d%H%M%S")]
+    tmp = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        source = os.path.join(tmp, "source") + "/"
+        make_shipment_tree(source, files, devices, layouts)
+        payload = b"x" * 16384
+        for device in devices:
+            device_path = os.path.join(source, cruise, "data",
+                                       "SerialInstruments", device)
+            for name in os.listdir(device_path):
+                f = open(os.path.join(device_path, name), "wb")
+                f.write(payload)
+                f.close()
+        shipment_path = os.path.join(tmp, "shipment") + "/"
+        os.mkdir(shipment_path)
+        archive_path = os.path.join(shipment_path, cruise + ".tar")
+        # shipments are made with GNU tar, not Python's default PAX format
+        archive = tarfile.open(archive_path, "w", format=tarfile.GNU_FORMAT)
+        archive.add(os.path.join(source, cruise), cruise)
+        archive.close()
+        shutil.rmtree(source)
+        cruise_args = [(cruise, shipment_path, "", "1", True, "")]
+
+        def extracted():
+            archive = tarfile.open(archive_path)
+            archive.extractall(shipment_path)
+            archive.close()
+            run_units(cruise_args, False, True, True)
+
+        def in_place():
+            tarScan.mount_archives(cruise, shipment_path, True)
+            run_units(cruise_args, False, True, True)
+
+        for name, run in (("extract then parse", extracted),
+                          ("read in place", in_place)):
+            output_dir = os.path.join(tmp, name.replace(" ", "_"))
+            os.mkdir(output_dir)
+            os.chdir(output_dir)
+            begin = time.time()
+            run()
+            elapsed = time.time() - begin
+            os.chdir(cwd)
+            written = 0
+            cruise_path = os.path.join(shipment_path, cruise)
+            for dirpath, dirnames, filenames in os.walk(cruise_path):
+                for filename in filenames:
+                    written += os.path.getsize(os.path.join(dirpath, filename))
+            print("{0}: {1:.3f}s, {2:.1f} MB extracted to disk".format(
+                name, elapsed, written / 1048576.0))
+            if os.path.isdir(cruise_path):
+                shutil.rmtree(cruise_path)
+    finally:
+        os.chdir(cwd)
+        scanFunctions.mounts.clear()
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 1 or sys.argv[1] == '-h':
+        print(__doc__)
+        quit()
+    if sys.argv[1] == "scan":
+        bench_scan(*[int(arg) for arg in sys.argv[2:3]])
+    if sys.argv[1] == "parse":
+        bench_parse(*[int(arg) for arg in sys.argv[2:3]])
+    if sys.argv[1] == "sql":
+        bench_sql(*[int(arg) for arg in sys.argv[2:3]])
+    if sys.argv[1] == "stream":
+        bench_stream(*[int(arg) for arg in sys.argv[2:3]])
+    if sys.argv[1] == "store":
+        bench_store(*[int(arg) for arg in sys.argv[2:3]])
+    if sys.argv[1] == "latency":
+        bench_latency(*[int(arg) for arg in sys.argv[2:4]])
+    if sys.argv[1] == "tar":
+        bench_tar(*[int(arg) for arg in sys.argv[2:3]])
+    if sys.argv[1] == "tree":
+        bench_tree(*([int(arg) for arg in sys.argv[2:3]] + sys.argv[3:4]))
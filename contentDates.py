@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+"""
+This program contains the content fallback for files whose names hold no
+date. Only the first few KB of a file are read for its start time, and the
+last few KB, with one seek, for its end time, so multi-GB multibeam .all
+or ADCP raw files cost no more than small logs. The first NMEA RMC/ZDA
+sentence or instrument timestamp of the head is the file's start, and the
+last one of the tail its end. Files are dated in a pool of threads, in
+parallel with each other and after the filename parse of their directory,
+so files with dated names never wait on a read.
+
+A run manifest keeps only the start of each file, so content_dates reads
+only heads. With -e, content_ends reads the head and tail of the last file
+of a device, and of each file dated from its content, for their ends.
+"""
+
+import os
+import re
+import datetime
+from multiprocessing.pool import ThreadPool
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+# bytes read from each end of a file
+READ_BYTES = 8192
+
+# threads reading files at once
+READ_THREADS = 8
+
+# (regex, field order) pairs; the fields are the regex groups in the order
+# year, month, day, hour, minute, second
+TIMESTAMP_FORMATS = [
+    # $GPRMC,hhmmss.ss,A,llll.ll,a,yyyyy.yy,a,x.x,x.x,ddmmyy
+    (re.compile(br'\$[A-Z]{2}RMC,(\d{2})(\d{2})(\d{2})(?:\.\d*)?,[AV]?,'
+                br'[^,]*,[NS]?,[^,]*,[EW]?,[^,]*,[^,]*,(\d{2})(\d{2})(\d{2})'),
+     (5, 4, 3, 0, 1, 2)),
+    # $GPZDA,hhmmss.ss,dd,mm,yyyy
+    (re.compile(br'\$[A-Z]{2}ZDA,(\d{2})(\d{2})(\d{2})(?:\.\d*)?,'
+                br'(\d{2}),(\d{2}),(\d{4})'),
+     (5, 4, 3, 0, 1, 2)),
+    # 2019-01-31T12:00:00, 2019/01/31 12:00:00
+    (re.compile(br'(\d{4})[-/](\d{2})[-/](\d{2})[T ](\d{2}):(\d{2}):(\d{2})'),
+     (0, 1, 2, 3, 4, 5)),
+    # SCS logger lines: 01/31/2019,12:00:00
+    (re.compile(br'(\d{2})/(\d{2})/(\d{4}),(\d{2}):(\d{2}):(\d{2})'),
+     (2, 0, 1, 3, 4, 5)),
+]
+
+_pool = None
+_pool_pid = None
+
+
+def to_datetime(fields):
+    """
+    Returns the datetime of (year, month, day, hour, minute, second) byte
+    strings, or None if they are not a real date. Two digit years are
+    taken as 1969 to 2068.
+    """
+    try:
+        year, month, day, hour, minute, second = [int(field) for field in fields]
+        if year < 100:
+            year += 1900 if year >= 69 else 2000
+        return datetime.datetime(year, month, day, hour, minute, second)
+    except ValueError:
+        return None
+
+
+def find_timestamps(data):
+    """
+    Returns the first and last timestamps in a block of bytes as
+    ((offset, datetime), (offset, datetime)), or (None, None)
+
+    data: The bytes to search
+    """
+    first = last = None
+    for regex, order in TIMESTAMP_FORMATS:
+        for match in regex.finditer(data):
+            groups = match.groups()
+            filedate = to_datetime([groups[i] for i in order])
+            if filedate is None:
+                continue
+            found = (match.start(), filedate)
+            if first is None or found[0] < first[0]:
+                first = found
+            if last is None or found[0] > last[0]:
+                last = found
+    return first, last
+
+
+def read_head(path, read_bytes=READ_BYTES):
+    """
+    Returns the first read_bytes of a file
+
+    path: The file
+    read_bytes: The bytes to read
+    """
+    f = open(path, "rb")
+    try:
+        return f.read(read_bytes)
+    finally:
+        f.close()
+
+
+def read_head_tail(path, read_bytes=READ_BYTES):
+    """
+    Returns the first and last read_bytes of a file, the tail empty when
+    the head already holds the whole file
+
+    path: The file
+    read_bytes: The bytes to read from each end
+    """
+    f = open(path, "rb")
+    try:
+        head = f.read(read_bytes)
+        if len(head) < read_bytes:
+            return head, b""
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(read_bytes, size - read_bytes))
+        return head, f.read(read_bytes)
+    finally:
+        f.close()
+
+
+def content_start(path):
+    """
+    Returns the start of a file from the first timestamp in its head, or
+    None if there is none or it cannot be read
+
+    path: The file
+    """
+    try:
+        head = read_head(path)
+    except (IOError, OSError):
+        return None
+    first = find_timestamps(head)[0]
+    return first[1] if first is not None else None
+
+
+def content_range(path):
+    """
+    Returns (start, end) of a file from the first timestamp in its head
+    and the last in its tail, or None if there are none or it cannot be
+    read
+
+    path: The file
+    """
+    try:
+        head, tail = read_head_tail(path)
+    except (IOError, OSError):
+        return None
+    first, last = find_timestamps(head)
+    if first is None:
+        return None
+    tail_last = find_timestamps(tail)[1] if tail else None
+    if tail_last is not None:
+        last = tail_last
+    return first[1], last[1]
+
+
+def thread_pool():
+    """
+    Returns the reading pool of this process, made on first use. Threads do
+    not survive a fork, so worker processes make their own.
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ThreadPool(READ_THREADS)
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def content_dates(path, filenames):
+    """
+    Returns (start date, filename) for the files of a directory that have
+    a timestamp in their head, in the order of filenames
+
+    path: The directory
+    filenames: The names of the files to read
+    """
+    filenames = list(filenames)
+    if not filenames:
+        return []
+    paths = [os.path.join(path, filename) for filename in filenames]
+    starts = thread_pool().map(content_start, paths)
+    return [(start, filename)
+            for start, filename in zip(starts, filenames) if start is not None]
+
+
+def content_ends(path, filenames):
+    """
+    Returns {filename: end date} for the files of a directory that have
+    timestamps in their content, the end being the last one in their tail
+
+    path: The directory
+    filenames: The names of the files to read
+    """
+    filenames = list(filenames)
+    if not filenames:
+        return {}
+    paths = [os.path.join(path, filename) for filename in filenames]
+    spans = thread_pool().map(content_range, paths)
+    return dict((filename, span[1])
+                for span, filename in zip(spans, filenames) if span is not None)
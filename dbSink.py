@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""
+This program contains the database sink, which applies the file start time
+and cruise range updates straight to the database over DB-API instead of
+writing .sql files to replay by hand. Rows go through parameterized
+statements in batches of one transaction each, on one connection kept for
+the whole run. A batch that fails is rolled back and retried on its own,
+so the batches already committed are never applied twice.
+"""
+
+import time
+import importlib
+from logFunctions import logger
+from parseFunctions import (format_file_time, STAGING_CREATE_SQL,
+                            STAGING_UPDATE_SQL, STAGING_CREATE_END_SQL,
+                            STAGING_UPDATE_END_SQL)
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+# statements are written in qmark style and converted to the paramstyle of
+# the driver by to_paramstyle, and their parameters by to_params
+STAGING_CLEAR = "DELETE FROM file_time_staging"
+
+STAGING_INSERT = (
+    "INSERT INTO file_time_staging (cruise_id, filename, start_time) "
+    "VALUES (?, ?, ?)")
+
+STAGING_INSERT_END = (
+    "INSERT INTO file_time_staging (cruise_id, filename, start_time, "
+    "end_time) VALUES (?, ?, ?, ?)")
+
+CRUISE_RANGE_UPDATE = (
+    "UPDATE cruise_issues SET unols_start_date = ?, unols_end_date = ? "
+    "WHERE cruise = ?")
+
+
+def to_paramstyle(statement, paramstyle):
+    """
+    Converts a qmark style statement to another DB-API paramstyle. The
+    named style names the placeholders :p1, :p2 and on, and takes its
+    parameters as a dict from to_params.
+
+    statement: The statement with ? placeholders
+    paramstyle: "qmark", "format", "pyformat", "numeric" or "named"
+    """
+    if paramstyle == "qmark":
+        return statement
+    parts = statement.split("?")
+    if paramstyle in ("format", "pyformat"):
+        return "%s".join(part.replace("%", "%%") for part in parts)
+    if paramstyle in ("numeric", "named"):
+        name = ":{0}{1}" if paramstyle == "numeric" else ":p{0}{1}"
+        converted = parts[0]
+        for i, part in enumerate(parts[1:], 1):
+            converted += name.format(i, part)
+        return converted
+    raise ValueError("Unsupported paramstyle {0}".format(paramstyle))
+
+
+def to_params(params, paramstyle):
+    """
+    Returns the parameters of a statement converted by to_paramstyle: a
+    dict of p1, p2 and on for the named paramstyle, else params itself
+
+    params: The parameters, in the order of the ? placeholders
+    paramstyle: As for to_paramstyle
+    """
+    if paramstyle == "named":
+        return dict(("p{0}".format(i), value)
+                    for i, value in enumerate(params, 1))
+    return params
+
+
+def connect_spec(spec):
+    """
+    Returns a function opening a DB-API connection from a "module:dsn"
+    spec, such as "psycopg2:dbname=rvdata" or "sqlite3:/data/r2r.db", and
+    the paramstyle of the module. A spec with no module is an SQLite file.
+
+    spec: The connection spec
+    """
+    module_name, _, dsn = spec.partition(":")
+    if not dsn or not module_name.replace("_", "").replace(".", "").isalnum():
+        module_name, dsn = "sqlite3", spec
+    module = importlib.import_module(module_name)
+    return (lambda: module.connect(dsn)), module.paramstyle
+
+
+class DatabaseSink(object):
+    """
+    Applies DeviceResults to a database over one reused DB-API connection.
+    File start times are loaded into the file_time_staging table and
+    applied with one set-based UPDATE per batch, the same statements the
+    "values" SQL mode writes to file.
+
+    connect: A function taking no arguments that opens a connection
+    paramstyle: The DB-API paramstyle of the driver
+    batch_size: The rows applied per transaction
+    retries: The times a failed batch is retried before it is given up on
+    retry_delay: Seconds to wait before the first retry, doubled each time
+    """
+
+    def __init__(self, connect, paramstyle="qmark", batch_size=5000,
+                 retries=3, retry_delay=1.0):
+        to_paramstyle("?", paramstyle)  # raises for an unsupported style
+        self.connect = connect
+        self.paramstyle = paramstyle
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.connection = None
+        self.rows = 0
+        self.batches = 0
+        self.retried = 0
+        self.failed = []
+        self.elapsed = 0.0
+
+    def _statement(self, statement):
+        return to_paramstyle(statement, self.paramstyle)
+
+    def _params(self, params):
+        return to_params(params, self.paramstyle)
+
+    def _cursor(self):
+        if self.connection is None:
+            self.connection = self.connect()
+        return self.connection.cursor()
+
+    def _reset(self):
+        """
+        Rolls back the open transaction, reconnecting if that fails too
+        """
+        try:
+            self.connection.rollback()
+        except Exception:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def _apply(self, description, apply, rows):
+        """
+        Runs apply(cursor) as one transaction, retrying it when it fails.
+        A batch still failing after every retry is kept in self.failed.
+
+        description: What the batch holds, for the log
+        apply: A function taking a cursor that runs the batch statements
+        rows: The number of rows the batch applies
+        """
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            begin = time.time()
+            try:
+                cursor = self._cursor()
+                apply(cursor)
+                self.connection.commit()
+            except Exception as e:
+                self.elapsed += time.time() - begin
+                logger.warning("Database batch {0} failed (attempt {1}): "
+                               "{2}".format(description, attempt + 1, e))
+                if self.connection is not None:
+                    self._reset()
+                if attempt == self.retries:
+                    self.failed.append((description, apply, rows))
+                    logger.error("Giving up on database batch {0}".format(
+                        description))
+                    return False
+                self.retried += 1
+                time.sleep(delay)
+                delay *= 2
+                continue
+            self.elapsed += time.time() - begin
+            self.rows += rows
+            self.batches += 1
+            return True
+
+    def apply_file_dates(self, cruise, device, file_dates, file_ends=None):
+        """
+        Applies the file start times of one device in batches
+
+        cruise: The cruise ID
+        device: The device the files belong to, for the log
+        file_dates: (start date, filename) pairs
+        file_ends: The end date of each of file_dates, or None for an
+            unknown end, to also apply end times
+        """
+        clear = self._statement(STAGING_CLEAR)
+        if file_ends is None:
+            create = STAGING_CREATE_SQL.rstrip(";")
+            insert = self._statement(STAGING_INSERT)
+            update = STAGING_UPDATE_SQL.rstrip(";")
+        else:
+            create = STAGING_CREATE_END_SQL.rstrip(";")
+            insert = self._statement(STAGING_INSERT_END)
+            update = STAGING_UPDATE_END_SQL.rstrip(";")
+        for start in range(0, len(file_dates), self.batch_size):
+            batch = file_dates[start:start + self.batch_size]
+            if file_ends is None:
+                rows = [self._params((cruise, filename,
+                                      format_file_time(filedate)))
+                        for filedate, filename in batch]
+            else:
+                rows = [self._params((cruise, filename,
+                                      format_file_time(filedate),
+                                      None if enddate is None
+                                      else format_file_time(enddate)))
+                        for (filedate, filename), enddate
+                        in zip(batch, file_ends[start:start + self.batch_size])]
+
+            def apply(cursor, rows=rows):
+                cursor.execute(create)
+                cursor.execute(clear)
+                cursor.executemany(insert, rows)
+                cursor.execute(update)
+                cursor.execute(clear)
+
+            self._apply("{0} {1} rows {2}-{3}".format(
+                cruise, device, start, start + len(rows) - 1), apply, len(rows))
+
+    def apply_cruise_range(self, cruise, mindate, maxdate):
+        """
+        Applies the date range of a cruise to cruise_issues
+
+        cruise: The cruise ID
+        mindate: The minimum date
+        maxdate: The maximum date
+        """
+        update = self._statement(CRUISE_RANGE_UPDATE)
+        params = self._params((mindate.strftime('%Y-%m-%d %H:%M:%S'),
+                               maxdate.strftime('%Y-%m-%d %H:%M:%S'), cruise))
+        self._apply("{0} range".format(cruise),
+                    lambda cursor: cursor.execute(update, params), 1)
+
+    def write_result(self, result, filelog, datelog):
+        """
+        Applies a DeviceResult the way log() writes it to .sql files
+
+        result: The DeviceResult to apply
+        filelog: True if applying the file start times
+        datelog: True if applying the cruise date range
+        """
+        if filelog and result.file_dates is not None:
+            self.apply_file_dates(result.cruise, result.device,
+                                  result.file_dates, result.file_ends)
+        if datelog:
+            self.apply_cruise_range(result.cruise, result.mindate,
+                                    result.maxdate)
+
+    def retry_failed(self):
+        """
+        Retries the batches that were given up on, keeping any that still
+        fail. Returns True when none are left.
+        """
+        failed, self.failed = self.failed, []
+        for description, apply, rows in failed:
+            self._apply(description, apply, rows)
+        return not self.failed
+
+    def summary(self):
+        """
+        Returns a one line report of the rows applied and the rate
+        """
+        rate = self.rows / self.elapsed if self.elapsed else 0.0
+        return ("Database: {0} rows in {1} batches, {2:.3f}s, {3:.0f} rows/sec, "
+                "{4} retries, {5} failed batches".format(
+                    self.rows, self.batches, self.elapsed, rate,
+                    self.retried, len(self.failed)))
+
+    def close(self):
+        """
+        Closes the connection and logs the summary
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        logger.info(self.summary())
+        for description, apply, rows in self.failed:
+            logger.error("Not applied: database batch {0}".format(description))
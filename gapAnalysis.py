@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+This program contains the gap and cadence analysis of a device's files,
+for finding logging outages without going back over the SQL output. It
+reads the sorted start times of one device once, keeping only the last
+file and a few counters, so it costs constant memory and no pass of its
+own:
+
+- the cadence is the median step between the first WINDOW start times,
+  which a few early outages do not move;
+- a gap is a step longer than the gap factor times the cadence;
+- a duplicate is a file with the same start time as the file before it;
+- a file is out of order when its name sorts before that of the file
+  dated before it, as after a logger clock was reset. Loggers name their
+  files in the order they write them, while the order a directory lists
+  them in is arbitrary on most filesystems, so names stand in for the
+  order the files were written in.
+
+The analysis runs in the pass that stores the sorted start times of a
+device (store_stream), rather than in a pass of its own. The counts of
+each device, and its first 100 gaps, duplicates and files out of order,
+are written to [run]_[cruise]_gaps.csv.
+"""
+
+from manifestCache import from_seconds
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+GAP_FACTOR = 2.0
+
+# start time steps the cadence is the median of
+WINDOW = 64
+
+# gaps, duplicates and files out of order listed per device
+LISTED = 100
+
+CADENCE_NAMES = {60: "minutely", 600: "10 minutely", 900: "15 minutely",
+                 1800: "half hourly", 3600: "hourly", 21600: "6 hourly",
+                 43200: "12 hourly", 86400: "daily"}
+
+GAP_HEADER = "devicetype,kind,start_date,end_date,seconds,count,filename\n"
+
+
+class StreamStats(object):
+    """
+    Cadence, gaps, duplicates and files out of order of one device's start
+    times, added in sorted order with add
+
+    gap_factor: Steps longer than this many cadences are gaps
+    """
+
+    __slots__ = ('gap_factor', 'files', 'first', 'last', 'last_name',
+                 'window', 'cadence', 'gap_count', 'gap_seconds',
+                 'duplicate_count', 'out_of_order_count', 'gaps',
+                 'duplicates', 'out_of_order')
+
+    def __init__(self, gap_factor=GAP_FACTOR):
+        self.gap_factor = gap_factor
+        self.files = 0
+        self.first = self.last = self.last_name = None
+        self.window = []  # (step, start, end, filename) until cadence is set
+        self.cadence = None
+        self.gap_count = self.gap_seconds = 0
+        self.duplicate_count = self.out_of_order_count = 0
+        self.gaps = []          # (start, end, filename), the first LISTED
+        self.duplicates = []    # (start, filename)
+        self.out_of_order = []  # (start, previous start, filename)
+
+    def add(self, seconds, filename):
+        """
+        Adds the next file of the device
+
+        seconds: The start time in seconds since 1970
+        filename: The name of the file
+        """
+        self.files += 1
+        if self.last is None:
+            self.first = seconds
+        else:
+            step = seconds - self.last
+            if step == 0:
+                self.duplicate_count += 1
+                if len(self.duplicates) < LISTED:
+                    self.duplicates.append((seconds, filename))
+            elif filename < self.last_name:
+                self.out_of_order_count += 1
+                if len(self.out_of_order) < LISTED:
+                    self.out_of_order.append((seconds, self.last, filename))
+            if step > 0:
+                if self.cadence is None:
+                    self.window.append((step, self.last, seconds, filename))
+                    if len(self.window) == WINDOW:
+                        self.set_cadence()
+                else:
+                    self.check_step(step, self.last, seconds, filename)
+        self.last = seconds
+        self.last_name = filename
+
+    def set_cadence(self):
+        """
+        Sets the cadence from the steps seen so far and checks them for gaps
+        """
+        window, self.window = self.window, []
+        if not window:
+            return
+        steps = sorted(step for step, start, end, filename in window)
+        self.cadence = steps[len(steps) // 2]
+        for step, start, end, filename in window:
+            self.check_step(step, start, end, filename)
+
+    def check_step(self, step, start, end, filename):
+        if step > self.gap_factor * self.cadence:
+            self.gap_count += 1
+            self.gap_seconds += step
+            if len(self.gaps) < LISTED:
+                self.gaps.append((start, end, filename))
+
+    def finish(self):
+        """
+        Sets the cadence of a device of fewer than WINDOW steps
+        """
+        if self.cadence is None:
+            self.set_cadence()
+        return self
+
+    def cadence_name(self):
+        if self.cadence is None:
+            return ""
+        return CADENCE_NAMES.get(self.cadence, "{0}s".format(self.cadence))
+
+    def report_lines(self, device):
+        """
+        Returns the gap report lines of the device
+
+        device: The device name
+        """
+        def time(seconds):
+            return from_seconds(seconds).strftime('%Y-%m-%d %H:%M:%S')
+
+        def line(kind, start, end, seconds, count, filename=""):
+            return "{0},{1},{2},{3},{4},{5},{6}\n".format(
+                device, kind, start, end, seconds, count, filename)
+
+        if self.files == 0:
+            return []
+        lines = [
+            line("files", time(self.first), time(self.last),
+                 self.cadence or "", self.files, self.cadence_name()),
+            line("gaps", "", "", self.gap_seconds, self.gap_count),
+            line("duplicates", "", "", "", self.duplicate_count),
+            line("out_of_order", "", "", "", self.out_of_order_count)]
+        for start, end, filename in self.gaps:
+            # count is the files the cadence says are missing
+            lines.append(line("gap", time(start), time(end), end - start,
+                              (end - start) // self.cadence - 1, filename))
+        for start, filename in self.duplicates:
+            lines.append(line("duplicate", time(start), time(start), 0, 1,
+                              filename))
+        for start, previous, filename in self.out_of_order:
+            lines.append(line("out_of_order", time(start), time(previous),
+                              start - previous, 1, filename))
+        return lines
+
+
+def store_stream(seconds_pairs, file_dates, gap_factor=GAP_FACTOR):
+    """
+    Stores a device's start times and returns their StreamStats, analysed
+    in the one pass that stores them
+
+    seconds_pairs: (seconds since 1970, filename) of the device's files,
+        sorted by start time, any iterable
+    file_dates: The resultStore.FileDates they are appended to
+    gap_factor: Steps longer than this many cadences are gaps
+    """
+    stats = StreamStats(gap_factor)
+    append = file_dates.append_seconds
+    add = stats.add
+    for seconds, filename in seconds_pairs:
+        append(seconds, filename)
+        add(seconds, filename)
+    return stats.finish()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+"""
+This program contains the inventory index, a SQLite file holding the
+parsed start time of every file and the date range of every device of the
+cruises indexed so far, so questions such as "which RR devices had data in
+March 2019" are answered from the index instead of by a new date parse.
+The index is filled by parseDate.py -x, or by the update command below,
+which parses only the cruises of the shipment directory not indexed yet.
+
+./inventoryIndex.py update [cruise prefix] [-r]: run in the shipment
+    directory; indexes new cruises matching the prefix (-r: all of them)
+./inventoryIndex.py devices [ship or cruise] [start] [end]: devices with
+    files between the two dates
+./inventoryIndex.py files [cruise] [device] [start] [end]: files of one
+    device starting between the two dates
+./inventoryIndex.py summary [ship or cruise]: devices, files and date
+    range of every indexed cruise
+
+Devices of Rachel Carson scs and Blue Heron ADCP directories are indexed
+after their directory, as 01scs/gps or ADCP1/gp90. Dates are YYYY-MM-DD
+or YYYY-MM-DDTHH:MM:SS. -f [index] uses another index file than
+./dateparse_inventory.db.
+"""
+
+import os
+import sys
+import sqlite3
+import datetime
+from manifestCache import to_seconds, from_seconds
+from parseFunctions import get_ship_abbreviation, listCruises, parse_cruise
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+INVENTORY_NAME = "dateparse_inventory.db"
+
+# start times are whole seconds since 1970, so range queries compare ints.
+# Cruise IDs compare without case, as parsed results upper case OC cruises.
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS cruises (cruise TEXT COLLATE NOCASE "
+    "PRIMARY KEY, ship TEXT, indexed_at TEXT)",
+    "CREATE TABLE IF NOT EXISTS devices (cruise TEXT COLLATE NOCASE, "
+    "device TEXT, ship TEXT, start_time INTEGER, end_time INTEGER, "
+    "files INTEGER, PRIMARY KEY (cruise, device))",
+    "CREATE INDEX IF NOT EXISTS devices_ship_range "
+    "ON devices (ship, start_time, end_time)",
+    "CREATE TABLE IF NOT EXISTS files (cruise TEXT COLLATE NOCASE, "
+    "device TEXT, filename TEXT, start_time INTEGER, "
+    "PRIMARY KEY (cruise, device, filename))",
+    "CREATE INDEX IF NOT EXISTS files_range "
+    "ON files (cruise, device, start_time)",
+)
+
+
+def parse_time(value):
+    """
+    Returns seconds since 1970 of a YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS date
+    """
+    for date_format in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return to_seconds(datetime.datetime.strptime(value, date_format))
+        except ValueError:
+            pass
+    raise ValueError("Unrecognized date {0}".format(value))
+
+
+def indexed_device(result):
+    """
+    Returns the device a DeviceResult is indexed under: its device, after
+    its scs or ADCP directory when it has one, as in ADCP1/gp90, since the
+    directories of a cruise can hold devices of the same name
+    """
+    if result.device_dir is None:
+        return result.device
+    return result.device_dir + "/" + result.device
+
+
+def format_time(seconds):
+    """
+    Formats seconds since 1970 for output, None as an empty field
+    """
+    if seconds is None:
+        return ''
+    return from_seconds(seconds).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class Inventory(object):
+    """
+    The inventory index file. Results are written in one transaction per
+    cruise by add_cruise, or collected by add_result until commit.
+    """
+
+    def __init__(self, index_path=INVENTORY_NAME):
+        self.index_path = os.path.abspath(index_path)
+        self.db = sqlite3.connect(self.index_path)
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.db.commit()
+
+    def indexed_cruises(self):
+        """
+        Returns the set of cruise IDs already in the index, upper case
+        """
+        return set(row[0].upper() for row in self.db.execute(
+            "SELECT cruise FROM cruises"))
+
+    def add_result(self, result):
+        """
+        Replaces the rows of one device with a DeviceResult, keyed on its
+        indexed_device. Results whose file update SQL was streamed only
+        update the device range.
+        """
+        cruise, device = result.cruise, indexed_device(result)
+        ship = get_ship_abbreviation(cruise.upper())
+        self.db.execute("INSERT OR REPLACE INTO cruises VALUES (?, ?, ?)",
+                        (cruise, ship, datetime.datetime.now().isoformat()))
+        self.db.execute("DELETE FROM files WHERE cruise = ? AND device = ?",
+                        (cruise, device))
+        if result.file_dates is not None:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                ((cruise, device, filename, seconds)
+                 for seconds, filename in result.file_dates.seconds_pairs()))
+        start_time = end_time = None
+        if result.maxdate >= result.mindate:  # else no file was dated
+            start_time = to_seconds(result.mindate)
+            end_time = to_seconds(result.maxdate)
+        self.db.execute(
+            "INSERT OR REPLACE INTO devices VALUES (?, ?, ?, ?, ?, ?)",
+            (cruise, device, ship, start_time, end_time, result.match_count))
+
+    def add_cruise(self, cruise, results):
+        """
+        Replaces every row of a cruise with its DeviceResults and commits
+
+        cruise: The cruise ID
+        results: The DeviceResults of every device of the cruise
+        """
+        self.db.execute("DELETE FROM files WHERE cruise = ?", (cruise,))
+        self.db.execute("DELETE FROM devices WHERE cruise = ?", (cruise,))
+        self.db.execute("INSERT OR REPLACE INTO cruises VALUES (?, ?, ?)",
+                        (cruise, get_ship_abbreviation(cruise.upper()),
+                         datetime.datetime.now().isoformat()))
+        for result in results:
+            self.add_result(result)
+        self.db.commit()
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def _scope(self, scope):
+        """
+        Returns the WHERE clause and parameters selecting a ship prefix, a
+        cruise ID, or everything when scope is empty
+        """
+        if not scope:
+            return "1 = 1", ()
+        if scope.upper() == get_ship_abbreviation(scope.upper()):
+            return "ship = ?", (scope.upper(),)
+        return "cruise = ?", (scope,)
+
+    def devices(self, scope, start, end):
+        """
+        Returns (cruise, device, start, end, files) rows of the devices
+        with files between start and end, in seconds since 1970
+        """
+        where, params = self._scope(scope)
+        return self.db.execute(
+            "SELECT cruise, device, start_time, end_time, files FROM devices "
+            "WHERE " + where + " AND start_time <= ? AND end_time >= ? "
+            "ORDER BY cruise, device", params + (end, start)).fetchall()
+
+    def files(self, cruise, device, start, end):
+        """
+        Returns (filename, start) rows of the files of a device starting
+        between start and end, in seconds since 1970
+        """
+        return self.db.execute(
+            "SELECT filename, start_time FROM files WHERE cruise = ? "
+            "AND device = ? AND start_time BETWEEN ? AND ? "
+            "ORDER BY start_time", (cruise, device, start, end)).fetchall()
+
+    def summary(self, scope):
+        """
+        Returns (cruise, devices, files, start, end) rows per cruise
+        """
+        where, params = self._scope(scope)
+        return self.db.execute(
+            "SELECT cruise, COUNT(*), SUM(files), MIN(start_time), "
+            "MAX(end_time) FROM devices WHERE " + where +
+            " GROUP BY cruise ORDER BY cruise", params).fetchall()
+
+
+def update(inventory, cruise_prefix, shipment_path, reindex=False):
+    """
+    Parses and indexes the cruises of the shipment directory matching a
+    prefix, skipping the ones already indexed unless reindex is set.
+    Returns the cruises indexed.
+
+    inventory: The Inventory to update
+    cruise_prefix: The ship prefix, as given to parseDate.py -a
+    shipment_path: The shipment directory
+    reindex: True to parse every matching cruise again
+    """
+    indexed = set() if reindex else inventory.indexed_cruises()
+    added = []
+    for cruise in listCruises(cruise_prefix, shipment_path):
+        if cruise.upper() in indexed:
+            continue
+        inventory.add_cruise(cruise, parse_cruise(cruise, shipment_path))
+        added.append(cruise)
+    return added
+
+
+def main(argv):
+    """
+    Runs inventoryIndex.py with the given command line arguments
+
+    argv: The arguments, as in sys.argv
+    """
+    if len(argv) < 2 or argv[1] == '-h':
+        print(__doc__)
+        return
+    index_path = INVENTORY_NAME
+    reindex = False
+    args = []
+    i = 2
+    while i < len(argv):
+        if argv[i] == "-f":
+            index_path = argv[i+1]
+            i += 1
+        elif argv[i] == "-r":
+            reindex = True
+        else:
+            args.append(argv[i])
+        i += 1
+
+    command = argv[1]
+    inventory = Inventory(index_path)
+    try:
+        if command == "update":
+            added = update(inventory, args[0], os.getcwd() + "/", reindex)
+            print("Indexed {0} cruises: {1}".format(len(added),
+                                                    " ".join(added)))
+        elif command == "devices":
+            rows = inventory.devices(args[0], parse_time(args[1]),
+                                     parse_time(args[2]))
+            print("cruise,devicetype,start_date,end_date,files")
+            for cruise, device, start, end, files in rows:
+                print("{0},{1},{2},{3},{4}".format(
+                    cruise, device, format_time(start), format_time(end),
+                    files))
+        elif command == "files":
+            rows = inventory.files(args[0], args[1], parse_time(args[2]),
+                                   parse_time(args[3]))
+            print("filename,start_date")
+            for filename, start in rows:
+                print("{0},{1}".format(filename, format_time(start)))
+        elif command == "summary":
+            rows = inventory.summary(args[0] if args else "")
+            print("cruise,devices,files,start_date,end_date")
+            for cruise, devices, files, start, end in rows:
+                print("{0},{1},{2},{3},{4}".format(
+                    cruise, devices, files, format_time(start),
+                    format_time(end)))
+        else:
+            print(__doc__)
+    finally:
+        inventory.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
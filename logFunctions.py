@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+This program contains the logging used by the date parsers. Messages go to
+one timestamped log file in the configured log directory, opened by
+absolute path once per run, so nothing needs to change the working
+directory to log. Per-device run metrics (files scanned and matched, parse
+failures, elapsed time) are written beside it as JSON lines.
+"""
+
+import os
+import json
+import logging
+import datetime
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+# messages about the parse, e.g. empty directories and unknown regexes
+logger = logging.getLogger("dateparse")
+logger.addHandler(logging.NullHandler())
+
+# one JSON object per parsed device
+metrics_logger = logging.getLogger("dateparse.metrics")
+metrics_logger.propagate = False
+
+_configured = False
+
+# (log_dir, run_stamp) of the run's log files once set up, for worker
+# processes to open the same files
+log_settings = None
+
+
+def setup_logging(log_dir, run_stamp=None):
+    """
+    Adds the run's log file handlers. Does nothing if they are already set
+    up, so it is safe to call from every entry point.
+
+    log_dir: The directory log files are written to
+    run_stamp: Timestamp used in the log file names, defaults to now
+    """
+    global _configured, log_settings
+    if _configured:
+        return
+    _configured = True
+    if run_stamp is None:
+        run_stamp = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S_')
+    log_dir = os.path.abspath(log_dir)
+    log_settings = (log_dir, run_stamp)
+
+    handler = logging.FileHandler(
+        os.path.join(log_dir, run_stamp + 'parseFunctions.py'))
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+    metrics_handler = logging.FileHandler(
+        os.path.join(log_dir, run_stamp + 'metrics.jsonl'))
+    metrics_handler.setFormatter(logging.Formatter('%(message)s'))
+    metrics_logger.addHandler(metrics_handler)
+    metrics_logger.setLevel(logging.INFO)
+
+
+def log_metrics(cruise, device, files_scanned, files_matched, elapsed,
+                **extra):
+    """
+    Writes the metrics of one parsed device as a JSON line
+
+    cruise: The cruise ID
+    device: The device
+    files_scanned: Files listed in the device directory
+    files_matched: Files a start date was parsed for
+    elapsed: Seconds spent listing and parsing
+    extra: Any further fields to include, e.g. ship
+    """
+    if not metrics_logger.isEnabledFor(logging.INFO):
+        return
+    record = {
+        "time": datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f'),
+        "cruise": cruise,
+        "device": device,
+        "files_scanned": files_scanned,
+        "files_matched": files_matched,
+        "parse_failures": files_scanned - files_matched,
+        "elapsed": round(elapsed, 6),
+    }
+    record.update(extra)
+    metrics_logger.info(json.dumps(record, sort_keys=True))
+
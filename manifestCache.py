@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+This program contains the manifest used for incremental date parses. The
+manifest is a JSON file kept next to the SQL/CSV output that remembers, for
+every device directory parsed, the directory mtime and the parsed start
+date of every file in it. A directory whose mtime has not changed is not
+listed again, and in a changed directory only new files are parsed.
+"""
+
+import os
+import json
+import datetime
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+MANIFEST_NAME = "dateparse_manifest.json"
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def to_seconds(filedate):
+    """
+    Returns a naive datetime as whole seconds since 1970
+    """
+    delta = filedate - EPOCH
+    return delta.days * 86400 + delta.seconds
+
+
+def from_seconds(seconds):
+    """
+    Returns the naive datetime of whole seconds since 1970
+    """
+    return EPOCH + datetime.timedelta(seconds=seconds)
+
+
+class Manifest(object):
+    """
+    Cached directory listings and parsed start dates, keyed by the
+    absolute directory path. Each entry holds the directory mtime, a key
+    naming the filename regex and parser used, and a map of every matched
+    filename to its start date in seconds since 1970 (None if the name
+    could not be parsed).
+    """
+
+    def __init__(self, manifest_path=MANIFEST_NAME):
+        self.manifest_path = os.path.abspath(manifest_path)
+        self.entries = {}
+        if os.path.isfile(self.manifest_path):
+            f = open(self.manifest_path)
+            try:
+                self.entries = json.load(f)
+            finally:
+                f.close()
+            if bytes is str:  # Python 2 reads the filenames back as unicode
+                for entry in self.entries.values():
+                    entry["files"] = dict(
+                        (filename.encode('utf-8'), seconds)
+                        for filename, seconds in entry["files"].items())
+
+    def get(self, path, key):
+        """
+        Returns the cached entry of a directory, or None if there is none
+        or it was made with a different regex or parser
+
+        path: The directory
+        key: The regex/parser key the entry must have been made with
+        """
+        entry = self.entries.get(os.path.abspath(path))
+        if entry is None or entry["key"] != key:
+            return None
+        return entry
+
+    def update(self, path, entry):
+        """
+        Stores the entry of a directory
+
+        path: The directory
+        entry: The entry from make_entry
+        """
+        self.entries[os.path.abspath(path)] = entry
+
+    def save(self):
+        """
+        Writes the manifest, replacing the old file only once the new one
+        is complete
+        """
+        tmp_path = self.manifest_path + ".tmp"
+        f = open(tmp_path, "w")
+        try:
+            json.dump(self.entries, f, separators=(',', ':'), sort_keys=True)
+        finally:
+            f.close()
+        if os.name == 'nt' and os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        os.rename(tmp_path, self.manifest_path)
+
+
+def make_entry(key, mtime, files):
+    """
+    Returns a manifest entry
+
+    key: The regex/parser key of the entry
+    mtime: The directory mtime the listing was taken at
+    files: Map of filename to start date in seconds, or None
+    """
+    return {"key": key, "mtime": mtime, "files": files}
+
+
+def entry_key(regex, parser):
+    """
+    Returns the key that ties an entry to the regex and parser it used
+
+    regex: The compiled filename regex, or None
+    parser: The FilenameParser
+    """
+    pattern = regex.pattern if regex is not None else ""
+    return parser.name + " " + pattern
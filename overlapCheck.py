@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""
+This program contains the cross-cruise overlap check of a run. Files are
+sometimes delivered with more than one cruise, around port calls or when
+data is delivered again, and the device date ranges of those cruises then
+overlap. With parseDate.py -u, every result of the run is held until the
+end, then:
+
+- the date ranges of each ship's devices are sorted by start and swept
+  once, which finds every pair of cruises whose ranges of the same device
+  overlap in O(n log n) plus the number of overlaps, instead of comparing
+  every pair of cruises;
+- a file delivered twice has the same name and start time in both
+  cruises, so it can only be in an overlapping pair. The start times of
+  the two devices are both sorted, so one merge of the two finds the
+  files they share.
+
+Overlaps are written to [run]_overlaps.csv and files delivered before
+to [run]_duplicates.csv. The file update SQL of a file delivered before
+is not written again for the later cruise. Date ranges are not changed,
+as the later cruise did hold the file.
+"""
+
+import heapq
+import parseFunctions
+from parseFunctions import get_ship_abbreviation, format_file_time, say
+from resultStore import FileDates
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+OVERLAPS_HEADER = ("devicetype,cruise,other_cruise,start_date,end_date,"
+                   "duplicate_files\n")
+DUPLICATES_HEADER = "devicetype,cruise,first_cruise,start_date,filename\n"
+
+
+def sweep_overlaps(intervals):
+    """
+    Returns (i, j, start, end) for every pair of intervals that overlap,
+    with i before j in the list, by one sweep in start order
+
+    intervals: (start, end) pairs
+    """
+    order = sorted(range(len(intervals)), key=lambda i: intervals[i])
+    active = []  # (end, index) heap of the intervals started so far
+    overlaps = []
+    for j in order:
+        start, end = intervals[j]
+        while active and active[0][0] < start:
+            heapq.heappop(active)  # ended before this one starts
+        for other_end, i in active:
+            overlaps.append((min(i, j), max(i, j), start, min(end, other_end)))
+        heapq.heappush(active, (end, j))
+    return overlaps
+
+
+def shared_files(first, second):
+    """
+    Returns the positions in second of the files that are also in first,
+    by one merge of the two sorted stores
+
+    first, second: FileDates sorted by start time and filename
+    """
+    shared = []
+    firsts = first.seconds_pairs()
+    current = next(firsts, None)
+    for position, pair in enumerate(second.seconds_pairs()):
+        while current is not None and current < pair:
+            current = next(firsts, None)
+        if current is None:
+            break
+        if current == pair:
+            shared.append(position)
+    return shared
+
+
+class OverlapCheck(object):
+    """
+    The results of a run, held until finish checks them for overlaps
+    """
+
+    def __init__(self):
+        self.results = []  # (DeviceResult, csvlog, datelog, filelog)
+
+    def add(self, result, csvlog, datelog, filelog):
+        """
+        Holds a result and the write_result arguments it came with
+        """
+        self.results.append((result, csvlog, datelog, filelog))
+
+    def overlaps(self):
+        """
+        Returns (i, j, start, end) for every pair of results, in run order,
+        of different cruises and the same ship and device whose date ranges
+        overlap
+        """
+        groups = {}
+        for index, entry in enumerate(self.results):
+            result = entry[0]
+            if result.file_dates is None or result.maxdate < result.mindate:
+                continue  # streamed or nothing dated
+            key = (get_ship_abbreviation(result.cruise.upper()), result.device)
+            groups.setdefault(key, []).append(index)
+        overlaps = []
+        for key in sorted(groups):
+            indexes = groups[key]
+            intervals = [(self.results[index][0].mindate,
+                          self.results[index][0].maxdate)
+                         for index in indexes]
+            for i, j, start, end in sweep_overlaps(intervals):
+                i, j = indexes[i], indexes[j]
+                if self.results[i][0].cruise != self.results[j][0].cruise:
+                    overlaps.append((i, j, start, end))
+        overlaps.sort()
+        return overlaps
+
+    def finish(self, write):
+        """
+        Writes the reports, then every held result through write, with the
+        files delivered in an earlier cruise left out of its file updates
+
+        write: write_result, called as write(result, csvlog, datelog, filelog)
+        """
+        overlaps = self.overlaps()
+        # result index: {position of a file delivered before: first cruise}
+        delivered = {}
+        overlap_rows = []
+        for i, j, start, end in overlaps:
+            earlier, later = self.results[i][0], self.results[j][0]
+            positions = shared_files(earlier.file_dates, later.file_dates)
+            firsts = delivered.setdefault(j, {})
+            for position in positions:
+                firsts.setdefault(position, earlier.cruise)
+            overlap_rows.append("{0},{1},{2},{3},{4},{5}\n".format(
+                later.device, later.cruise, earlier.cruise,
+                format_file_time(start), format_file_time(end),
+                len(positions)))
+
+        if parseFunctions.isoDate is None:
+            parseFunctions.begin_run()
+        duplicate_count = 0
+        f = open("./{0}_duplicates.csv".format(parseFunctions.isoDate), "w")
+        try:
+            f.write(DUPLICATES_HEADER)
+            for index in sorted(delivered):
+                result = self.results[index][0]
+                firsts = delivered[index]
+                for position, (filedate, filename) in enumerate(
+                        result.file_dates):
+                    if position in firsts:
+                        f.write("{0},{1},{2},{3},{4}\n".format(
+                            result.device, result.cruise, firsts[position],
+                            format_file_time(filedate), filename))
+                duplicate_count += len(firsts)
+        finally:
+            f.close()
+        f = open("./{0}_overlaps.csv".format(parseFunctions.isoDate), "w")
+        try:
+            f.write(OVERLAPS_HEADER)
+            f.writelines(overlap_rows)
+        finally:
+            f.close()
+        say("{0} overlapping device ranges, {1} files delivered before".format(
+            len(overlaps), duplicate_count))
+
+        results, self.results = self.results, []
+        for index, (result, csvlog, datelog, filelog) in enumerate(results):
+            if delivered.get(index):
+                remove_files(result, delivered[index])
+            write(result, csvlog, datelog, filelog)
+
+
+def remove_files(result, positions):
+    """
+    Leaves files out of the file updates of a result
+
+    result: The DeviceResult
+    positions: The positions in result.file_dates of the files to leave out
+    """
+    result.file_dates = FileDates(
+        pair for position, pair in enumerate(result.file_dates)
+        if position not in positions)
+    if result.file_ends is not None:
+        result.file_ends = [enddate for position, enddate
+                            in enumerate(result.file_ends)
+                            if position not in positions]
@@ -9,8 +9,21 @@ to a file. The default option is to do all three.
 
 import sys
 import os
-from parseFunctions import dateparser, cruiseDateParse, listCruises, RC_dateparser, BH_dateparser
-from config import dateparser_by_cruise
+import parseFunctions
+from parseFunctions import listCruises, get_ship_abbreviation
+from runFunctions import run_units, finish_run
+from runJournal import RunJournal, JOURNAL_NAME
+from manifestCache import Manifest, MANIFEST_NAME
+from dbSink import DatabaseSink, connect_spec
+from inventoryIndex import Inventory
+from rangeAggregator import RangeAggregator, load_pyarrow
+from parserRegistry import load_numpy
+from tarScan import mount_archives
+from overlapCheck import OverlapCheck
+from stageProfile import StageProfile
+from shardRun import (ShardOutput, parse_shard, shard_name, shard_args,
+                      merge_shards)
+from shipProfiles import has_profile, ship_profile
 
 __author__ = "David Dempsey"
 __copyright__ = "Copyright 2020, Rolling Deck to Repository"
@@ -22,83 +35,297 @@ __maintainer__ = "David Dempsey"
 __email__ = "ddempsey@ucsd.edu"
 __status__ = "Development"
 
-if (len(sys.argv) == 1 or sys.argv[1] == '-h'):
+
+def usage():
+    """
+    Prints the command line arguments
+    """
     print("\nArguments for parseDate.py:\n ")
     print("./parseDate.py [cruise] [filepattern] [any flags]")
     print("DEFAULT: prints SQL, min/max date range, and write log file")
     print("-m: writes date range update SQL to log file")
     print("-l: writes file update SQL to log file")
     print("-d: writes date ranges to csv file")
+    print("-g [file]: also writes the date ranges of the whole run to one CSV,")
+    print("    or to Parquet if [file] ends in .parquet (needs pyarrow)")
     print("-a: runs on all cruises matching given cruise prefix")
     print("-c: runs all devices")
+    print("-t: reads cruises from their tar archives ([cruise].tar, .tar.gz,")
+    print("    .tgz, ...) in the shipment directory instead of extracted")
+    print("    directories, without extracting them")
     print("-o [new path]: overrides default cruise path structure")
+    print("-j [workers]: parses cruises and devices in parallel worker processes")
+    print("-n [listings]: lists directories with the asyncio scanner, keeping")
+    print("    up to [listings] listings in flight, for shipment directories on")
+    print("    network storage (needs Python 3, used instead of -j)")
+    print("-f: dates files whose names hold no date from the first NMEA RMC/ZDA")
+    print("    or instrument timestamp in their first 8 KB")
+    print("-e: also writes each file's end time, the start of the next file")
+    print("    of its device, or the last timestamp in the tail of the last file")
+    print("    and of files -f dated from their content")
+    print("-G [factor]: writes the cadence of each device, gaps between files")
+    print("    longer than [factor] times it, and duplicate or out of order start")
+    print("    times to ./[run]_[cruise]_gaps.csv")
+    print("-b: parses each directory in one NumPy batch (needs numpy)")
+    print("-i: incremental run, reuses directory listings and dates cached in")
+    print("    ./dateparse_manifest.json and parses only new files")
+    print("-w [order]: streams file update SQL to disk while parsing (with -l)")
+    print("    date: sorted by start time, as without -w")
+    print("    filename: sorted by filename")
+    print("    none: left in directory order, nothing is held in memory")
+    print("-s [mode]: file update SQL written with -l")
+    print("    line: one UPDATE per file (default)")
+    print("    values: staging table loaded with multi-row INSERTs, one UPDATE")
+    print("    copy: staging CSV loaded with psql \\copy, one UPDATE")
+    print("-D [database]: applies the -l and -m updates to the database")
+    print("    instead of writing .sql files. [database] is module:dsn for any")
+    print("    DB-API driver (psycopg2:dbname=rvdata) or an SQLite file path")
+    print("-u: holds the results until the end of the run and reports device")
+    print("    ranges overlapping across cruises and files delivered with more")
+    print("    than one cruise; the file update SQL of a file is written for the")
+    print("    first cruise only")
+    print("--resume: keeps the journal ./dateparse_journal.jsonl of the run,")
+    print("    and carries on the run of that journal that stopped part way,")
+    print("    skipping the devices it records as finished. Devices that fail")
+    print("    to parse are set aside in it instead of stopping the run. With")
+    print("    -u every device is parsed again, for the overlap check")
+    print("--shard [i/N]: parses only the devices in shard i of N, picked by a")
+    print("    hash of cruise and device, and writes their dates to the partial")
+    print("    ./dateparse_shard_[i]of[N].jsonl instead of the SQL and CSVs.")
+    print("    Run every shard with the same other arguments, then:")
+    print("./parseDate.py --merge [partials]: writes the SQL and CSVs of all")
+    print("    the shards of a run, as one run with their arguments would")
+    print("--profile: times the listing, filtering, parsing, sorting, SQL")
+    print("    building and writing of every device, written per device and")
+    print("    cruise to ./[run]_profile.csv and as collapsed stacks for")
+    print("    flamegraphs to ./[run]_profile.folded")
+    print("--pstats [file]: --profile, and also dumps a cProfile of the run to")
+    print("    [file] for pstats")
+    print("-x: also indexes every device parsed in ./dateparse_inventory.db,")
+    print("    queried with inventoryIndex.py")
     print("-p [dateparser]: used to clarify date parser to use")
     print("    1: [year][month][day][second] format")
     print("    2: [year][month][day]-[second] format")
     print("    3: [ship prefix][year]_[day ? out of 365]_[second]")
-    quit()
-
-
-filepattern = sys.argv[2]
-cruise_arg = sys.argv[1]
-path = os.getcwd() + "/" #must be called in shipment directory
-printsql = False
-datelog = False
-filelog = False
-csvlog = False
-all_devices = False
-dateparser_override = False
-all_cruises = False
-dateparse_method = ""
-SI_path = ""
-
-
-def get_ship_abbreviation(cruise):
-    ship_abbreviation = ''
-    for char in cruise:
-        if not char.isdigit():
-            ship_abbreviation = ship_abbreviation + char
-        else:
-            break
-    return ship_abbreviation
-
-
-for i in range(2, len(sys.argv)):
-    flag = sys.argv[i]
-    if flag == "-d":
-        csvlog = True
-    if flag == "-m":
-        datelog = True
-    if flag == "-l":
-        filelog = True
-    if flag == "-c":
-        all_devices = True
-    if flag == "-o":
-        SI_path = sys.argv[i+1]
-    if flag == "-p":
-        dateparser_override = True
-        dateparse_method = sys.argv[i+1]
-    if flag == "-a":
-        all_cruises = True
-
-
-cruise_list = []
-if all_cruises:
-    cruise_list = listCruises(cruise_arg,path)
-else:
-    cruise_list = [cruise_arg]
-
-for cruise in cruise_list:
-    cruise_prefix = get_ship_abbreviation(cruise.upper())
-    if not dateparser_override:
-        dateparse_method = dateparser_by_cruise[cruise_prefix]
-    if dateparse_method == '1':
-        if all_devices:
-            cruiseDateParse(cruise, path, csvlog, datelog, filelog, SI_path)
-        else:
-            dateparser(cruise, path, filepattern, csvlog, datelog, filelog, SI_path)
-    if dateparse_method == '2':
-        RC_dateparser(cruise, path, csvlog, datelog, filelog)
-    if dateparse_method == '3':
-        BH_dateparser(cruise, path, csvlog, datelog, filelog)
 
+
+def main(argv):
+    """
+    Runs parseDate.py with the given command line arguments
+
+    argv: The arguments, as in sys.argv
+    """
+    if (len(argv) == 1 or argv[1] == '-h'):
+        usage()
+        return
+
+    merge_paths = None
+    if argv[1] == "--merge":
+        # the run is the one the shards were, with results read from them
+        merge_paths = argv[2:]
+        try:
+            argv = [argv[0]] + shard_args(merge_paths)
+        except ValueError as e:
+            print(e)
+            return
+
+    filepattern = argv[2]
+    cruise_arg = argv[1]
+    path = os.getcwd() + "/" #must be called in shipment directory
+    datelog = False
+    filelog = False
+    csvlog = False
+    all_devices = False
+    dateparser_override = False
+    all_cruises = False
+    dateparse_method = ""
+    SI_path = ""
+    jobs = 1
+    listings = 0
+    combined_path = None
+    archives = False
+    resume = False
+    shard = shards = None
+    run_args = []  # the arguments that describe the run's output
+    incremental = False
+    overlaps = False
+    index = False
+    database = None
+    profile = False
+    stats_path = None
+
+    for i in range(1, len(argv)):
+        if argv[i] != "--resume" and argv[i] != "--shard" and \
+                argv[i - 1] != "--shard":
+            run_args.append(argv[i])
+    for i in range(2, len(argv)):
+        flag = argv[i]
+        if flag == "--shard":
+            try:
+                shard, shards = parse_shard(argv[i+1])
+            except ValueError as e:
+                print(e)
+                return
+        if flag == "--profile":
+            profile = True
+        if flag == "--pstats":
+            profile = True
+            stats_path = argv[i+1]
+        if flag == "-d":
+            csvlog = True
+        if flag == "-m":
+            datelog = True
+        if flag == "-l":
+            filelog = True
+        if flag == "-c":
+            all_devices = True
+        if flag == "-t":
+            archives = True
+        if flag == "--resume":
+            resume = True
+        if flag == "-o":
+            SI_path = argv[i+1]
+        if flag == "-p":
+            dateparser_override = True
+            dateparse_method = argv[i+1]
+        if flag == "-a":
+            all_cruises = True
+        if flag == "-j":
+            jobs = int(argv[i+1])
+        if flag == "-g":
+            combined_path = argv[i+1]
+        if flag == "-n":
+            listings = int(argv[i+1])
+        if flag == "-f":
+            parseFunctions.content_fallback = True
+        if flag == "-e":
+            parseFunctions.end_times = True
+        if flag == "-G":
+            parseFunctions.gap_factor = float(argv[i+1])
+        if flag == "-b":
+            parseFunctions.batch_parse = True
+        if flag == "-s":
+            parseFunctions.sql_mode = argv[i+1]
+        if flag == "-i":
+            incremental = True
+        if flag == "-w":
+            parseFunctions.stream_order = argv[i+1]
+        if flag == "-u":
+            overlaps = True
+        if flag == "-x":
+            index = True
+        if flag == "-D":
+            database = argv[i+1]
+
+    # checked now rather than when the file is written, after the parse
+    if combined_path is not None and combined_path.endswith(".parquet") \
+            and load_pyarrow() is None:
+        print("-g {0} needs pyarrow".format(combined_path))
+        return
+    if parseFunctions.batch_parse and load_numpy() is None:
+        print("-b needs numpy")
+        return
+
+    # a shard only parses, and writes its results to its partial; the
+    # merge writes them out, and never parses
+    if shard is None:
+        if overlaps:
+            parseFunctions.overlap_check = OverlapCheck()
+        if index:
+            parseFunctions.inventory = Inventory()
+        if database is not None:
+            connect, paramstyle = connect_spec(database)
+            try:
+                parseFunctions.db_sink = DatabaseSink(connect, paramstyle)
+            except ValueError as e:
+                print(e)
+                return
+    if incremental and merge_paths is None:
+        # each shard keeps the manifest of its own devices
+        parseFunctions.manifest = Manifest(
+            MANIFEST_NAME if shard is None
+            else shard_name(MANIFEST_NAME, shard, shards))
+
+    # the database sink, end times, gap report, overlap check and shards
+    # need each device's dates, not a streamed file
+    if (not filelog or parseFunctions.db_sink is not None
+            or parseFunctions.end_times
+            or parseFunctions.gap_factor is not None
+            or parseFunctions.overlap_check is not None
+            or shard is not None):
+        parseFunctions.stream_order = None
+
+    if profile:
+        parseFunctions.stage_profile = StageProfile(stats_path)
+
+    parseFunctions.verbose = True
+    if merge_paths is not None:
+        parseFunctions.begin_run()
+        parseFunctions.range_aggregator = RangeAggregator(combined_path)
+        try:
+            merge_shards(merge_paths, csvlog, datelog, filelog)
+        finally:
+            finish_run()
+        return
+
+    journal = None
+    if resume:
+        try:
+            journal = RunJournal(
+                [arg for arg in argv[1:] if arg != "--resume"], resume,
+                JOURNAL_NAME if shard is None
+                else shard_name(JOURNAL_NAME, shard, shards))
+        except ValueError as e:
+            print(e)
+            return
+        # held results are only written at the end of the run
+        journal.hold = parseFunctions.overlap_check is not None
+    parseFunctions.journal = journal
+
+    parseFunctions.begin_run()
+    if shard is None:
+        parseFunctions.range_aggregator = RangeAggregator(combined_path)
+
+    cruise_list = []
+    if archives:
+        cruise_list = mount_archives(cruise_arg, path, not all_cruises)
+    elif all_cruises:
+        cruise_list = listCruises(cruise_arg,path)
+    else:
+        cruise_list = [cruise_arg]
+
+    cruise_args = []
+    for cruise in cruise_list:
+        cruise_prefix = get_ship_abbreviation(cruise.upper())
+        if not dateparser_override:
+            if not has_profile(cruise_prefix):
+                error = "No ship profile for {0}".format(cruise_prefix)
+                print(error + ", cruise {0} set aside".format(cruise))
+                if journal is not None:
+                    journal.fail_unit(("", cruise, path, "*", SI_path), error)
+                continue
+            dateparse_method = ship_profile(cruise_prefix).dateparse_method
+        cruise_args.append((cruise, path, filepattern, dateparse_method,
+                            all_devices, SI_path))
+
+    if shard is not None:
+        parseFunctions.shard_output = ShardOutput(
+            shard, shards, run_args, [args[0] for args in cruise_args],
+            resume, journal.finished_keys if journal is not None else ())
+
+    if listings:
+        try:
+            from asyncScan import run_units_async
+        except (ImportError, SyntaxError):
+            print("-n needs Python 3")
+            return
+        run_units_async(cruise_args, csvlog, datelog, filelog, listings)
+    else:
+        run_units(cruise_args, csvlog, datelog, filelog, jobs)
+    if parseFunctions.shard_output is not None:
+        # only a shard that got this far is complete
+        parseFunctions.shard_output.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
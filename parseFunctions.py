@@ -8,13 +8,30 @@ Sikuliaq, and Healy are supported.
 """
 
 import sys
-import re
 import os
-from os import listdir
-from os.path import isfile, join
 from config import *
+from scanFunctions import (scan_files, scan_dirs, list_entries, path_mtime,
+                           mounted)
+from logFunctions import logger, setup_logging, log_metrics
+from parserRegistry import load_numpy
+from shipProfiles import cruise_profile, ship_profile, get_ship_abbreviation
+from manifestCache import entry_key, make_entry, from_seconds
+from rangeAggregator import append_csv, csv_line
+from contentDates import content_dates, content_ends
+from resultStore import FileDates, seconds_pairs
+from gapAnalysis import store_stream, GAP_HEADER
+from stageProfile import (clock, add_stage, split_parse, begin_unit,
+                          end_unit)
 import datetime
-import logging
+import heapq
+import itertools
+import shutil
+import tempfile
+import time
+try:
+    from itertools import izip as zip
+except ImportError:  # Python 3 zip is already lazy
+    pass
 
 __author__ = "David Dempsey"
 __copyright__ = "Copyright 2019, Rolling Deck to Repository"
@@ -26,16 +43,149 @@ __maintainer__ = "David Dempsey"
 __email__ = "ddempsey@ucsd.edu"
 __status__ = "Production"
 
-script_dir = os.getcwd()
-os.chdir(log_dir)  # creates log file
-logging.basicConfig(format='%(asctime)s %(message)s', filename='%s' %
-                    (datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S_') +
-                        'parseFunctions.py'),
-                    level=logging.INFO)
-logging.info('parseFunctions.py executed')
-os.chdir(script_dir)
+# timestamp naming the dateranges CSVs of a run, set by begin_run
+isoDate = None
 
-isoDate = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f%z')
+# print progress to the console, as parseDate.py does
+verbose = False
+
+# parse each directory's filenames as NumPy arrays when NumPy is installed
+batch_parse = False
+
+# file start time SQL written by log(): "line", "values" or "copy"
+sql_mode = "line"
+
+# manifestCache.Manifest of an incremental run, None to list everything
+manifest = None
+
+# order file update SQL is streamed to disk in while parsing: "date",
+# "filename" or "none"; None holds each device in memory until it is done
+stream_order = None
+
+# rows a streamed, sorted SQL file holds in memory before spilling to disk
+sql_memory_rows = 100000
+
+# dbSink.DatabaseSink the updates are applied to instead of .sql files
+db_sink = None
+
+# inventoryIndex.Inventory every result is also indexed in, if any
+inventory = None
+
+# date files whose names hold no date from timestamps in their first and
+# last few KB (contentDates)
+content_fallback = False
+
+# also work out each file's end time, from the start of the next file of
+# its device or, for the last file, the timestamps in its tail
+end_times = False
+
+# report gaps between files longer than this many times the cadence of
+# their device, with duplicate and out of order start times (gapAnalysis);
+# None for no gap report
+gap_factor = None
+
+# overlapCheck.OverlapCheck holding the results of a run until its end, to
+# check them for files delivered with more than one cruise
+overlap_check = None
+
+# runJournal.RunJournal recording the units written, to resume the run
+journal = None
+
+# stageProfile.StageProfile timing the stages of every device, if any
+stage_profile = None
+
+# shardRun.ShardOutput of a --shard run, which parses only the units of its
+# shard and writes their results to its partial instead of the logs
+shard_output = None
+
+# rangeAggregator.RangeAggregator collecting the dateranges CSVs of a run,
+# None to write each range as it comes
+range_aggregator = None
+
+# the settings above that parse_unit reads, which runFunctions hands to
+# worker processes started fresh instead of forked
+WORKER_SETTINGS = ("isoDate", "verbose", "batch_parse", "sql_mode",
+                   "manifest", "stream_order", "sql_memory_rows",
+                   "content_fallback", "end_times", "gap_factor")
+
+
+def begin_run(log_directory=None):
+    """
+    Sets up what a run writes besides its results: the log files and the
+    timestamp naming the dateranges CSVs. Nothing is set up on import, so
+    library callers that only use parse_cruise never touch the disk.
+
+    log_directory: Where log files go, defaults to log_dir from config
+    """
+    global isoDate
+    setup_logging(log_directory or log_dir)
+    logger.info('parseFunctions.py executed')
+    isoDate = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f%z')
+
+
+def parse_cruise(cruise, root, devices=None, SI_path="", dateparse_method=None,
+                 content_fallback=False, end_times=False, batch_parse=False,
+                 gap_factor=None):
+    """
+    Parses a cruise and returns its results without writing anything. Each
+    DeviceResult holds the device's (start date, filename) pairs in
+    file_dates and its range in mindate/maxdate. The settings a run has
+    made in this module are not used: the parse has the settings given
+    here, with no streamed SQL, run manifest or profile, and the run's
+    settings are put back afterwards.
+
+    cruise: The cruise ID
+    root: The shipment directory holding the cruise
+    devices: Devices to parse (instrument, scs or ADCP directory names),
+        None for all of them
+    SI_path: Overrides the default instrument path of the ship
+    dateparse_method: '1', '2' or '3' as in parseDate.py -p, defaults to
+        the layout of the ship's profile
+    content_fallback: True to date files whose names hold no date from
+        their content, as parseDate.py -f
+    end_times: True to work out the end time of each file, as -e
+    batch_parse: True to parse the dates of a directory with numpy, as -b
+    gap_factor: The gap factor of the gap report, as -G, or None for none
+    """
+    settings = {"stream_order": None, "manifest": None,
+                "stage_profile": None, "content_fallback": content_fallback,
+                "end_times": end_times, "batch_parse": batch_parse,
+                "gap_factor": gap_factor}
+    module = globals()
+    run_settings = dict((name, module[name]) for name in settings)
+    module.update(settings)
+    try:
+        if dateparse_method is None:
+            dateparse_method = cruise_profile(cruise).dateparse_method
+        if not root.endswith('/'):
+            root = root + '/'
+        if devices is not None and dateparse_method == '1':
+            units = []
+            for device in devices:
+                units.extend(list_units(cruise, root, device,
+                                        dateparse_method, False, SI_path))
+        else:
+            units = list_units(cruise, root, '', dateparse_method, True,
+                               SI_path)
+            if devices is not None:
+                units = [unit for unit in units if unit[3] in devices]
+
+        results = []
+        for unit in units:
+            results.extend(parse_unit(unit))
+        return results
+    finally:
+        module.update(run_settings)
+
+
+def say(message):
+    """
+    Prints a progress message to the console when verbose is set
+
+    message: The message
+    """
+    if verbose:
+        print(message)
 
 
 def dateparser(cruise, shipment_path, filepattern, csvlog, datelog, filelog, SI_path=""):
@@ -50,125 +200,363 @@ def dateparser(cruise, shipment_path, filepattern, csvlog, datelog, filelog, SI_
     datelog: True if creating SQL log of min/max cruise range, false otherwise
     filelog: True if logging file update SQL to files, false otherwise
     """
+    result = parse_device(cruise, shipment_path, filepattern, SI_path)
+    if result is not None:
+        write_result(result, csvlog, datelog, filelog)
+
+
+def parse_device(cruise, shipment_path, filepattern, SI_path="",
+                 listing=None):
+    """
+    Parses the start date of every file of one device and returns the
+    result without writing anything, or None if the device was skipped
 
-    logging.info("Running dateparser on cruise {0} and device {1}".format(
+    cruise: The cruise ID
+    shipment_path: The path to the shipment directory
+    filepattern: The name of the device usually
+    SI_path: Overrides the default instrument path of the ship
+    listing: Passed on to parse_directory
+    """
+
+    logger.info("Running dateparser on cruise {0} and device {1}".format(
         cruise, filepattern))
+    begin = time.time()
 
-    cruise_prefix = get_ship_abbreviation(cruise)
-    if SI_path == "":
-        SI_path = find_path(cruise_prefix)
-    if (cruise_prefix == "OC"):
-        cruise = cruise.lower()
-    path = shipment_path + cruise + SI_path
+    path = device_path(cruise, shipment_path, filepattern, SI_path)
     cruise = cruise.upper()
-    path = path + '/' + filepattern
-    print(path)
-    directory_files = [f for f in listdir(path) if isfile(join(path, f))]
-    raw_regex = regex_identifier(cruise, filepattern)
-    if (raw_regex):
-        directory_files = filter(
-            lambda i: raw_regex.search(i), directory_files)
-    else:
-        if cruise[:3] == "SKQ":
-            pass
-        else:
-            os.chdir(log_dir)
-            logging.error("Issue with regex, check identifier")
-            os.chdir(script_dir)
-            print("Issue with regex, check identifier")
-            return
-    if len(directory_files) == 0:
-        os.chdir(log_dir)
-        logging.error("Empty directory or other error for cruise {0} and device {1}".format(
+    say(path)
+    profile = cruise_profile(cruise)
+    raw_regex = profile.regex_for(filepattern)
+    parser = profile.parser_for(filepattern)
+    writer = open_sql_writer(cruise, filepattern)
+    try:
+        mindate, maxdate, file_dates, file_count, manifest_entry = parse_directory(
+            parser, cruise, path, raw_regex, writer and writer.add, listing)
+    except:
+        if writer is not None:
+            writer.discard()
+        raise
+    if file_count == 0:
+        if writer is not None:
+            writer.discard()
+        logger.error("Empty directory or other error for cruise {0} and device {1}".format(
             cruise, filepattern))
-        os.chdir(script_dir)
-        print("EMPTY OR ERROR FOR CRUISE {0} AND DEVICE {1}".format(
+        say("EMPTY OR ERROR FOR CRUISE {0} AND DEVICE {1}".format(
             cruise, filepattern))
-        return
-
-    mindate, maxdate = datetime.datetime.today(), datetime.datetime(1901, 1, 1)
+        return None
 
-    sql_datetime_update = []
-    sql_startend_update = ''
-
-    for filename in directory_files:
-        if (len(filename) >= 8
-            and (re.match("^[0-9]*$", filename.split('_')[-1][:8]) or
-                 re.match("^[0-9]*$", filename.split('T')[0][-8:]))):
-            if (filepattern == "multibeam"):
-                file_date = filename.split('_')[1]  # grabs date information
-                file_time = filename.split('_')[2]
-                year = file_date[0:4]
-                month = file_date[4:6]
-                day = file_date[6:8]
-                hour = file_time[0:2]
-                minute = file_time[2:4]
-                second = file_time[4:6]
-
-            elif cruise[:2] == "OC" or cruise[:2] == "TN":
-                try:
-                    file_date = filename.split('_')[1]
-                    file_time = filename.split('-')[-1]
-                except:
-                    os.chdir(log_dir)
-                    logging.error("Issue parsing file date/time for OC")
-                    os.chdir(script_dir)
-                    print("Error parsing file date/time for OC")
-                    return
-                year = file_date[0:4]
-                month = file_date[4:6]
-                day = file_date[6:8]
-                hour = file_time[0:2]
-                minute = file_time[2:4]
-                second = file_time[4:6]
-
-            elif cruise[:3] == "SKQ":
-                try:
-                    date_time = filename.split('.')[1]
-                    file_date = date_time.split('T')[0]
-                    file_time = date_time.split('T')[1][:-1]
-                except:
-                    os.chdir(log_dir)
-                    logging.error("Issue parsing file date/time for SKQ")
-                    os.chdir(script_dir)
-                    print("Error parsing file date/time for SKQ")
-                    return
-                year = file_date[0:4]
-                month = file_date[4:6]
-                day = file_date[6:8]
-                hour = file_time[0:2]
-                minute = file_time[2:4]
-                second = "00"
+    file_ends = stream_stats = streamed_paths = None
+    if writer is not None:
+        streamed_paths = writer.close()
+        match_count = writer.count
+    else:
+        sort_begin = clock()
+        file_dates.sort()
+        match_count = len(file_dates)
+        if end_times:
+            file_ends = file_end_dates(file_dates, path, parser)
+            maxdate = last_end(maxdate, file_ends)
+        file_dates, stream_stats = store_file_dates(file_dates)
+        add_stage("sort", clock() - sort_begin)
 
-            else:
-                file_date = filename.split('_')[-1]  # grabs date information
-                year = file_date[0:4]
-                month = file_date[4:6]
-                day = file_date[6:8]
-                hour = file_date[8:10]
-                minute = file_date[10:12]
-                second = file_date[12:14]
-
-            filedate = datetime.datetime(int(year), int(month), int(day),
-                                         int(hour), int(minute), int(second))
-
-            if filedate < mindate:
-                mindate = filedate
-            if filedate > maxdate:
-                maxdate = filedate
-
-            sql_datetime_update.append(generate_file_time_sql(year, month,
-                                                              day, hour, minute, second, cruise,
-                                                              filename))
     sql_startend_update = generate_cruise_startend_sql(mindate, maxdate,
                                                        cruise)
+    return DeviceResult(cruise, filepattern, mindate, maxdate,
+                        file_dates, sql_startend_update, manifest_entry,
+                        file_count, match_count, time.time() - begin,
+                        file_ends, stream_stats,
+                        streamed_paths=streamed_paths)
 
-    if csvlog or (not filelog and not csvlog and not datelog):
-        daterange2csv(cruise, filepattern,  mindate, maxdate)
 
-    sql_datetime_update.sort()
-    log(filelog, filepattern, datelog, mindate, maxdate,
-        sql_datetime_update, sql_startend_update, cruise)
+def parse_directory(parser, cruise, path, regex, add=None, listing=None):
+    """
+    Lists and parses one directory. When a run manifest is set, a
+    directory whose mtime is unchanged is not listed at all, and in a
+    changed directory only files missing from the manifest are parsed.
+    Returns (mindate, maxdate, file_dates, file_count, manifest_entry),
+    where manifest_entry is the (path, entry) to store in the manifest, or
+    None if nothing changed.
+
+    parser: The FilenameParser chosen for the directory
+    cruise: The cruise ID
+    path: The directory
+    regex: Compiled regex filenames must match, or None for all files
+    add: Passed on to parse_files
+    listing: (mtime, names) of the directory read beforehand by
+        read_listing, or None to list it here
+    """
+    if listing is not None:
+        mtime, names = listing
+        names = filter_names(names, regex)
+    else:
+        mtime, names = None, None
+    if manifest is None:
+        if names is None:
+            names = list_names(path, regex)
+        return parse_names(parser, cruise, path, names, add) + (None,)
+
+    key = entry_key(regex, parser)
+    if content_fallback:  # names cached as undated may have a content date
+        key = key + " content"
+    if mtime is None:
+        mtime = path_mtime(path)  # before listing, so late files show up next run
+    entry = manifest.get(path, key)
+    manifest_entry = None
+    if entry is not None and entry["mtime"] == mtime:
+        files = entry["files"]
+    else:
+        cached = entry["files"] if entry is not None else {}
+        files = {}
+        new_files = []
+        if names is None:
+            names = list_names(path, regex)
+        for filename in names:
+            if filename in cached:
+                files[filename] = cached[filename]
+            else:
+                files[filename] = None
+                new_files.append(filename)
+        new_dates = parse_names(parser, cruise, path, new_files)[2]
+        for seconds, filename in seconds_pairs(new_dates):
+            files[filename] = seconds
+        manifest_entry = (path, make_entry(key, mtime, files))
+
+    file_dates = [(from_seconds(seconds), filename)
+                  for filename, seconds in files.items() if seconds is not None]
+    mindate, maxdate = date_range(file_dates)
+    if add is not None:
+        for filedate, filename in file_dates:
+            add(filedate, filename)
+        file_dates = None
+    return mindate, maxdate, file_dates, len(files), manifest_entry
+
+
+def list_names(path, regex):
+    """
+    Returns scan_files of a directory. When profiling, the listing and the
+    regex are timed apart, as a list of every name and then filter_names.
+
+    path: The directory
+    regex: Compiled regex filenames must match, or None for all files
+    """
+    if stage_profile is None:
+        return scan_files(path, regex)
+    begin = clock()
+    names = list(scan_files(path))
+    add_stage("list", clock() - begin)
+    return filter_names(names, regex)
+
+
+def filter_names(names, regex):
+    """
+    Returns the names that match a regex, all of them if it is None
+    """
+    begin = clock()
+    names = [name for name in names if regex is None or regex.search(name)]
+    add_stage("filter", clock() - begin)
+    return names
+
+
+def read_listing(path):
+    """
+    Lists a directory ahead of its parse and returns the (mtime, names)
+    listing parse_directory takes. The mtime is only read when a run
+    manifest is set, and before listing, as parse_directory does.
+
+    path: The directory
+    """
+    mtime = None
+    if manifest is not None:
+        mtime = path_mtime(path)
+    return mtime, list(scan_files(path))
+
+
+def date_range(file_dates):
+    """
+    Returns the (mindate, maxdate) of (start date, filename) pairs, with
+    the same defaults parse_files starts from when there are none
+
+    file_dates: (start date, filename) pairs, or a FileDates
+    """
+    mindate, maxdate = datetime.datetime.today(), datetime.datetime(1901, 1, 1)
+    if isinstance(file_dates, FileDates):
+        if file_dates:
+            mindate = min(mindate, from_seconds(min(file_dates.seconds)))
+            maxdate = max(maxdate, from_seconds(max(file_dates.seconds)))
+    elif file_dates:
+        mindate = min(mindate, min(file_dates)[0])
+        maxdate = max(maxdate, max(file_dates)[0])
+    return mindate, maxdate
+
+
+def file_end_dates(file_dates, path, parser=None):
+    """
+    Returns the end date of each file of a device stream, in the order of
+    file_dates, in one pass from the last file back. A file ends where the
+    next file with a later start begins. The last file has no next file,
+    so its end is the last timestamp in its tail, or None if it has none,
+    cannot be read, or is archived. With content_fallback, a file whose
+    name holds no date was dated from its head, and ends at the last
+    timestamp in its tail too.
+
+    file_dates: (start date, filename) pairs of one device, sorted
+    path: The directory of the files
+    parser: The FilenameParser of the directory, which tells the files
+        dated from their content by not parsing their names
+    """
+    file_ends = [None] * len(file_dates)
+    if not file_dates:
+        return file_ends
+    ends = {}
+    if mounted(path) is None:
+        names = [file_dates[-1][1]]
+        if content_fallback and parser is not None:
+            names.extend(filename for filedate, filename in file_dates[:-1]
+                         if parser.parse(filename) is None)
+        ends = content_ends(path, names)
+    next_start = None
+    for i in range(len(file_dates) - 1, -1, -1):
+        filedate, filename = file_dates[i]
+        if i + 1 < len(file_dates) and file_dates[i + 1][0] > filedate:
+            next_start = file_dates[i + 1][0]
+        end = ends.get(filename)
+        file_ends[i] = end if end is not None and end >= filedate \
+            else next_start
+    return file_ends
+
+
+def last_end(maxdate, file_ends):
+    """
+    Returns maxdate, moved to the end of the last file if that is known
+
+    maxdate: The latest start date of a device
+    file_ends: The end dates from file_end_dates
+    """
+    if file_ends and file_ends[-1] is not None and file_ends[-1] > maxdate:
+        return file_ends[-1]
+    return maxdate
+
+
+def parse_names(parser, cruise, path, filenames, add=None):
+    """
+    parse_files, then when content_fallback is set, content_dates for the
+    files whose names did not parse. Archived files cannot be read, so
+    they keep no date.
+
+    parser: The FilenameParser chosen for the directory
+    cruise: The cruise ID
+    path: The directory of the files
+    filenames: The names of the files, any iterable
+    add: Same as for parse_files
+    """
+    if stage_profile is None:
+        return parse_name_dates(parser, cruise, path, filenames, add)
+    begin = clock()
+    parsed = parse_name_dates(parser, cruise, path, filenames, add)
+    seconds = clock() - begin
+    add_stage("parse", seconds)
+    if not batch_parse:
+        split_parse(parser, filenames, seconds)
+    return parsed
+
+
+def parse_name_dates(parser, cruise, path, filenames, add=None):
+    """
+    The work of parse_names, which times it when profiling
+    """
+    if not content_fallback or mounted(path) is not None:
+        return parse_files(parser, cruise, filenames, add)
+
+    unparsed = []
+    mindate, maxdate, file_dates, file_count = parse_files(
+        parser, cruise, filenames, add, unparsed)
+    dated = content_dates(path, unparsed)
+    for filedate, filename in dated:
+        if filedate < mindate:
+            mindate = filedate
+        if filedate > maxdate:
+            maxdate = filedate
+        if add is not None:
+            add(filedate, filename)
+    if add is None:
+        file_dates.extend(dated)  # a list, or the FileDates of a batch
+    return mindate, maxdate, file_dates, file_count
+
+
+def parse_files(parser, cruise, filenames, add=None, unparsed=None):
+    """
+    Parses the start date of each file with one parser from parserRegistry.
+    Files whose names the parser does not recognize are skipped. Returns
+    (mindate, maxdate, file_dates, file_count), where file_dates holds a
+    (start date, filename) pair per parsed file.
+
+    parser: The FilenameParser chosen for the directory
+    cruise: The cruise ID
+    filenames: The names of the files, any iterable
+    add: Called with (start date, filename) as each file is parsed instead
+        of collecting file_dates, which is then None
+    unparsed: A list the skipped names are appended to, if given
+    """
+    if batch_parse and load_numpy() is not None:
+        return parse_files_batch(parser, cruise, filenames, add, unparsed)
+
+    mindate, maxdate = datetime.datetime.today(), datetime.datetime(1901, 1, 1)
+    file_dates = []
+    file_count = 0
+    parse = parser.parse
+
+    for filename in filenames:
+        file_count += 1
+        filedate = parse(filename)
+        if filedate is None:
+            if unparsed is not None:
+                unparsed.append(filename)
+            continue
+
+        if filedate < mindate:
+            mindate = filedate
+        if filedate > maxdate:
+            maxdate = filedate
+
+        if add is not None:
+            add(filedate, filename)
+        else:
+            file_dates.append((filedate, filename))
+    if add is not None:
+        file_dates = None
+    return mindate, maxdate, file_dates, file_count
+
+
+def parse_files_batch(parser, cruise, filenames, add=None, unparsed=None):
+    """
+    Same as parse_files, but parses the whole directory at once into NumPy
+    datetime64 arrays and takes min/max with array reductions. file_dates
+    is a FileDates made from the stamps as int64 seconds, without a
+    datetime per file.
+
+    parser: The FilenameParser chosen for the directory
+    cruise: The cruise ID
+    filenames: The names of the files, any iterable
+    add: Same as for parse_files
+    unparsed: Same as for parse_files
+    """
+    filenames = list(filenames)
+    names, stamps = parser.parse_batch(filenames)
+    if unparsed is not None and len(names) < len(filenames):
+        parsed = set(names)
+        unparsed.extend(f for f in filenames if f not in parsed)
+    seconds = stamps.astype(load_numpy().int64)
+    mindate, maxdate = datetime.datetime.today(), datetime.datetime(1901, 1, 1)
+    if len(names) > 0:
+        mindate = min(mindate, from_seconds(int(seconds.min())))
+        maxdate = max(maxdate, from_seconds(int(seconds.max())))
+    # tolist of the int64 array gives ints, which the seconds array takes
+    file_dates = FileDates.from_seconds_pairs(zip(seconds.tolist(), names))
+    if add is not None:
+        for filedate, filename in file_dates:
+            add(filedate, filename)
+        file_dates = None
+    return mindate, maxdate, file_dates, len(filenames)
 
 
 def listCruises(cruise_prefix, cruise_path):
@@ -177,25 +565,12 @@ def listCruises(cruise_prefix, cruise_path):
 
     cruise_prefix: The cruise prefix to run dateparse on
     """
-    SI_path = find_path(cruise_prefix)
+    roger_regex = ship_profile(cruise_prefix).cruise_regex
     full_dir_list = sorted(os.listdir(cruise_path))
 
-    if cruise_prefix == "OC":  # filters to just .tar directories
-        roger_regex = re.compile(r'^' + cruise_prefix.lower() + '\d*\w$')
-    elif cruise_prefix == "TN" or cruise_prefix == "SKQ" or cruise_prefix == "SR"\
-            or cruise_prefix == "RR" or cruise_prefix == "SP":
-        roger_regex = re.compile(r'^' + cruise_prefix + '\d*\w$')
-    elif cruise_prefix == "RC":
-        roger_regex = re.compile(r'^' + 'RC')
-    elif cruise_prefix == "BH":
-        roger_regex = re.compile(r'^' + 'BH')
-    else:
-        roger_regex = re.compile(r'^' + cruise_prefix + '.*tar$')
-        #roger_regex = re.compile(r'^' + cruise_prefix + '\d*\w$')
-
-    print(full_dir_list)
-    dir_list = filter(lambda i: roger_regex.search(i), full_dir_list)
-    print(dir_list)
+    say(full_dir_list)
+    dir_list = [d for d in full_dir_list if roger_regex.search(d)]
+    say(dir_list)
     return dir_list
 
 
@@ -208,74 +583,149 @@ def RC_dateparser(cruise, shipment_path, csvlog, datelog, filelog):
     datelog: True if creating SQL of min/max cruise range, false otherwise
     filelog: True if logging SQL to files, false otherwis
     """
-    regex_scs = re.compile(r'scs$')
-    full_sub_dir_list = sorted(os.listdir(shipment_path + cruise))
-    subdir_list = filter(lambda i: regex_scs.search(i), full_sub_dir_list)
-    regex_filetype = regex_identifier(cruise)
-    for scs_dir in subdir_list:
-        path = shipment_path + cruise + '/' + scs_dir
-        directory_files = [f for f in listdir(
-            path) if isfile(join(path, f))]
-        directory_files = filter(
-            lambda i: regex_filetype.search(i), directory_files)
-        if len(directory_files) == 0:
-            os.chdir(log_dir)
-            logging.error(
-                "Empty directory or other error for cruise {0}".format(cruise))
-            os.chdir(script_dir)
-            print("EMPTY OR ERROR FOR CRUISE {0}".format(cruise))
-            continue
+    for scs_dir in list_scs_dirs(cruise, shipment_path):
+        for result in parse_scs_dir(cruise, shipment_path, scs_dir):
+            write_result(result, csvlog, datelog, filelog)
+
+
+def list_scs_dirs(cruise, shipment_path):
+    """
+    Returns the scs subdirectories of a Rachel Carson cruise
+
+    cruise: The cruise ID
+    shipment_path: The path to the shipment directory
+    """
+    return list_device_dirs(cruise, shipment_path)
+
+
+def list_device_dirs(cruise, shipment_path):
+    """
+    Returns the subdirectories of a cruise matching the device_glob of its
+    ship's profile
+
+    cruise: The cruise ID
+    shipment_path: The path to the shipment directory
+    """
+    device_regex = cruise_profile(cruise).device_regex
+    full_sub_dir_list = sorted(list_entries(shipment_path + cruise))
+    return [d for d in full_sub_dir_list if device_regex.match(d)]
 
-        mindate, maxdate = datetime.datetime.today(), datetime.datetime(1901, 1, 1)
-
-        sql_datetime_update = []
-        sql_startend_update = ''
-
-        saved_filepattern = ''
-        directory_files.sort()
-
-        for filename in directory_files:
-            filepattern = filename.split('_')[0]
-            if saved_filepattern == '':
-                saved_filepattern = filepattern
-            if filepattern != saved_filepattern:
-                sql_datetime_update.sort()
-                if csvlog or (not filelog and not csvlog and not datelog):
-                    daterange2csv(cruise, filepattern,  mindate, maxdate)
-                log(filelog, saved_filepattern, datelog, mindate, maxdate,
-                    sql_datetime_update, sql_startend_update, cruise)
-                sql_datetime_update = []
-                saved_filepattern = filepattern
-                mindate, maxdate = datetime.datetime.today(), datetime.datetime(1901, 1, 1)
-            iso_date = filename.split('_')[1].split('.')[0]
-            if (re.match("^[0-9]*$", iso_date[:8])):
-                try:
-                    file_date = iso_date.split('-')[0]
-                    file_time = iso_date.split('-')[1]
-                except:
-                    os.chdir(log_dir)
-                    logging.error("Issue parsing file date/time for RC")
-                    os.chdir(script_dir)
-                    print("Error parsing file date/time for RC")
-                    return
-                year = file_date[0:4]
-                month = file_date[4:6]
-                day = file_date[6:8]
-                hour = file_time[0:2]
-                minute = file_time[2:4]
-                second = "00"
-
-                filedate = datetime.datetime(int(year), int(month), int(day),
-                                             int(hour), int(minute), int(second))
-
-                if filedate < mindate:
-                    mindate = filedate
-                if filedate > maxdate:
-                    maxdate = filedate
-
-                sql_datetime_update.append(generate_file_time_sql(year, month,
-                                                                  day, hour, minute, second, cruise,
-                                                                  filename))
+
+def parse_scs_dir(cruise, shipment_path, scs_dir, listing=None):
+    """
+    Parses one scs directory of a Rachel Carson cruise and returns one
+    result per file prefix found in it
+
+    cruise: The cruise ID
+    shipment_path: The path to the shipment directory
+    scs_dir: The scs subdirectory to parse
+    listing: Passed on to parse_directory
+    """
+    begin = time.time()
+    results = []
+    profile = cruise_profile(cruise)
+    regex_filetype = profile.regex_for()
+    path = shipment_path + cruise + '/' + scs_dir + profile.device_subpath
+    parser = profile.parser_for()
+    if stream_order is not None:
+        return parse_scs_dir_streamed(cruise, path, regex_filetype, parser,
+                                      begin, listing, scs_dir)
+    file_dates, file_count, manifest_entry = parse_directory(
+        parser, cruise, path, regex_filetype, None, listing)[2:]
+    if file_count == 0:
+        logger.error(
+            "Empty directory or other error for cruise {0}".format(cruise))
+        say("EMPTY OR ERROR FOR CRUISE {0}".format(cruise))
+        return results
+
+    # names that did not parse have no prefix group; they are counted
+    # with the first group so the directory totals stay right
+    unparsed_count = file_count - len(file_dates)
+    sort_begin = clock()
+    # grouped as seconds, so a batch parse never makes datetimes
+    pairs = sorted(seconds_pairs(file_dates),
+                   key=lambda pair: (pair[1].split('_')[0], pair))
+    for filepattern, group in itertools.groupby(
+            pairs, lambda pair: pair[1].split('_')[0]):
+        group = FileDates.from_seconds_pairs(group)
+        mindate, maxdate = date_range(group)
+        file_ends = None
+        if end_times:
+            file_ends = file_end_dates(group, path, parser)
+            maxdate = last_end(maxdate, file_ends)
+        group, stream_stats = store_file_dates(group)
+        results.append(DeviceResult(
+            cruise, filepattern, mindate, maxdate, group,
+            generate_cruise_startend_sql(mindate, maxdate, cruise),
+            manifest_entry, len(group) + unparsed_count, len(group),
+            time.time() - begin, file_ends, stream_stats, scs_dir))
+        manifest_entry = None  # stored once per directory
+        unparsed_count = 0
+        begin = time.time()
+    add_stage("sort", clock() - sort_begin)
+    return results
+
+
+def parse_scs_dir_streamed(cruise, path, regex_filetype, parser, begin,
+                           listing=None, scs_dir=None):
+    """
+    parse_scs_dir for streamed SQL, with one SQLFileWriter per file prefix
+
+    cruise: The cruise ID
+    path: The scs directory
+    regex_filetype: Compiled regex filenames must match
+    parser: The FilenameParser for the directory
+    begin: The time the parse of the directory started
+    listing: Passed on to parse_directory
+    scs_dir: The scs subdirectory, for the results' device_dir
+    """
+    writers = {}
+    ranges = {}
+
+    def add(filedate, filename):
+        filepattern = filename.split('_')[0]
+        writer = writers.get(filepattern)
+        if writer is None:
+            writer = writers[filepattern] = open_sql_writer(cruise, filepattern)
+            ranges[filepattern] = [filedate, filedate]
+        writer.add(filedate, filename)
+        span = ranges[filepattern]
+        if filedate < span[0]:
+            span[0] = filedate
+        if filedate > span[1]:
+            span[1] = filedate
+
+    try:
+        file_count, manifest_entry = parse_directory(
+            parser, cruise, path, regex_filetype, add, listing)[3:]
+    except:
+        for writer in writers.values():
+            writer.discard()
+        raise
+    if file_count == 0:
+        logger.error(
+            "Empty directory or other error for cruise {0}".format(cruise))
+        say("EMPTY OR ERROR FOR CRUISE {0}".format(cruise))
+        return []
+
+    results = []
+    unparsed_count = file_count - sum(w.count for w in writers.values())
+    for filepattern in sorted(writers):
+        writer = writers[filepattern]
+        streamed_paths = writer.close()
+        mindate, maxdate = date_range(None)
+        mindate = min(mindate, ranges[filepattern][0])
+        maxdate = max(maxdate, ranges[filepattern][1])
+        results.append(DeviceResult(
+            cruise, filepattern, mindate, maxdate, None,
+            generate_cruise_startend_sql(mindate, maxdate, cruise),
+            manifest_entry, writer.count + unparsed_count, writer.count,
+            time.time() - begin, device_dir=scs_dir,
+            streamed_paths=streamed_paths))
+        manifest_entry = None
+        unparsed_count = 0
+        begin = time.time()
+    return results
 
 
 def BH_dateparser(cruise, shipment_path, csvlog, datelog, filelog):
@@ -287,72 +737,75 @@ def BH_dateparser(cruise, shipment_path, csvlog, datelog, filelog):
     datelog: True if creating SQL of min/max cruise range, false otherwise
     filelog: True if logging SQL to files, false otherwise
     """
-    regex_adcp = re.compile(r'ADCP')
-
-    full_sub_dir_list = sorted(os.listdir(shipment_path + cruise))
-    subdir_list = filter(lambda i: regex_adcp.search(i), full_sub_dir_list)
-    regex_filetype = regex_identifier(cruise)
-
-    for adcp_dir in subdir_list:
-        path = shipment_path + cruise + '/' + adcp_dir + "/raw/gp90"
-        directory_files = [f for f in listdir(
-            path) if isfile(join(path, f))]
-        directory_files = filter(
-            lambda i: regex_filetype.search(i), directory_files)
-        if len(directory_files) == 0:
-            os.chdir(log_dir)
-            logging.error(
-                "Empty directory or other error for cruise {0}".format(cruise))
-            os.chdir(script_dir)
-            print("EMPTY OR ERROR FOR CRUISE {0}".format(cruise))
+    for adcp_dir in list_adcp_dirs(cruise, shipment_path):
+        result = parse_adcp_dir(cruise, shipment_path, adcp_dir)
+        if result is None:
             return
+        write_result(result, csvlog, datelog, filelog)
+
+
+def list_adcp_dirs(cruise, shipment_path):
+    """
+    Returns the ADCP subdirectories of a Blue Heron cruise
+
+    cruise: The cruise ID
+    shipment_path: The path to the shipment directory
+    """
+    return list_device_dirs(cruise, shipment_path)
+
 
-        mindate, maxdate = datetime.datetime.today(), datetime.datetime(1901, 1, 1)
-
-        sql_datetime_update = []
-        sql_startend_update = ''
-
-        directory_files.sort()
-
-        for filename in directory_files:
-            filepattern = filename.split('_')[0]
-            julian_date = filename[4:10]
-            second = int(filename[11:16])
-            try:
-                julian_date = julian_date.split(
-                    '_')[0] + julian_date.split('_')[1]
-            except:
-                os.chdir(log_dir)
-                logging.error("Issue parsing file date/time for RC")
-                os.chdir(script_dir)
-                print("Error parsing file date/time for RC")
-                return
-
-            filedate = datetime.datetime.strptime(
-                julian_date, '%y%j')
-            year = filedate.year
-            month = filedate.month
-            day = filedate.day
-            minute, second = divmod(second, 60)
-            hour, minute = divmod(minute, 60)
-
-            if filedate < mindate:
-                mindate = filedate
-            if filedate > maxdate:
-                maxdate = filedate
-
-            sql_datetime_update.append(generate_file_time_sql(year, month,
-                                                              day, hour, minute, second, cruise,
-                                                              filename))
-        sql_startend_update = generate_cruise_startend_sql(mindate, maxdate,
-                                                           cruise)
-        if csvlog or (not filelog and not csvlog and not datelog):
-            daterange2csv(cruise, "gp90",  mindate, maxdate)
-
-        sql_datetime_update.sort()
-        log(filelog, "gp90", datelog, mindate, maxdate,
-            sql_datetime_update, sql_startend_update, cruise)
+def parse_adcp_dir(cruise, shipment_path, adcp_dir, listing=None):
+    """
+    Parses the gp90 files of one ADCP directory of a Blue Heron cruise and
+    returns the result, or None if the directory was skipped
 
+    cruise: The cruise ID
+    shipment_path: The path to the shipment directory
+    adcp_dir: The ADCP subdirectory to parse
+    listing: Passed on to parse_directory
+    """
+    begin = time.time()
+    profile = cruise_profile(cruise)
+    regex_filetype = profile.regex_for()
+    path = shipment_path + cruise + '/' + adcp_dir + profile.device_subpath
+    parser = profile.parser_for()
+    writer = open_sql_writer(cruise, "gp90")
+    try:
+        mindate, maxdate, file_dates, file_count, manifest_entry = parse_directory(
+            parser, cruise, path, regex_filetype, writer and writer.add,
+            listing)
+    except:
+        if writer is not None:
+            writer.discard()
+        raise
+    if file_count == 0:
+        if writer is not None:
+            writer.discard()
+        logger.error(
+            "Empty directory or other error for cruise {0}".format(cruise))
+        say("EMPTY OR ERROR FOR CRUISE {0}".format(cruise))
+        return None
+
+    file_ends = stream_stats = streamed_paths = None
+    if writer is not None:
+        streamed_paths = writer.close()
+        match_count = writer.count
+    else:
+        sort_begin = clock()
+        file_dates.sort()
+        match_count = len(file_dates)
+        if end_times:
+            file_ends = file_end_dates(file_dates, path, parser)
+            maxdate = last_end(maxdate, file_ends)
+        file_dates, stream_stats = store_file_dates(file_dates)
+        add_stage("sort", clock() - sort_begin)
+
+    sql_startend_update = generate_cruise_startend_sql(mindate, maxdate,
+                                                       cruise)
+    return DeviceResult(cruise, "gp90", mindate, maxdate,
+                        file_dates, sql_startend_update, manifest_entry,
+                        file_count, match_count, time.time() - begin,
+                        file_ends, stream_stats, adcp_dir, streamed_paths)
 
 
 def cruiseDateParse(cruise, shipment_path, csvlog, datelog, filelog, SI_path=""):
@@ -364,42 +817,299 @@ def cruiseDateParse(cruise, shipment_path, csvlog, datelog, filelog, SI_path="")
     datelog: True if creating SQL of min/max cruise range, false otherwise
     filelog: True if logging SQL to files, false otherwise
     """
+    for instrument in list_instruments(cruise, shipment_path, SI_path):
+        dateparser(cruise, shipment_path, instrument, csvlog,
+                   datelog, filelog, SI_path)
+
+
+def list_instruments(cruise, shipment_path, SI_path=""):
+    """
+    Returns the instrument directories of a single cruise
+
+    cruise: The cruise ID
+    shipment_path: The path to the shipment directory
+    SI_path: Overrides the default instrument path of the ship
+    """
     cruise_prefix = get_ship_abbreviation(cruise.upper())
     if SI_path == "":
         SI_path = find_path(cruise_prefix)
     path = shipment_path + cruise + SI_path
 
     try:
-        instruments_list = os.walk(path).next()[1]
+        instruments_list = list(scan_dirs(path))
     except:
-        os.chdir(log_dir)
-        logging.error(
+        logger.error(
             "Unable to get instrument list for cruise {0} at location {1}".format(cruise, path))
-        os.chdir(script_dir)
-        print("Unable to get instrument list for cruise {0}".format(cruise))
-        print(path)
-        return
-    for instrument in instruments_list:
-        if instrument == 'events':
-            pass
-        dateparser(cruise, shipment_path, instrument, csvlog,
-                   datelog, filelog, SI_path)
+        say("Unable to get instrument list for cruise {0}".format(cruise))
+        say(path)
+        return []
+    return instruments_list
 
 
-def daterange2csv(cruise, device, mindate, maxdate):
+def list_units(cruise, shipment_path, filepattern, dateparse_method,
+               all_devices, SI_path=""):
+    """
+    Returns the (cruise, device) units a cruise splits into. Each unit can
+    be parsed on its own with parse_unit.
+
+    cruise: The cruise ID
+    shipment_path: The path to the shipment directory
+    filepattern: The device to parse when not running all devices
+    dateparse_method: '1' for serial instruments, '2' for RC, '3' for BH
+    all_devices: True if running all devices of the cruise
+    SI_path: Overrides the default instrument path of the ship
+    """
+    if dateparse_method == '1':
+        if SI_path == "":
+            SI_path = find_path(get_ship_abbreviation(cruise.upper()))
+        if all_devices:
+            devices = list_instruments(cruise, shipment_path, SI_path)
+        else:
+            devices = [filepattern]
+    elif dateparse_method == '2':
+        devices = list_scs_dirs(cruise, shipment_path)
+    elif dateparse_method == '3':
+        devices = list_adcp_dirs(cruise, shipment_path)
+    else:
+        devices = []
+    return [(dateparse_method, cruise, shipment_path, device, SI_path)
+            for device in devices]
+
+
+def parse_unit(unit, listing=None):
+    """
+    Parses one (cruise, device) unit from list_units and returns its list
+    of results. Nothing is written, so units can run in worker processes.
+
+    unit: A (dateparse_method, cruise, shipment_path, device, SI_path) tuple
+    listing: The read_listing of unit_path(unit), or None to list it here
+    """
+    dateparse_method, cruise, shipment_path, device, SI_path = unit
+    if stage_profile is not None:
+        begin_unit()
+    if dateparse_method == '2':
+        results = parse_scs_dir(cruise, shipment_path, device, listing)
+    else:
+        if dateparse_method == '3':
+            result = parse_adcp_dir(cruise, shipment_path, device, listing)
+        else:
+            result = parse_device(cruise, shipment_path, device, SI_path,
+                                  listing)
+        results = [result] if result is not None else []
+    if stage_profile is not None:
+        stage_times = end_unit()
+        if results:
+            results[0].stage_times = stage_times
+    return results
+
+
+def unit_path(unit):
+    """
+    Returns the directory parse_unit lists for a unit
+
+    unit: A (dateparse_method, cruise, shipment_path, device, SI_path) tuple
+    """
+    dateparse_method, cruise, shipment_path, device, SI_path = unit
+    if dateparse_method == '2' or dateparse_method == '3':
+        return (shipment_path + cruise + '/' + device +
+                cruise_profile(cruise).device_subpath)
+    return device_path(cruise, shipment_path, device, SI_path)
+
+
+def unit_regex(unit):
+    """
+    Returns the compiled regex the files parse_unit parses for a unit must
+    match, or None for all files
+
+    unit: A (dateparse_method, cruise, shipment_path, device, SI_path) tuple
+    """
+    dateparse_method, cruise, shipment_path, device, SI_path = unit
+    if dateparse_method == '2' or dateparse_method == '3':
+        return cruise_profile(cruise).regex_for()
+    return cruise_profile(cruise).regex_for(device)
+
+
+def device_path(cruise, shipment_path, filepattern, SI_path=""):
+    """
+    Returns the directory of one serial instrument device
+
+    cruise: The cruise ID
+    shipment_path: The path to the shipment directory
+    filepattern: The name of the device usually
+    SI_path: Overrides the default instrument path of the ship
+    """
+    profile = cruise_profile(cruise)
+    if SI_path == "":
+        SI_path = profile.instrument_path
+    if profile.lowercase:
+        cruise = cruise.lower()
+    return shipment_path + cruise + SI_path + '/' + filepattern
+
+
+class DeviceResult(object):
+    """
+    Parsed dates of one device of one cruise, ready to be written out.
+    file_dates is a resultStore.FileDates of (start date, filename) pairs
+    sorted by date, or None when the file update SQL was streamed to disk
+    during the parse.
+    manifest_entry is the (path, entry) to store in the run manifest, if any.
+    file_count, match_count and elapsed are the files listed, the files a
+    date was parsed for, and the seconds the parse took. file_ends holds
+    the end date of each file of file_dates, or None for an unknown end,
+    when end_times is set, else it is None. stream_stats is the
+    gapAnalysis.StreamStats of file_dates when gap_factor is set.
+    device_dir is the scs or ADCP directory of the cruise the result was
+    parsed from, or None for a serial instrument, whose directory is its
+    device; the gp90 files of every ADCP directory share one device name.
+    stage_times holds the {stage: seconds} of the parse when profiling, on
+    the first result of a unit only. streamed_paths holds the files the
+    streamed SQL was written to, which write_result moves to its
+    output_path.
+    """
+
+    def __init__(self, cruise, device, mindate, maxdate,
+                 file_dates, sql_startend_update, manifest_entry=None,
+                 file_count=0, match_count=0, elapsed=0.0, file_ends=None,
+                 stream_stats=None, device_dir=None, streamed_paths=None):
+        self.cruise = cruise
+        self.device = device
+        self.mindate = mindate
+        self.maxdate = maxdate
+        self.file_dates = file_dates
+        self.sql_startend_update = sql_startend_update
+        self.manifest_entry = manifest_entry
+        self.file_count = file_count
+        self.match_count = match_count
+        self.elapsed = elapsed
+        self.file_ends = file_ends
+        self.stream_stats = stream_stats
+        self.device_dir = device_dir
+        self.stage_times = None
+        self.streamed_paths = streamed_paths
+
+
+def store_file_dates(file_dates):
+    """
+    Returns the resultStore.FileDates of a device's sorted (start date,
+    filename) pairs, or the FileDates itself, and their
+    gapAnalysis.StreamStats when gap_factor is set, else None. The
+    analysis runs in the pass that stores the pairs.
+    """
+    if gap_factor is None:
+        if isinstance(file_dates, FileDates):
+            return file_dates, None
+        return FileDates(file_dates), None
+    stored = FileDates()
+    return stored, store_stream(seconds_pairs(file_dates), stored, gap_factor)
+
+
+def write_result(result, csvlog, datelog, filelog, output_path="./"):
+    """
+    Writes a parsed device result to the CSV and SQL logs
+
+    result: The DeviceResult to write
+    csvlog: True if logging dates to csv log file, false otherwise
+    datelog: True if creating SQL of min/max cruise range, false otherwise
+    filelog: True if logging SQL to files, false otherwise
+    output_path: The directory the logs are written to, ending in '/'
+    """
+    if overlap_check is not None:
+        overlap_check.add(result, csvlog, datelog, filelog)
+        return
+    if stage_profile is not None and result.stage_times:
+        stage_profile.add_times(result.cruise, result.device,
+                                result.stage_times)
+    if manifest is not None and result.manifest_entry is not None:
+        manifest.update(*result.manifest_entry)
+    log_metrics(result.cruise, result.device, result.file_count,
+                result.match_count, result.elapsed,
+                ship=get_ship_abbreviation(result.cruise))
+    if csvlog or (not filelog and not csvlog and not datelog):
+        daterange2csv(result.cruise, result.device,
+                      result.mindate, result.maxdate, output_path)
+    if result.stream_stats is not None:
+        gaps2csv(result.cruise, result.device, result.stream_stats,
+                 output_path)
+    if inventory is not None:
+        inventory.add_result(result)
+    if db_sink is not None:
+        begin = clock()
+        db_sink.write_result(result, filelog, datelog)
+        if stage_profile is not None:
+            stage_profile.add(result.cruise, result.device, "write",
+                              clock() - begin)
+        return
+    # streamed results have already written their file update SQL
+    if result.streamed_paths:
+        move_streamed(result.streamed_paths, output_path)
+    filelog = filelog and result.file_dates is not None
+    sql_datetime_update = []
+    if filelog and sql_mode == "line":
+        # rendered one line at a time as log() writes them
+        file_ends = result.file_ends or itertools.repeat(None)
+        sql_datetime_update = (
+            file_time_sql(filedate, result.cruise, filename, enddate)
+            for (filedate, filename), enddate
+            in zip(result.file_dates, file_ends))
+    log(filelog, result.device, datelog, result.mindate, result.maxdate,
+        sql_datetime_update, result.sql_startend_update, result.cruise,
+        sql_mode, result.file_dates, result.file_ends, output_path)
+
+
+def daterange2csv(cruise, device, mindate, maxdate, output_path="./"):
+    """
+    Adds a device date range to the dateranges CSV of its cruise, through
+    the run's range_aggregator when one is set
+
+    cruise: The cruise ID
+    device: The device
+    mindate: The minimum file date
+    maxdate: The maximum file date
+    output_path: The directory of the CSV, ending in '/'
+    """
     if cruise[:2] == 'RC' and len(cruise) == 5:
         cruise = cruise[:2] + '0' + cruise[2:]
     #cruise_abbrev = get_ship_abbreviation(cruise)
-    f = open(
-        "./{0}_{1}_dateranges.csv".format(isoDate, cruise), "a+")
-    if not f.read(1):
-        f.write("cruise,devicetype,start_date,end_date\n")
-    f.write('{0},{1},{2},{3}'.format(cruise, device, mindate, maxdate) + '\n')
-    f.close()
+    if isoDate is None:
+        begin_run()
+    csv_path = "{0}{1}_{2}_dateranges.csv".format(output_path, isoDate,
+                                                  cruise)
+    if range_aggregator is not None:
+        range_aggregator.add(csv_path, cruise, device, mindate, maxdate)
+    else:
+        append_csv(csv_path, [csv_line(cruise, device, mindate, maxdate)])
+
+
+def gaps2csv(cruise, device, stream_stats, output_path="./"):
+    """
+    Adds the gap report of a device to the gaps CSV of its cruise
+
+    cruise: The cruise ID
+    device: The device
+    stream_stats: The device's gapAnalysis.StreamStats
+    output_path: The directory of the CSV, ending in '/'
+    """
+    gap_lines2csv(cruise, stream_stats.report_lines(device), output_path)
+
+
+def gap_lines2csv(cruise, lines, output_path="./"):
+    """
+    Adds gap report lines from StreamStats.report_lines to the gaps CSV of
+    their cruise
+
+    cruise: The cruise ID
+    lines: The report lines
+    output_path: The directory of the CSV, ending in '/'
+    """
+    if isoDate is None:
+        begin_run()
+    append_csv("{0}{1}_{2}_gaps.csv".format(output_path, isoDate, cruise),
+               lines, GAP_HEADER)
 
 
 def log(filelog, filepattern, datelog, mindate,
-        maxdate, sql_datetime_update, sql_startend_update, cruise):
+        maxdate, sql_datetime_update, sql_startend_update, cruise,
+        sql_mode="line", file_dates=None, file_ends=None, output_path="./"):
     """
     Writes generated SQL out to files or to the console
 
@@ -408,31 +1118,54 @@ def log(filelog, filepattern, datelog, mindate,
     filelog: True if logging SQL to files, false otherwise
     mindate: The minimum file date
     maxdate: The maximum file date
-    sql_datetime_update: The SQL generated for updating the date field
+    sql_datetime_update: The SQL generated for updating the date field,
+        any iterable of lines
     sql_startend_update: The SQL generated for updating cruise bounds
     cruise: The cruise dateparse ran on
+    sql_mode: "line" writes sql_datetime_update as one UPDATE per file,
+        "values" and "copy" write file_dates as one set-based update
+    file_dates: (start date, filename) pairs, used by "values" and "copy"
+    file_ends: The end date of each of file_dates, if end times are written
+    output_path: The directory the SQL files are written to, ending in '/'
     """
 
     if (filelog):
-        os.chdir(log_dir)
-        logging.info("Creating SQL to update file date information.")
-        os.chdir(script_dir)
-        f = open("./" +
+        logger.info("Creating SQL to update file date information.")
+        f = open(output_path +
                  cruise + '_' + filepattern + ".sql", "w+")
-        for each in sql_datetime_update:
-            f.write(each + '\n')
+        if sql_mode == "values":
+            lines = generate_staged_update_sql(file_dates, cruise,
+                                               file_ends=file_ends)
+        elif sql_mode == "copy":
+            csv_name = cruise + '_' + filepattern + "_staging.csv"
+            begin = clock()
+            write_staging_csv(output_path + csv_name, file_dates, cruise,
+                              file_ends)
+            if stage_profile is not None:
+                stage_profile.add(cruise, filepattern, "write",
+                                  clock() - begin)
+            lines = generate_staged_update_sql(None, cruise, csv_name,
+                                               file_ends=file_ends)
+        else:
+            lines = sql_datetime_update
+        if stage_profile is None:
+            for each in lines:
+                f.write(each + '\n')
+        else:  # SQL building and writing timed apart
+            stage_profile.write_lines(f, lines, cruise, filepattern)
         f.close()
 
     if (datelog):
-        os.chdir(log_dir)
-        logging.info("Creating SQL to update cruise min and max file range.")
-        os.chdir(script_dir)
-        print('MIN DATE: ' + str(mindate))
-        print('MAX DATE: ' + str(maxdate))
-        f = open("./" +
+        logger.info("Creating SQL to update cruise min and max file range.")
+        say('MIN DATE: ' + str(mindate))
+        say('MAX DATE: ' + str(maxdate))
+        begin = clock()
+        f = open(output_path +
                  cruise + "_MINMAX_UPDATE.sql", "w+")
         f.write(sql_startend_update)
         f.close()
+        if stage_profile is not None:
+            stage_profile.add(cruise, filepattern, "write", clock() - begin)
 
 
 def generate_file_time_sql(year, month, day, hour, minute, second,
@@ -456,6 +1189,376 @@ def generate_file_time_sql(year, month, day, hour, minute, second,
     return sql_line
 
 
+def file_time_sql(filedate, cruise, filename, enddate=None):
+    """
+    Generates SQL for updating the file start time from a parsed date, and
+    the end time when one is given
+
+    filedate: The parsed start date
+    cruise: The cruise ID
+    filename: The name of the file
+    enddate: The end date of the file, or None
+    """
+    if enddate is not None:
+        return ('UPDATE file SET start_time = \'' + format_file_time(filedate)
+                + '\', end_time = \'' + format_file_time(enddate)
+                + '\' WHERE cruise_id = \'' + cruise + '\' AND path LIKE \'%'
+                + filename + '\';')
+    return generate_file_time_sql(
+        '%04d' % filedate.year, '%02d' % filedate.month,
+        '%02d' % filedate.day, '%02d' % filedate.hour,
+        '%02d' % filedate.minute, '%02d' % filedate.second, cruise, filename)
+
+
+def format_file_time(filedate):
+    """
+    Formats a parsed start date the way the file table stores it
+
+    filedate: The parsed start date
+    """
+    return '%04d-%02d-%02d %02d:%02d:%02d' % (
+        filedate.year, filedate.month, filedate.day,
+        filedate.hour, filedate.minute, filedate.second)
+
+
+def sql_quote(value):
+    """
+    Quotes a value as an SQL string literal
+
+    value: The string to quote
+    """
+    return "'" + value.replace("'", "''") + "'"
+
+
+# basename of file.path; rtrim strips everything after the last '/', and
+# the same expression works in PostgreSQL and SQLite
+FILE_BASENAME_SQL = \
+    "substr(file.path, length(rtrim(file.path, replace(file.path, '/', ''))) + 1)"
+
+STAGING_CREATE_SQL = (
+    "CREATE TEMP TABLE IF NOT EXISTS file_time_staging "
+    "(cruise_id text, filename text, start_time timestamp, "
+    "PRIMARY KEY (cruise_id, filename));")
+
+STAGING_UPDATE_SQL = (
+    "UPDATE file SET start_time = file_time_staging.start_time "
+    "FROM file_time_staging "
+    "WHERE file.cruise_id = file_time_staging.cruise_id "
+    "AND " + FILE_BASENAME_SQL + " = file_time_staging.filename;")
+
+# the same with end times; a NULL end leaves the stored end_time alone
+STAGING_CREATE_END_SQL = (
+    "CREATE TEMP TABLE IF NOT EXISTS file_time_staging "
+    "(cruise_id text, filename text, start_time timestamp, "
+    "end_time timestamp, PRIMARY KEY (cruise_id, filename));")
+
+STAGING_UPDATE_END_SQL = (
+    "UPDATE file SET start_time = file_time_staging.start_time, "
+    "end_time = COALESCE(file_time_staging.end_time, file.end_time) "
+    "FROM file_time_staging "
+    "WHERE file.cruise_id = file_time_staging.cruise_id "
+    "AND " + FILE_BASENAME_SQL + " = file_time_staging.filename;")
+
+STAGING_DROP_SQL = "DROP TABLE file_time_staging;"
+
+
+def generate_staged_update_sql(file_dates, cruise, csv_name=None,
+                               batch_size=1000, file_ends=None):
+    """
+    Generates SQL that loads file start times into a staging table and
+    applies them with a single UPDATE joined on the file name. Unlike one
+    UPDATE ... LIKE '%filename' per file, this scans the file table once.
+
+    file_dates: (start date, filename) pairs, loaded with batched
+        multi-row INSERT ... VALUES statements
+    cruise: The cruise ID
+    csv_name: Loads a staging CSV from write_staging_csv with psql \\copy
+        instead of file_dates
+    batch_size: The number of rows per INSERT statement
+    file_ends: The end date of each of file_dates, to also update end
+        times; with csv_name, any list selects the staging table with
+        end times, as the CSV then holds them
+    """
+    if file_ends is None:
+        sql_lines = [STAGING_CREATE_SQL]
+    else:
+        sql_lines = [STAGING_CREATE_END_SQL]
+    if csv_name is not None:
+        sql_lines.append(staging_copy_sql(csv_name))
+    elif file_ends is None:
+        for start in range(0, len(file_dates), batch_size):
+            sql_lines.append(staging_insert_sql(
+                [staging_row_sql(filedate, filename, cruise)
+                 for filedate, filename in file_dates[start:start + batch_size]]))
+    else:
+        for start in range(0, len(file_dates), batch_size):
+            sql_lines.append(staging_insert_sql(
+                [staging_row_sql(filedate, filename, cruise, enddate)
+                 for (filedate, filename), enddate
+                 in zip(file_dates[start:start + batch_size],
+                        file_ends[start:start + batch_size])],
+                STAGING_END_COLUMNS))
+    sql_lines.append(STAGING_UPDATE_SQL if file_ends is None
+                     else STAGING_UPDATE_END_SQL)
+    sql_lines.append(STAGING_DROP_SQL)
+    return sql_lines
+
+
+STAGING_COLUMNS = "(cruise_id, filename, start_time)"
+
+STAGING_END_COLUMNS = "(cruise_id, filename, start_time, end_time)"
+
+
+def staging_row_sql(filedate, filename, cruise, enddate=False):
+    """
+    Returns one row of a file_time_staging INSERT ... VALUES statement,
+    with an end_time column when enddate is given, NULL if it is None
+    """
+    row = "(" + sql_quote(cruise) + ", " + sql_quote(filename) + \
+        ", '" + format_file_time(filedate) + "'"
+    if enddate is None:
+        row += ", NULL"
+    elif enddate is not False:
+        row += ", '" + format_file_time(enddate) + "'"
+    return row + ")"
+
+
+def staging_insert_sql(rows, columns=STAGING_COLUMNS):
+    """
+    Returns one multi-row INSERT into file_time_staging
+
+    rows: Rows from staging_row_sql
+    columns: The columns the rows hold
+    """
+    return ("INSERT INTO file_time_staging " + columns + " VALUES\n" +
+            ",\n".join(rows) + ";")
+
+
+def staging_copy_sql(csv_name):
+    """
+    Returns the psql \\copy command loading a staging CSV
+    """
+    return ("\\copy file_time_staging FROM '" + csv_name +
+            "' WITH (FORMAT csv, HEADER true)")
+
+
+STAGING_CSV_HEADER = "cruise_id,filename,start_time"
+
+
+def staging_csv_row(filedate, filename, cruise):
+    """
+    Returns one line of a staging CSV, without the newline
+    """
+    if '"' in filename or ',' in filename:
+        filename = '"' + filename.replace('"', '""') + '"'
+    return cruise + ',' + filename + ',' + format_file_time(filedate)
+
+
+def write_staging_csv(csv_path, file_dates, cruise, file_ends=None):
+    """
+    Writes file start times as a CSV for COPY into file_time_staging
+
+    csv_path: The path of the CSV to write
+    file_dates: (start date, filename) pairs
+    cruise: The cruise ID
+    file_ends: The end date of each of file_dates, written as an end_time
+        column, empty (NULL) for an unknown end
+    """
+    f = open(csv_path, "w")
+    if file_ends is None:
+        f.write(STAGING_CSV_HEADER + "\n")
+        for filedate, filename in file_dates:
+            f.write(staging_csv_row(filedate, filename, cruise) + '\n')
+    else:
+        f.write(STAGING_CSV_HEADER + ",end_time\n")
+        for (filedate, filename), enddate in zip(file_dates, file_ends):
+            f.write(staging_csv_row(filedate, filename, cruise) + ',' +
+                    ('' if enddate is None else format_file_time(enddate)) +
+                    '\n')
+    f.close()
+
+
+def open_sql_writer(cruise, filepattern, output_path="./"):
+    """
+    Returns a SQLFileWriter for a device when SQL is streamed, else None
+
+    cruise: The cruise ID
+    filepattern: The name of the device usually
+    output_path: The directory the SQL is written to, ending in '/'
+    """
+    if stream_order is None:
+        return None
+    return SQLFileWriter(cruise, filepattern, sql_mode, stream_order,
+                         sql_memory_rows, output_path=output_path)
+
+
+def move_streamed(paths, output_path):
+    """
+    Moves the files a SQLFileWriter wrote while parsing into the directory
+    write_result writes to, if they are not there already
+
+    paths: The paths SQLFileWriter.close returned
+    output_path: The directory, ending in '/'
+    """
+    for path in paths:
+        target = output_path + os.path.basename(path)
+        if os.path.abspath(target) != os.path.abspath(path):
+            shutil.move(path, target)
+
+
+# numbers the part files of the SQLFileWriters of this process
+part_numbers = itertools.count()
+
+
+class SQLFileWriter(object):
+    """
+    Writes the <cruise>_<device>.sql file update SQL of one device while
+    it is parsed, in any sql_mode, instead of holding every statement until
+    the device is done. With order "none", rows are written in the order
+    files are parsed. With "date" or "filename", they are sorted with an
+    external merge: runs of memory_rows rows are sorted and spilled to
+    temporary files, then merged into the output on close.
+    The files are written to output_path, which ends in '/'. Until close,
+    each writer writes to part files of its own, as the ADCP directories
+    of a Blue Heron cruise stream to the same file and may be parsed at
+    the same time.
+    """
+
+    def __init__(self, cruise, filepattern, sql_mode="line", order="date",
+                 memory_rows=100000, batch_size=1000, output_path="./"):
+        self.cruise = cruise
+        self.sql_mode = sql_mode
+        self.order = order
+        self.memory_rows = memory_rows
+        self.batch_size = batch_size
+        self.sql_path = output_path + cruise + '_' + filepattern + ".sql"
+        self.csv_name = cruise + '_' + filepattern + "_staging.csv"
+        self.csv_path = output_path + self.csv_name
+        self.count = 0
+        self.rows = []
+        self.runs = []
+        self.batch = []
+        self.sql_part, self.sql_file = open_part(self.sql_path)
+        self.csv_file = None
+        if sql_mode == "copy":
+            self.csv_part, self.csv_file = open_part(self.csv_path)
+            self.csv_file.write(STAGING_CSV_HEADER + "\n")
+        if sql_mode != "line":
+            self.sql_file.write(STAGING_CREATE_SQL + "\n")
+        if sql_mode == "copy":
+            self.sql_file.write(staging_copy_sql(self.csv_name) + "\n")
+
+    def add(self, filedate, filename):
+        """
+        Adds the start time of one file
+
+        filedate: The parsed start date
+        filename: The name of the file
+        """
+        self.count += 1
+        if self.sql_mode == "values":
+            row = staging_row_sql(filedate, filename, self.cruise)
+        elif self.sql_mode == "copy":
+            row = staging_csv_row(filedate, filename, self.cruise)
+        else:
+            row = file_time_sql(filedate, self.cruise, filename)
+        if self.order == "none":
+            self._emit(row)
+            return
+        if self.order == "filename":
+            key = filename
+        else:
+            key = format_file_time(filedate) + '\x01' + filename
+        # the key and row are kept as one string; '\0' sorts before every
+        # other character, so sorting the strings sorts by key
+        self.rows.append(key + '\0' + row)
+        if len(self.rows) >= self.memory_rows:
+            self._spill()
+
+    def _spill(self):
+        self.rows.sort()
+        run = tempfile.TemporaryFile(mode="w+")
+        for each in self.rows:
+            run.write(each + '\n')
+        run.seek(0)
+        self.runs.append(run)
+        self.rows = []
+
+    def _emit(self, row):
+        if self.sql_mode == "values":
+            self.batch.append(row)
+            if len(self.batch) >= self.batch_size:
+                self.sql_file.write(staging_insert_sql(self.batch) + "\n")
+                self.batch = []
+        elif self.sql_mode == "copy":
+            self.csv_file.write(row + "\n")
+        else:
+            self.sql_file.write(row + "\n")
+
+    def close(self):
+        """
+        Writes out any held rows, moves the finished files into place and
+        returns their paths
+        """
+        if self.runs:
+            self._spill()
+            merged = heapq.merge(*[(line.rstrip('\n') for line in run)
+                                   for run in self.runs])
+        else:
+            self.rows.sort()
+            merged = self.rows
+        for each in merged:
+            self._emit(each.split('\0', 1)[1])
+        if self.batch:
+            self.sql_file.write(staging_insert_sql(self.batch) + "\n")
+        if self.sql_mode != "line":
+            self.sql_file.write(STAGING_UPDATE_SQL + "\n")
+            self.sql_file.write(STAGING_DROP_SQL + "\n")
+        self._close_files()
+        replace_file(self.sql_part, self.sql_path)
+        if self.csv_file is None:
+            return [self.sql_path]
+        replace_file(self.csv_part, self.csv_path)
+        return [self.sql_path, self.csv_path]
+
+    def discard(self):
+        """
+        Closes the writer and removes everything it wrote
+        """
+        self._close_files()
+        os.remove(self.sql_part)
+        if self.csv_file is not None:
+            os.remove(self.csv_part)
+
+    def _close_files(self):
+        for run in self.runs:
+            run.close()
+        self.runs = []
+        self.rows = []
+        self.batch = []
+        self.sql_file.close()
+        if self.csv_file is not None:
+            self.csv_file.close()
+
+
+def open_part(path):
+    """
+    Returns (part path, file) of a new part file next to path, named by
+    the process and a count of its part files, so no other writer has it
+    """
+    part = "{0}.{1}-{2}.part".format(path, os.getpid(), next(part_numbers))
+    return part, open(part, "w", 1 << 16)
+
+
+def replace_file(part, path):
+    """
+    Moves a finished part file to path, replacing any file there
+    """
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)
+    os.rename(part, path)
+
+
 def generate_cruise_startend_sql(mindate, maxdate, cruise):
     """
     Generates cruise date range SQL
@@ -479,12 +1582,7 @@ def regex_identifier(cruise, filepattern=''):
     cruise: The cruise ID
     filepattern: Usually the device type
     """
-    if filepattern == "multibeam":
-        return re.compile(r'\w+.all$')
-    else:
-        ship_abbreviation = get_ship_abbreviation(cruise)
-        regex = regex_by_cruise[ship_abbreviation]
-        return re.compile(regex)
+    return cruise_profile(cruise).regex_for(filepattern)
 
 
 def find_path(cruise_prefix):
@@ -493,30 +1591,4 @@ def find_path(cruise_prefix):
 
     cruise_prefix: Prefix of vessel name
     """
-
-    cruise_path = path_identifier[cruise_prefix]
-    SI_path = "/data/SerialInstruments"
-    if cruise_prefix == "HLY":
-        SI_path = "/data/sensor/serial_logger"
-    elif cruise_prefix == "OC":
-        SI_path = "/das"
-    elif cruise_prefix == "SKQ":
-        SI_path = "/lds/raw"
-    elif cruise_prefix == "SP":
-        SI_path = "/SerialInstruments"
-    elif cruise_prefix == "TN":
-        SI_path = "/scs"
-
-    return SI_path
-
-
-def get_ship_abbreviation(cruise):  # returns 2-letter ship ID
-    ship_abbreviation = ''
-
-    for char in cruise: # iterates through cruise ID
-        if char.isdigit() is False: # appends letters
-            ship_abbreviation = ship_abbreviation + char
-        else: # ignores digits
-            break
-
-    return ship_abbreviation
+    return ship_profile(cruise_prefix).instrument_path
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+"""
+This program contains the compiled filename parsers used to read file start
+dates. Every supported filename format is one named-group regex, and a
+parser is picked once per directory from the ship profile (shipProfiles),
+so the per-file work is a single regex match and one datetime construction.
+When NumPy is installed, parse_batch converts a whole directory at once
+into datetime64 arrays instead.
+"""
+
+import re
+import datetime
+
+# NumPy is imported by load_numpy on first use, so that importing the
+# parsers stays cheap for callers that never batch
+numpy = None
+_numpy_checked = False
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+
+class FilenameParser(object):
+    """
+    Reads the start date of a file from its name with one compiled regex.
+    The regex groups must be year, month, day, hour, minute and optionally
+    second, in that order, and each must match digits only.
+    """
+
+    def __init__(self, name, pattern):
+        self.name = name
+        self.regex = re.compile(pattern)
+        self.match = self.regex.match
+
+    def parse(self, filename):
+        """
+        Returns the start date of a file, or None if the name does not match
+
+        filename: The name of the file
+        """
+        m = self.match(filename)
+        if m is None:
+            return None
+        try:
+            return datetime.datetime(*map(int, m.groups()))
+        except ValueError:  # digits in place but not a real date
+            return None
+
+    def parse_batch(self, filenames):
+        """
+        Returns (names, stamps) for every matching file, where stamps is a
+        datetime64[s] NumPy array in the same order as names. Names that
+        do not match or are not real dates are dropped, like parse does.
+
+        filenames: The names of the files, any iterable
+        """
+        load_numpy()
+        names, fields = self._match_all(filenames)
+        if not names:
+            return names, numpy.array([], dtype='datetime64[s]')
+        if fields.shape[1] == 5:  # no seconds in the name
+            fields = numpy.column_stack(
+                (fields, numpy.zeros(len(names), dtype=numpy.int64)))
+        year, month, day, hour, minute, second = fields.T
+        months = ((year - 1970) * 12 + (month - 1)).astype('datetime64[M]')
+        stamps = (months.astype('datetime64[D]')
+                  + (day - 1).astype('timedelta64[D]')).astype('datetime64[s]')
+        stamps = stamps + (hour * 3600 + minute * 60 + second).astype('timedelta64[s]')
+        # day 31 of a 30 day month rolls into the next month, so check the
+        # month survived along with the plain field ranges; years are those
+        # datetime takes, as stamps.min() of year 0 is no datetime
+        valid = ((year >= 1) & (year <= 9999) & (month >= 1) & (month <= 12)
+                 & (day >= 1) & (hour < 24) & (minute < 60) & (second < 60)
+                 & (stamps.astype('datetime64[M]') == months))
+        return _keep(names, stamps, valid)
+
+    def _match_all(self, filenames):
+        """
+        Returns the matching names and an int64 array of their fields. The
+        digits of each name are packed into one fixed-width byte string so
+        the conversion to integers happens on the whole array at once. A
+        profile's pattern may have groups of varying width, and then each
+        field is converted on its own.
+        """
+        match = self.match
+        names = []
+        matched = []
+        widths = None
+        fixed = True
+        for filename in filenames:
+            m = match(filename)
+            if m is not None:
+                groups = m.groups()
+                if widths is None:
+                    widths = tuple(map(len, groups))
+                elif fixed and tuple(map(len, groups)) != widths:
+                    fixed = False
+                names.append(filename)
+                matched.append(groups)
+        if not names:
+            return names, None
+        if not fixed:
+            return names, numpy.array(
+                [[int(group) for group in groups] for groups in matched],
+                dtype=numpy.int64)
+        digits = [''.join(groups) for groups in matched]
+        width = sum(widths)
+        chars = numpy.array(digits, dtype='S%d' % width).view(
+            numpy.uint8).reshape(len(names), width).astype(numpy.int64) - 48
+        fields = numpy.empty((len(names), len(widths)), dtype=numpy.int64)
+        offset = 0
+        for column, group_width in enumerate(widths):
+            value = numpy.zeros(len(names), dtype=numpy.int64)
+            for i in range(offset, offset + group_width):
+                value = value * 10 + chars[:, i]
+            fields[:, column] = value
+            offset += group_width
+        return names, fields
+
+
+class JulianFilenameParser(FilenameParser):
+    """
+    Reads start dates of the form [yy]_[day of year]_[second of day]
+    """
+
+    def parse(self, filename):
+        m = self.match(filename)
+        if m is None:
+            return None
+        year, yday, second = map(int, m.groups())
+        if yday < 1 or yday > 366:
+            return None
+        year += 1900 if year >= 69 else 2000  # same pivot as strptime('%y')
+        return (datetime.datetime(year, 1, 1)
+                + datetime.timedelta(days=yday - 1, seconds=second))
+
+    def parse_batch(self, filenames):
+        load_numpy()
+        names, fields = self._match_all(filenames)
+        if not names:
+            return names, numpy.array([], dtype='datetime64[s]')
+        year, yday, second = fields.T
+        year = year + numpy.where(year >= 69, 1900, 2000)
+        years = (year - 1970).astype('datetime64[Y]')
+        stamps = (years.astype('datetime64[D]')
+                  + (yday - 1).astype('timedelta64[D]')).astype('datetime64[s]')
+        stamps = stamps + second.astype('timedelta64[s]')
+        valid = (yday >= 1) & (yday <= 366)
+        return _keep(names, stamps, valid)
+
+
+def load_numpy():
+    """
+    Imports NumPy the first time it is needed and returns it, or None if
+    it is not installed
+    """
+    global numpy, _numpy_checked
+    if not _numpy_checked:
+        _numpy_checked = True
+        try:
+            import numpy as numpy_module
+        except ImportError:
+            numpy_module = None
+        numpy = numpy_module
+    return numpy
+
+
+def _keep(names, stamps, valid):
+    """
+    Drops the names and stamps where valid is False
+    """
+    if valid.all():
+        return names, stamps
+    return [n for n, ok in zip(names, valid) if ok], stamps[valid]
+
+
+# [id]_[yyyymmdd]_[hhmmss]_[...].all
+MULTIBEAM = FilenameParser(
+    "multibeam",
+    r'^[^_]*_(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})'
+    r'_(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})')
+
+# [device]_[yyyymmdd]...-[hhmmss]...
+DATE_DASH_TIME = FilenameParser(
+    "date-time",
+    r'^[^_]*_(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2}).*'
+    r'-(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})[^-]*$')
+
+# [device].[yyyymmdd]T[hhmm]Z
+SKQ = FilenameParser(
+    "skq",
+    r'^[^.]*\.(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})'
+    r'T(?P<hour>\d{2})(?P<minute>\d{2})')
+
+# [device]_[yyyymmddhhmmss]
+DEFAULT = FilenameParser(
+    "default",
+    r'^(?:.*_)?(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})'
+    r'(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})[^_]*$')
+
+# [device]_[yyyymmdd]-[hhmm].Raw in Rachel Carson scs directories
+RC_SCS = FilenameParser(
+    "rc-scs",
+    r'^[^_]*_(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})'
+    r'-(?P<hour>\d{2})(?P<minute>\d{2})')
+
+# gp90[yy]_[ddd]_[sssss] in Blue Heron ADCP directories
+BH_GP90 = JulianFilenameParser(
+    "bh-gp90",
+    r'^.{4}(?P<year>\d{2})_(?P<yday>\d{3})_(?P<second>\d{5})')
+
+# parsers ship profiles can name
+parsers_by_name = dict((parser.name, parser) for parser in (
+    MULTIBEAM, DATE_DASH_TIME, SKQ, DEFAULT, RC_SCS, BH_GP90))
+
+
+def make_parser(pattern, fields="calendar"):
+    """
+    Returns a parser for a filename format described by a ship profile
+
+    pattern: The regex, whose groups are the digits of the timestamp
+        fields in order
+    fields: "calendar" for year, month, day, hour, minute and optionally
+        second, "julian" for two digit year, day of year and second of day
+    """
+    if fields == "julian":
+        return JulianFilenameParser("julian:" + pattern, pattern)
+    if fields == "calendar":
+        return FilenameParser("calendar:" + pattern, pattern)
+    raise ValueError("Unknown timestamp fields {0}".format(fields))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+This program contains the run-scoped date range aggregator. Device date
+ranges are collected in memory as results are written, which is in the
+parent process even for parallel runs, and each cruise's dateranges CSV is
+written once at the end of the run instead of being opened and appended to
+for every device. The whole run can also go to one combined CSV, or to a
+Parquet file when pyarrow is installed.
+"""
+
+import os
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+CSV_HEADER = "cruise,devicetype,start_date,end_date\n"
+
+
+def csv_line(cruise, device, mindate, maxdate):
+    """
+    Returns one dateranges CSV line
+    """
+    return '{0},{1},{2},{3}\n'.format(cruise, device, mindate, maxdate)
+
+
+def append_csv(csv_path, lines, header=CSV_HEADER):
+    """
+    Appends lines to a dateranges CSV in one write, with the header first
+    if the file is new or empty
+
+    csv_path: The CSV file
+    lines: The CSV lines, newline terminated
+    header: The header line of a new file
+    """
+    f = open(csv_path, "a")
+    try:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            lines = [header] + list(lines)
+        f.write("".join(lines))
+    finally:
+        f.close()
+
+
+class RangeAggregator(object):
+    """
+    Device date ranges of one run, grouped by dateranges CSV
+
+    combined_path: Also writes every range of the run to this file, a
+        Parquet file if it ends in .parquet, else a CSV
+    """
+
+    def __init__(self, combined_path=None):
+        self.combined_path = combined_path
+        self.csv_paths = []
+        self.rows = {}
+
+    def add(self, csv_path, cruise, device, mindate, maxdate):
+        """
+        Collects the range of one device for a dateranges CSV
+        """
+        rows = self.rows.get(csv_path)
+        if rows is None:
+            rows = self.rows[csv_path] = []
+            self.csv_paths.append(csv_path)
+        rows.append((cruise, device, mindate, maxdate))
+
+    def write(self):
+        """
+        Writes every CSV collected so far, each once, and the combined file
+        """
+        for csv_path in self.csv_paths:
+            append_csv(csv_path, [csv_line(*row) for row in self.rows[csv_path]])
+        if self.combined_path is not None:
+            rows = [row for csv_path in self.csv_paths
+                    for row in self.rows[csv_path]]
+            if self.combined_path.endswith(".parquet"):
+                write_parquet(self.combined_path, rows)
+            else:
+                append_csv(self.combined_path, [csv_line(*row) for row in rows])
+        self.csv_paths = []
+        self.rows = {}
+
+
+def load_pyarrow():
+    """
+    Imports pyarrow with its Parquet writer and returns it, or None if it
+    is not installed
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def write_parquet(parquet_path, rows):
+    """
+    Writes (cruise, device, mindate, maxdate) rows to a Parquet file
+
+    parquet_path: The Parquet file
+    rows: The ranges
+    """
+    pyarrow = load_pyarrow()
+    if pyarrow is None:
+        raise ImportError("Writing {0} needs pyarrow".format(parquet_path))
+    columns = list(zip(*rows)) if rows else [[], [], [], []]
+    table = pyarrow.Table.from_arrays(
+        [pyarrow.array(list(columns[0]), pyarrow.string()),
+         pyarrow.array(list(columns[1]), pyarrow.string()),
+         pyarrow.array(list(columns[2]), pyarrow.timestamp('us')),
+         pyarrow.array(list(columns[3]), pyarrow.timestamp('us'))],
+        names=["cruise", "devicetype", "start_date", "end_date"])
+    pyarrow.parquet.write_table(table, parquet_path)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+"""
+This program contains the compact store of the parsed file start times of
+one device, which DeviceResult holds instead of a list of (datetime,
+filename) pairs. Start times are kept as an array of whole seconds since
+1970, and each filename is split where its first digit is, into a prefix
+such as "gps_" that is stored once per device and a suffix appended to
+one byte buffer. A file costs 11 bytes plus its suffix, against the 200
+or so of a tuple, a datetime and a filename string, and the 180 more of
+a line of SQL, so a whole ship's results fit in one process.
+
+The store reads like the list it replaces: it iterates, indexes and
+slices as (datetime, filename) pairs, made as they are read, so the SQL,
+CSV and database sink output is rendered from it lazily.
+"""
+
+import re
+import datetime
+from array import array
+try:
+    from itertools import izip as zip
+except ImportError:  # Python 3 zip is already lazy
+    pass
+from manifestCache import EPOCH, to_seconds, from_seconds
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+# 64 bit signed ints; Python 2 arrays have no 'q', but its 'l' is 64 bit
+# on the 64 bit Linux the parsers run on
+try:
+    SECONDS_TYPE = 'q'
+    array(SECONDS_TYPE)
+except ValueError:
+    SECONDS_TYPE = 'l'
+
+# a filename's prefix is everything before its first digit
+PREFIX_REGEX = re.compile(r'^\D*')
+
+# suffixes are separated with a character no filename holds
+SEPARATOR = b'/'
+
+if bytes is str:  # Python 2 filenames are already bytes
+    def encode(name):
+        return name
+
+    def decode(data):
+        return data
+else:
+    def encode(name):
+        return name.encode('utf-8', 'surrogateescape')
+
+    def decode(data):
+        return data.decode('utf-8', 'surrogateescape')
+
+
+class FileDates(object):
+    """
+    (start date, filename) pairs of one device, in the order they were
+    added
+
+    pairs: The pairs to store, any iterable
+    """
+
+    __slots__ = ('seconds', 'prefix_ids', 'prefixes', 'suffixes',
+                 '_prefix_index', '_offsets')
+
+    def __init__(self, pairs=()):
+        self.seconds = array(SECONDS_TYPE)
+        self.prefix_ids = array('H')
+        self.prefixes = []
+        self.suffixes = bytearray()  # each suffix followed by SEPARATOR
+        self._prefix_index = {}
+        self._offsets = None  # start of each suffix in suffixes, made on use
+        for filedate, filename in pairs:
+            self.append(filedate, filename)
+
+    @classmethod
+    def from_seconds_pairs(cls, pairs):
+        """
+        Returns the FileDates of (seconds since 1970, filename) pairs, such
+        as the int64 stamps of a NumPy batch parse, without making datetimes
+
+        pairs: The pairs to store, any iterable
+        """
+        stored = cls()
+        append_seconds = stored.append_seconds
+        for seconds, filename in pairs:
+            append_seconds(seconds, filename)
+        return stored
+
+    def append(self, filedate, filename):
+        """
+        Adds the start date of one file
+
+        filedate: The parsed start date
+        filename: The name of the file
+        """
+        self.append_seconds(to_seconds(filedate), filename)
+
+    def append_seconds(self, seconds, filename):
+        """
+        Adds the start time of one file as whole seconds since 1970
+
+        seconds: The start time
+        filename: The name of the file
+        """
+        prefix = PREFIX_REGEX.match(filename).group()
+        prefix_id = self._prefix_index.get(prefix)
+        if prefix_id is None:
+            if len(self.prefixes) == 65535:  # the limit of the 'H' array
+                self._widen_prefix_ids()
+            prefix_id = self._prefix_index[prefix] = len(self.prefixes)
+            self.prefixes.append(prefix)
+        self.seconds.append(seconds)
+        self.prefix_ids.append(prefix_id)
+        self.suffixes += encode(filename[len(prefix):])
+        self.suffixes += SEPARATOR
+        self._offsets = None
+
+    def extend(self, pairs):
+        """
+        Adds the start date of each file of (start date, filename) pairs
+        """
+        for filedate, filename in pairs:
+            self.append(filedate, filename)
+
+    def sort(self):
+        """
+        Sorts the files by start time, then filename, as sorting the list
+        of pairs would, without making datetimes
+        """
+        pairs = list(self.seconds_pairs())
+        ordered = sorted(pairs)
+        if ordered != pairs:
+            self.__setstate__(
+                FileDates.from_seconds_pairs(ordered).__getstate__())
+
+    def _widen_prefix_ids(self):
+        """
+        Moves prefix_ids to an array that holds more than 65535 prefixes
+        """
+        if self.prefix_ids.typecode == 'H':
+            self.prefix_ids = array('l', self.prefix_ids)
+
+    def _suffix_offsets(self):
+        """
+        Returns the start of every suffix in suffixes, with the end of
+        the buffer last
+        """
+        if self._offsets is None:
+            offsets = array('l', [0])
+            start = 0
+            find = self.suffixes.find
+            for i in range(len(self.seconds)):
+                start = find(SEPARATOR, start) + 1
+                offsets.append(start)
+            self._offsets = offsets
+        return self._offsets
+
+    def filename(self, i):
+        """
+        Returns the name of file i
+        """
+        offsets = self._suffix_offsets()
+        return (self.prefixes[self.prefix_ids[i]] +
+                decode(bytes(self.suffixes[offsets[i]:offsets[i + 1] - 1])))
+
+    def filenames(self):
+        """
+        Yields the name of every file, in order, reading the suffixes one
+        at a time
+        """
+        prefixes = self.prefixes
+        suffixes = self.suffixes
+        find = suffixes.find
+        start = 0
+        for prefix_id in self.prefix_ids:
+            end = find(SEPARATOR, start)
+            yield prefixes[prefix_id] + decode(bytes(suffixes[start:end]))
+            start = end + 1
+
+    def seconds_pairs(self):
+        """
+        Yields (seconds since 1970, filename) of every file, in order,
+        without making datetimes
+        """
+        return zip(self.seconds, self.filenames())
+
+    def __len__(self):
+        return len(self.seconds)
+
+    def __iter__(self):
+        # from_seconds, inlined with a positional timedelta, which is faster
+        timedelta = datetime.timedelta
+        for seconds, filename in self.seconds_pairs():
+            yield EPOCH + timedelta(0, seconds), filename
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return from_seconds(self.seconds[index]), self.filename(index)
+
+    def __getstate__(self):
+        return (self.seconds, self.prefix_ids, self.prefixes, self.suffixes)
+
+    def __setstate__(self, state):
+        self.seconds, self.prefix_ids, self.prefixes, self.suffixes = state
+        self._prefix_index = dict((prefix, i)
+                                  for i, prefix in enumerate(self.prefixes))
+        self._offsets = None
+
+
+def seconds_pairs(file_dates):
+    """
+    Returns (seconds since 1970, filename) of each file of a FileDates,
+    without making datetimes, or of a list of (start date, filename) pairs
+
+    file_dates: The FileDates or list
+    """
+    if isinstance(file_dates, FileDates):
+        return file_dates.seconds_pairs()
+    return ((to_seconds(filedate), filename)
+            for filedate, filename in file_dates)
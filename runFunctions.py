@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+"""
+This program contains functions for running date parses over many
+(cruise, device) units at once. Units are listed and parsed in a pool of
+worker processes, while every write to the SQL and CSV logs stays in the
+calling process and happens in unit order, so the output of a parallel
+run matches the output of a serial one.
+"""
+
+import multiprocessing
+import traceback
+import logFunctions
+import parseFunctions
+import scanFunctions
+from parseFunctions import (list_units, parse_unit, write_result, log,
+                            daterange2csv, gap_lines2csv,
+                            generate_cruise_startend_sql, logger, say,
+                            WORKER_SETTINGS)
+from logFunctions import setup_logging
+from stageProfile import StageProfile, clock
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+
+def worker_settings():
+    """
+    Returns the parseFunctions settings of the run, and the archives -t
+    mounted, for init_worker. Workers started with spawn (the default on
+    macOS and Windows) or forkserver import parseFunctions afresh and
+    would otherwise parse with its defaults and no archives, whatever the
+    flags of the run.
+    """
+    settings = dict((name, getattr(parseFunctions, name))
+                    for name in WORKER_SETTINGS)
+    # the profile stays in the calling process; workers only need to know
+    # to time their units
+    settings["stage_profile"] = parseFunctions.stage_profile is not None
+    settings["log_settings"] = logFunctions.log_settings
+    # the -t archives, mounted as they were read, so workers need not read
+    # every archive again
+    settings["mounts"] = dict(scanFunctions.mounts)
+    return settings
+
+
+def init_worker(settings):
+    """
+    Pool initializer giving a worker process the settings of the run
+
+    settings: From worker_settings
+    """
+    settings = dict(settings)
+    log_settings = settings.pop("log_settings")
+    if log_settings is not None:
+        setup_logging(*log_settings)  # does nothing in a forked worker
+    if settings.pop("stage_profile"):
+        parseFunctions.stage_profile = StageProfile()
+    scanFunctions.mounts.update(settings.pop("mounts"))
+    for name, value in settings.items():
+        setattr(parseFunctions, name, value)
+
+
+def list_cruise_units(args):
+    """
+    Pool wrapper around list_units taking its arguments as one tuple
+
+    args: The list_units arguments
+    """
+    return list_units(*args)
+
+
+def list_cruise_units_checked(args):
+    """
+    list_cruise_units returning (args, units, error) instead of raising, so
+    a cruise that cannot be listed is set aside without stopping the run.
+    error is the traceback, or None.
+
+    args: The list_units arguments
+    """
+    try:
+        return args, list_cruise_units(args), None
+    except Exception:
+        return args, [], traceback.format_exc()
+
+
+def listed_units(listed):
+    """
+    Returns the shard_units of a list_cruise_units_checked cruise, or
+    records it in the run journal as failed and returns none
+
+    listed: The (args, units, error) of list_cruise_units_checked
+    """
+    args, units, error = listed
+    if error is None:
+        return shard_units(units)
+    cruise, path, SI_path = args[0], args[1], args[5]
+    logger.error("Failed to list cruise {0}:\n{1}".format(cruise, error))
+    say("FAILED CRUISE {0}, set aside".format(cruise))
+    if parseFunctions.journal is not None:
+        parseFunctions.journal.fail_unit(("", cruise, path, "*", SI_path),
+                                         error)
+    return []
+
+
+def shard_units(units):
+    """
+    Returns the units of the run's shard, if it is one, else all of them
+
+    units: The units of one cruise from list_units
+    """
+    if parseFunctions.shard_output is not None:
+        return parseFunctions.shard_output.select(units)
+    return units
+
+
+def is_finished(unit):
+    """
+    Returns True if the run journal records the unit as finished, so it is
+    not parsed again. With -u every unit is parsed again, as the overlap
+    check needs the file dates of all of them, which the journal does not
+    keep
+    """
+    journal = parseFunctions.journal
+    return (journal is not None and parseFunctions.overlap_check is None
+            and journal.is_finished(unit))
+
+
+def finished_unit(unit):
+    """
+    Returns the (unit, results, error) write_unit takes for a finished
+    unit, whose results are None
+    """
+    return unit, None, None
+
+
+def check_unit(unit):
+    """
+    Returns parse_unit_checked of a unit, or finished_unit if the run
+    journal records it as finished
+    """
+    if is_finished(unit):
+        return finished_unit(unit)
+    return parse_unit_checked(unit)
+
+
+def parse_unit_checked(unit, listing=None):
+    """
+    parse_unit returning (unit, results, error) instead of raising, so a
+    unit that fails is set aside without stopping the run. error is the
+    traceback, or None.
+
+    unit: A unit from list_units
+    listing: Passed on to parse_unit
+    """
+    try:
+        return unit, parse_unit(unit, listing), None
+    except Exception:
+        return unit, [], traceback.format_exc()
+
+
+def write_unit(checked, csvlog, datelog, filelog):
+    """
+    Writes the results of one parse_unit_checked unit and records it in
+    the run journal, or records it as failed. A finished_unit has its date
+    ranges written again by replay_unit instead.
+
+    checked: The (unit, results, error) of parse_unit_checked
+    csvlog, datelog, filelog: As for write_result
+    """
+    unit, results, error = checked
+    if results is None:
+        replay_unit(unit, csvlog, datelog, filelog)
+        return
+    journal = parseFunctions.journal
+    shard_output = parseFunctions.shard_output
+    if error is not None:
+        logger.error("Failed to parse cruise {0} device {1}:\n{2}".format(
+            unit[1], unit[3], error))
+        say("FAILED CRUISE {0} DEVICE {1}, set aside".format(unit[1], unit[3]))
+        if shard_output is not None:
+            shard_output.fail_unit(unit, error)
+        if journal is not None:
+            journal.fail_unit(unit, error)
+        return
+    if shard_output is not None:
+        shard_output.add_unit(unit, results)
+    else:
+        for result in results:
+            write_result(result, csvlog, datelog, filelog)
+    if journal is not None:
+        journal.finish_unit(unit, results)
+
+
+def replay_unit(unit, csvlog, datelog, filelog):
+    """
+    Writes again the date ranges of a unit the run journal records as
+    finished, in its place in the run: to the dateranges CSVs and as the
+    cruise range SQL, which each device of a cruise replaces, along with
+    its -G gap report lines. A resumed run then writes them in the same
+    order as a run that was never stopped. The unit's file update SQL was
+    written by the run that parsed it.
+
+    unit: The finished unit
+    csvlog, datelog, filelog: As for write_result
+    """
+    if parseFunctions.shard_output is not None:
+        return  # the shard's partial kept the unit's results
+    db_sink = parseFunctions.db_sink
+    for cruise, device, mindate, maxdate in \
+            parseFunctions.journal.unit_ranges(unit):
+        if csvlog or (not filelog and not csvlog and not datelog):
+            daterange2csv(cruise, device, mindate, maxdate)
+        if datelog and db_sink is not None:
+            db_sink.apply_cruise_range(cruise, mindate, maxdate)
+        elif datelog:
+            log(False, device, datelog, mindate, maxdate, [],
+                generate_cruise_startend_sql(mindate, maxdate, cruise),
+                cruise)
+    for cruise, device, lines in parseFunctions.journal.unit_gaps(unit):
+        gap_lines2csv(cruise, lines)
+
+
+def run_units(cruise_args, csvlog, datelog, filelog, jobs=1):
+    """
+    Lists and parses the units of every cruise, then writes the results
+
+    cruise_args: A list of list_units argument tuples, one per cruise
+    csvlog: True if logging dates to csv log file, false otherwise
+    datelog: True if creating SQL of min/max cruise range, false otherwise
+    filelog: True if logging SQL to files, false otherwise
+    jobs: The number of worker processes, 1 runs everything in process
+    """
+    try:
+        if jobs <= 1:
+            for args in cruise_args:
+                for unit in listed_units(list_cruise_units_checked(args)):
+                    write_unit(check_unit(unit), csvlog, datelog, filelog)
+            return
+
+        pool = multiprocessing.Pool(jobs, init_worker, (worker_settings(),))
+        try:
+            units = []
+            for listed in pool.imap(list_cruise_units_checked,
+                                    cruise_args):
+                units.extend(listed_units(listed))
+            finished = [is_finished(unit) for unit in units]
+            # imap hands results back in unit order, so writes are deterministic
+            parsed = pool.imap(parse_unit_checked,
+                               [unit for unit, done in zip(units, finished)
+                                if not done])
+            for unit, done in zip(units, finished):
+                checked = finished_unit(unit) if done else next(parsed)
+                write_unit(checked, csvlog, datelog, filelog)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        finish_run()
+
+
+def finish_run():
+    """
+    Saves and closes what a run writes to besides its results, even after
+    a failure part way. Every step is run even if one fails, and the first
+    failure is raised once they all have been.
+    """
+    error = None
+    for step in (finish_overlaps, finish_journal, write_ranges,
+                 save_manifest, close_inventory, close_db_sink,
+                 finish_profile):
+        try:
+            step()
+        except Exception as e:
+            logger.error("Failed to finish the run:\n{0}".format(
+                traceback.format_exc()))
+            say("FAILED: {0}".format(e))
+            if error is None:
+                error = e
+    if error is not None:
+        raise error
+
+
+def finish_overlaps():
+    check = parseFunctions.overlap_check
+    if check is not None:
+        parseFunctions.overlap_check = None  # so write_result writes again
+        check.finish(write_result)
+
+
+def finish_journal():
+    journal = parseFunctions.journal
+    if journal is not None:
+        journal.flush_held()  # the held results are written now
+        if journal.failed:
+            say("{0} units failed and were set aside, see {1}".format(
+                len(journal.failed), journal.journal_path))
+        journal.close()
+
+
+def write_ranges():
+    if parseFunctions.range_aggregator is not None:
+        begin = clock()
+        parseFunctions.range_aggregator.write()
+        if parseFunctions.stage_profile is not None:
+            # the dateranges CSVs of the whole run are written at once
+            parseFunctions.stage_profile.add("", "", "write",
+                                             clock() - begin)
+
+
+def save_manifest():
+    # workers only read the manifest; their entries come back with the
+    # results and are saved here
+    if parseFunctions.manifest is not None:
+        parseFunctions.manifest.save()
+
+
+def close_inventory():
+    if parseFunctions.inventory is not None:
+        parseFunctions.inventory.close()
+
+
+def close_db_sink():
+    if parseFunctions.db_sink is not None:
+        parseFunctions.db_sink.retry_failed()
+        parseFunctions.db_sink.close()
+        parseFunctions.say(parseFunctions.db_sink.summary())
+
+
+def finish_profile():
+    if parseFunctions.stage_profile is not None:
+        parseFunctions.stage_profile.finish()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""
+This program contains the run journal, which lets a long run that stopped
+part way be resumed where it stopped. It is only kept by a run made with
+--resume. Every (cruise, device) unit whose results have been written is
+added to ./dateparse_journal.jsonl as one JSON line, flushed to disk
+before the next unit is written, along with the date ranges and -G gap
+report lines it wrote, which the dateranges and gaps CSVs of a resumed run
+need. Units that failed to parse, and cruises that could not be listed (as
+[cruise]/*), are added as failed, with their error, and the run goes on
+without them.
+
+The journal starts with the arguments of its run, and parseDate.py
+--resume only resumes a journal of the same arguments. Finished units are
+not parsed again, but their date ranges are written again in their place
+in the run, to the dateranges CSVs and as the cruise range SQL, and so
+are their gap report lines, so these come out in the same order as in a
+run that was never stopped. Failed units are parsed again, and so is
+every unit of a run with -u, whose overlap check needs the file dates of
+them all. A line cut short by a crash is dropped when the journal is
+read, and the journal is rewritten without it, replacing the old file
+only once the new one is complete.
+"""
+
+import os
+import json
+from manifestCache import to_seconds, from_seconds
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+JOURNAL_NAME = "dateparse_journal.jsonl"
+
+
+def unit_key(unit):
+    """
+    Returns the journal key of a (dateparse_method, cruise, shipment_path,
+    device, SI_path) unit
+    """
+    return unit[1] + "/" + unit[3]
+
+
+class RunJournal(object):
+    """
+    The journal of one run
+
+    args: The run's arguments, without --resume
+    resume: True to carry on the journal of an earlier run of the same
+        arguments, False to start a new one
+    journal_path: The journal file
+    """
+
+    def __init__(self, args, resume=False, journal_path=JOURNAL_NAME):
+        self.journal_path = os.path.abspath(journal_path)
+        self.args = list(args)
+        self.finished = {}  # unit key: [[cruise, device, start, end], ...]
+        self.finished_keys = []  # in the order the units finished
+        self.gaps = {}      # unit key: [[cruise, device, lines], ...]
+        self.failed = {}    # unit key: error
+        self.held = []      # entries waiting for flush_held
+        self.hold = False   # True to hold entries until flush_held
+        if resume and os.path.isfile(self.journal_path):
+            self.load()
+        self.rewrite()
+        self.f = open(self.journal_path, "a")
+
+    def load(self):
+        """
+        Reads the finished and failed units of an earlier run, raising
+        ValueError if it was a run of other arguments
+        """
+        f = open(self.journal_path)
+        try:
+            lines = f.read().split("\n")
+        finally:
+            f.close()
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue  # cut short by a crash, or the last empty line
+        if not entries or entries[0].get("args") != self.args:
+            raise ValueError("{0} is the journal of another run: {1}".format(
+                self.journal_path,
+                " ".join(entries[0].get("args", [])) if entries else ""))
+        for entry in entries[1:]:
+            self.add(entry)
+
+    def add(self, entry):
+        """
+        Adds a journal entry to finished or failed
+        """
+        if entry["status"] == "finished":
+            if entry["unit"] not in self.finished:
+                self.finished_keys.append(entry["unit"])
+            self.finished[entry["unit"]] = entry["ranges"]
+            self.gaps[entry["unit"]] = entry.get("gaps", [])
+            self.failed.pop(entry["unit"], None)
+        else:
+            self.failed[entry["unit"]] = entry["error"]
+
+    def rewrite(self):
+        """
+        Writes the journal anew from what is known, replacing the old file
+        only once the new one is complete
+        """
+        tmp_path = self.journal_path + ".tmp"
+        f = open(tmp_path, "w")
+        try:
+            f.write(json.dumps({"args": self.args}) + "\n")
+            for key in self.finished_keys:
+                f.write(json.dumps({"unit": key, "status": "finished",
+                                    "ranges": self.finished[key],
+                                    "gaps": self.gaps[key]}) + "\n")
+            for key in sorted(self.failed):
+                f.write(json.dumps({"unit": key, "status": "failed",
+                                    "error": self.failed[key]}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        if os.name == 'nt' and os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        os.rename(tmp_path, self.journal_path)
+
+    def append(self, entry):
+        """
+        Adds an entry and appends it to the journal file, or holds it when
+        hold is set
+        """
+        if self.hold:
+            self.held.append(entry)
+            return
+        self.add(entry)
+        self.f.write(json.dumps(entry) + "\n")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def flush_held(self):
+        """
+        Appends the entries held since hold was set
+        """
+        held, self.held, self.hold = self.held, [], False
+        for entry in held:
+            self.append(entry)
+
+    def is_finished(self, unit):
+        return unit_key(unit) in self.finished
+
+    def finish_unit(self, unit, results):
+        """
+        Records a unit whose results have all been written
+
+        unit: The unit
+        results: Its DeviceResults
+        """
+        self.append({"unit": unit_key(unit), "status": "finished",
+                     "ranges": [[result.cruise, result.device,
+                                 to_seconds(result.mindate),
+                                 to_seconds(result.maxdate)]
+                                for result in results],
+                     "gaps": [[result.cruise, result.device,
+                               result.stream_stats.report_lines(
+                                   result.device)]
+                              for result in results
+                              if result.stream_stats is not None]})
+
+    def fail_unit(self, unit, error):
+        """
+        Records a unit that failed to parse
+
+        unit: The unit
+        error: The error message or traceback
+        """
+        self.append({"unit": unit_key(unit), "status": "failed",
+                     "error": error})
+
+    def unit_ranges(self, unit):
+        """
+        Returns (cruise, device, mindate, maxdate) of each result of a
+        finished unit
+        """
+        return [(cruise, device, from_seconds(start), from_seconds(end))
+                for cruise, device, start, end
+                in self.finished[unit_key(unit)]]
+
+    def unit_gaps(self, unit):
+        """
+        Returns (cruise, device, lines) of the gap report of each result of
+        a finished unit run with -G
+        """
+        return [tuple(gaps) for gaps in self.gaps[unit_key(unit)]]
+
+    def close(self):
+        self.f.close()
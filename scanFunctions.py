@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+This program contains the directory enumeration used by the date parsers.
+Entries are read with a single os.scandir pass and are yielded lazily, so
+the file type comes from the directory entry itself instead of one extra
+stat() per file, and filename filters run on the stream as it is read.
+Directories inside a mounted archive (see tarScan) are answered from the
+archive's member names instead of the filesystem.
+"""
+
+import os
+
+try:
+    from os import scandir
+except ImportError:  # Python 2 needs the scandir backport
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+# archive trees standing in for directories, keyed by the absolute path of
+# the directory each replaces; filled by tarScan.mount_archive
+mounts = {}
+
+
+def mounted(path):
+    """
+    Returns (tree, path inside the archive) when path lies in a mounted
+    archive, else None
+
+    path: The directory
+    """
+    if not mounts:
+        return None
+    path = os.path.abspath(path)
+    inner = []
+    while True:
+        tree = mounts.get(path)
+        if tree is not None:
+            return tree, "/".join(reversed(inner))
+        parent, name = os.path.split(path)
+        if parent == path:
+            return None
+        inner.append(name)
+        path = parent
+
+
+def list_entries(path):
+    """
+    Returns the names of every entry of a directory, as os.listdir does
+
+    path: The directory
+    """
+    archived = mounted(path)
+    if archived is not None:
+        files, dirs = archived[0].entries(archived[1])
+        return files + dirs
+    return os.listdir(path)
+
+
+def path_mtime(path):
+    """
+    Returns the mtime of a directory, that of its archive when mounted
+
+    path: The directory
+    """
+    archived = mounted(path)
+    if archived is not None:
+        archived[0].entries(archived[1])  # raises if it is not in the archive
+        return archived[0].mtime
+    return os.stat(path).st_mtime
+
+
+def scan_files(path, regex=None):
+    """
+    Yields the names of the regular files in a directory
+
+    path: The directory to scan
+    regex: Compiled regex names must match (search), or None for all files
+    """
+    archived = mounted(path)
+    if archived is not None:
+        for name in archived[0].entries(archived[1])[0]:
+            if regex is None or regex.search(name):
+                yield name
+        return
+
+    if scandir is None:
+        for name in os.listdir(path):
+            if ((regex is None or regex.search(name))
+                    and os.path.isfile(os.path.join(path, name))):
+                yield name
+        return
+
+    entries = scandir(path)
+    try:
+        for entry in entries:
+            # the regex is cheaper than is_file() on filesystems that do not
+            # report d_type, so it goes first
+            if regex is not None and not regex.search(entry.name):
+                continue
+            try:
+                if entry.is_file():
+                    yield entry.name
+            except OSError:
+                continue
+    finally:
+        close = getattr(entries, 'close', None)
+        if close is not None:
+            close()
+
+
+def scan_dirs(path, regex=None):
+    """
+    Yields the names of the subdirectories of a directory
+
+    path: The directory to scan
+    regex: Compiled regex names must match (search), or None for all
+    """
+    archived = mounted(path)
+    if archived is not None:
+        for name in archived[0].entries(archived[1])[1]:
+            if regex is None or regex.search(name):
+                yield name
+        return
+
+    if scandir is None:
+        for name in os.listdir(path):
+            if ((regex is None or regex.search(name))
+                    and os.path.isdir(os.path.join(path, name))):
+                yield name
+        return
+
+    entries = scandir(path)
+    try:
+        for entry in entries:
+            if regex is not None and not regex.search(entry.name):
+                continue
+            try:
+                if entry.is_dir():
+                    yield entry.name
+            except OSError:
+                continue
+    finally:
+        close = getattr(entries, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+"""
+This program contains the shard mode, which splits one run over several
+independent invocations, on one host or many. parseDate.py --shard i/N
+parses only the (cruise, device) units whose hash falls in shard i of N,
+with a jump consistent hash of the unit key, so every invocation of the
+same run picks the same units without talking to the others, and going
+from N to N + 1 shards moves only 1/(N + 1) of the units.
+
+Instead of the SQL and CSV outputs, a shard writes its results to the
+partial ./dateparse_shard_[i]of[N].jsonl: a header line with the run's
+arguments, then one line per device result holding its date range and
+the start time of every file, in run order, and with --profile the times
+of its stages. The partial is written as [name].tmp and only renamed once
+the shard has finished, and --resume carries on an unfinished one with
+the run journal of the shard.
+
+parseDate.py --merge [partials] checks that the partials are the N shards
+of one run and writes their results through write_result, in the order a
+single run would have, so the .sql, _MINMAX_UPDATE.sql and dateranges CSVs
+are the same as those of an unsharded run with the same arguments.
+"""
+
+import os
+import json
+import heapq
+import hashlib
+import datetime
+import parseFunctions
+from parseFunctions import (DeviceResult, generate_cruise_startend_sql,
+                            write_result, logger, say)
+from runJournal import unit_key
+from resultStore import FileDates
+from gapAnalysis import store_stream
+from shipProfiles import native_strings
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+PARTIAL_NAME = "dateparse_shard_{0}of{1}.jsonl"
+
+# datetimes in partials keep their microseconds, as the placeholder range
+# of a device with no dated files has them
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def parse_shard(spec):
+    """
+    Returns (shard, shards) of an "i/N" shard argument, raising ValueError
+    if it is not one
+    """
+    try:
+        shard, shards = [int(part) for part in spec.split("/")]
+    except ValueError:
+        raise ValueError("--shard takes i/N, not {0}".format(spec))
+    if not 1 <= shard <= shards:
+        raise ValueError("--shard {0}: i must be from 1 to N".format(spec))
+    return shard, shards
+
+
+def shard_name(name, shard, shards):
+    """
+    Returns a file name of one shard, name with [i]of[N] before its
+    extension, for the journal and manifest each shard keeps
+    """
+    base, extension = os.path.splitext(name)
+    return "{0}.{1}of{2}{3}".format(base, shard, shards, extension)
+
+
+def jump_hash(key, buckets):
+    """
+    Returns the bucket, 0 to buckets - 1, of a 64 bit key by the jump
+    consistent hash of Lamping and Veach
+    """
+    bucket, j = -1, 0
+    while j < buckets:
+        bucket = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((bucket + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return bucket
+
+
+def unit_shard(unit, shards):
+    """
+    Returns the shard, 1 to shards, of a (dateparse_method, cruise,
+    shipment_path, device, SI_path) unit. The hash is md5 rather than
+    hash(), which differs between processes.
+    """
+    key = unit_key(unit)
+    if not isinstance(key, bytes):
+        key = key.encode('utf-8', 'surrogateescape')
+    return jump_hash(int(hashlib.md5(key).hexdigest()[:16], 16), shards) + 1
+
+
+def format_date(value):
+    return value.strftime(DATE_FORMAT) if value is not None else None
+
+
+def read_date(value):
+    if value is None:
+        return None
+    return datetime.datetime.strptime(value, DATE_FORMAT)
+
+
+class ShardOutput(object):
+    """
+    The partial output of one shard
+
+    shard, shards: This shard, 1 to shards, and the number of shards
+    args: The run's arguments, without --shard and --resume
+    cruises: The cruises of the run, in order
+    resume: True to carry on the partial of an earlier run of the shard,
+        keeping the results of the units in finished_keys
+    finished_keys: The unit keys the shard's run journal has as finished
+    """
+
+    def __init__(self, shard, shards, args, cruises, resume=False,
+                 finished_keys=()):
+        self.shard = shard
+        self.shards = shards
+        self.partial_path = os.path.abspath(
+            PARTIAL_NAME.format(shard, shards))
+        self.tmp_path = self.partial_path + ".tmp"
+        self.cruises = dict((cruise, index)
+                            for index, cruise in enumerate(cruises))
+        self.positions = {}  # unit key: (cruise index, unit index)
+        self.resumed = resume
+        kept = []
+        if resume:
+            # an unfinished partial, or a finished one whose failed units
+            # are parsed again
+            for path in (self.tmp_path, self.partial_path):
+                if os.path.isfile(path):
+                    kept = self.finished_lines(path, set(finished_keys))
+                    break
+        self.f = open(self.tmp_path, "w")
+        self.f.write(json.dumps({"shard": shard, "shards": shards,
+                                 "args": list(args)}) + "\n")
+        self.f.writelines(kept)
+        self.f.flush()
+
+    def finished_lines(self, path, finished_keys):
+        """
+        Returns the result lines of an earlier partial of the shard of the
+        units the journal has as finished. Lines of a unit cut short by a
+        crash, and of units that failed, are parsed again.
+        """
+        f = open(path)
+        try:
+            lines = f.read().split("\n")[1:]
+        finally:
+            f.close()
+        kept = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # cut short by a crash, or the last empty line
+            if "error" not in record and record["unit"] in finished_keys:
+                kept.append(line + "\n")
+        return kept
+
+    def select(self, units):
+        """
+        Returns the units of one cruise that belong to this shard, noting
+        the position of each in the run
+
+        units: All units of the cruise, in order, from list_units
+        """
+        selected = []
+        for index, unit in enumerate(units):
+            if unit_shard(unit, self.shards) == self.shard:
+                self.positions[unit_key(unit)] = (self.cruises[unit[1]],
+                                                  index)
+                selected.append(unit)
+        return selected
+
+    def add_unit(self, unit, results):
+        """
+        Writes the results of one unit to the partial
+
+        unit: The unit
+        results: Its DeviceResults
+        """
+        position = list(self.positions[unit_key(unit)])
+        manifest = parseFunctions.manifest
+        stage_profile = parseFunctions.stage_profile
+        for index, result in enumerate(results):
+            if manifest is not None and result.manifest_entry is not None:
+                manifest.update(*result.manifest_entry)
+            if stage_profile is not None and result.stage_times:
+                stage_profile.add_times(result.cruise, result.device,
+                                        result.stage_times)
+            record = {"unit": unit_key(unit), "position": position + [index],
+                      "cruise": result.cruise, "device": result.device,
+                      "mindate": format_date(result.mindate),
+                      "maxdate": format_date(result.maxdate),
+                      "file_count": result.file_count,
+                      "match_count": result.match_count,
+                      "elapsed": result.elapsed,
+                      "files": [list(pair) for pair
+                                in result.file_dates.seconds_pairs()]}
+            if result.file_ends is not None:
+                record["ends"] = [format_date(end) for end in result.file_ends]
+            if result.device_dir is not None:
+                record["device_dir"] = result.device_dir
+            if result.stage_times:
+                record["stage_times"] = result.stage_times
+            self.f.write(json.dumps(record) + "\n")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def fail_unit(self, unit, error):
+        """
+        Writes a unit that failed to parse to the partial, so the merge
+        reports it
+        """
+        position = list(self.positions[unit_key(unit)])
+        self.f.write(json.dumps({"unit": unit_key(unit),
+                                 "position": position + [0],
+                                 "error": error}) + "\n")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def close(self, finished=True):
+        """
+        Closes the partial, and gives it its final name if the shard
+        finished
+        """
+        self.f.close()
+        if finished:
+            if self.resumed:
+                self.sort()
+            if os.name == 'nt' and os.path.exists(self.partial_path):
+                os.remove(self.partial_path)
+            os.rename(self.tmp_path, self.partial_path)
+            say("Shard {0} of {1} written to {2}".format(
+                self.shard, self.shards, self.partial_path))
+
+    def sort(self):
+        """
+        Puts the partial of a resumed shard back in run order, as the units
+        that failed before are parsed again after the finished ones
+        """
+        f = open(self.tmp_path)
+        try:
+            lines = f.read().split("\n")
+        finally:
+            f.close()
+        records = sorted((json.loads(line)["position"], line)
+                         for line in lines[1:] if line)
+        f = open(self.tmp_path, "w")
+        try:
+            f.write(lines[0] + "\n")
+            f.writelines(line + "\n" for position, line in records)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+
+
+def read_header(partial_path):
+    f = open(partial_path)
+    try:
+        return native_strings(json.loads(f.readline()))
+    except ValueError:
+        raise ValueError("{0} is not a shard partial".format(partial_path))
+    finally:
+        f.close()
+
+
+def shard_args(partial_paths):
+    """
+    Returns the arguments of the run the partials are the shards of,
+    raising ValueError unless they are every shard of one run, once
+
+    partial_paths: The partial files
+    """
+    headers = [read_header(path) for path in partial_paths]
+    if not headers:
+        raise ValueError("--merge needs the partial of every shard")
+    args, shards = headers[0]["args"], headers[0]["shards"]
+    for path, header in zip(partial_paths, headers):
+        if header["args"] != args or header["shards"] != shards:
+            raise ValueError("{0} is a shard of another run: {1}".format(
+                path, " ".join(header["args"])))
+    found = sorted(header["shard"] for header in headers)
+    if found != list(range(1, shards + 1)):
+        raise ValueError("--merge needs shards 1 to {0} once each, got {1}".format(
+            shards, ", ".join(str(shard) for shard in found)))
+    return args
+
+
+def read_records(partial_path):
+    """
+    Yields (position, record) for every line of a partial after its header,
+    in the order it was written, which is run order
+    """
+    f = open(partial_path)
+    try:
+        f.readline()
+        for line in f:
+            record = native_strings(json.loads(line))
+            yield tuple(record["position"]), record
+    finally:
+        f.close()
+
+
+def record_result(record):
+    """
+    Returns the DeviceResult of a partial's result record
+    """
+    mindate = read_date(record["mindate"])
+    maxdate = read_date(record["maxdate"])
+    file_dates = FileDates()
+    stream_stats = None
+    if parseFunctions.gap_factor is None:
+        for seconds, filename in record["files"]:
+            file_dates.append_seconds(seconds, filename)
+    else:
+        stream_stats = store_stream(record["files"], file_dates,
+                                    parseFunctions.gap_factor)
+    file_ends = None
+    if "ends" in record:
+        file_ends = [read_date(end) for end in record["ends"]]
+    result = DeviceResult(
+        record["cruise"], record["device"], mindate, maxdate, file_dates,
+        generate_cruise_startend_sql(mindate, maxdate, record["cruise"]),
+        None, record["file_count"], record["match_count"],
+        record["elapsed"], file_ends, stream_stats, record.get("device_dir"))
+    result.stage_times = record.get("stage_times")
+    return result
+
+
+def merge_shards(partial_paths, csvlog, datelog, filelog):
+    """
+    Writes the results of every shard of a run in run order, as write_unit
+    does for an unsharded run
+
+    partial_paths: The partial files, from shard_args
+    csvlog, datelog, filelog: As for write_result
+    """
+    failed = 0
+    # positions are unique across shards, so the records never compare
+    for position, record in heapq.merge(*[read_records(path)
+                                          for path in partial_paths]):
+        if "error" in record:
+            failed += 1
+            logger.error("Failed to parse unit {0}:\n{1}".format(
+                record["unit"], record["error"]))
+            say("FAILED UNIT {0}, set aside".format(record["unit"]))
+            continue
+        write_result(record_result(record), csvlog, datelog, filelog)
+    if failed:
+        say("{0} units failed in their shards and were left out".format(
+            failed))
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+"""
+This program contains the ship profiles, which say how the cruises of each
+ship are laid out and how their filenames are dated. Profiles are read from
+ship_profiles.json, next to this file unless config sets ship_profiles_path,
+so a ship is added by adding its profile:
+
+    "XX": {"layout": "instrument", "instrument_path": "/data/serial",
+           "cruise_pattern": "^{ship}\\d*\\w$",
+           "filename_regex": "_\\d{14}$", "parser": "default"}
+
+- layout: "instrument" for device directories under instrument_path,
+  "scs" or "adcp" for cruise subdirectories matching device_glob, with
+  the files in device_subpath below them
+- cruise_pattern: The regex -a lists the ship's cruises with, {ship}
+  standing for the ship prefix; lowercase is true for ships whose cruise
+  directories are lower case
+- filename_regex: The regex a file's name must match to be parsed
+- parser: The name of a parser in parserRegistry, or {"pattern": regex,
+  "fields": "calendar" or "julian"} whose groups are the timestamp fields
+- devices: Devices whose filename_regex and parser differ from the ship's
+
+A ship's profile is "defaults" updated with its entry. Ships listed in the
+config dicts regex_by_cruise, path_identifier and dateparser_by_cruise have
+a profile too, and config gives the filename_regex and layout a profile
+does not. The profiles are compiled once, on first use, into a table of
+ShipProfiles holding compiled regexes and parsers, so what a cruise needs is
+one dict lookup.
+"""
+
+import os
+import re
+import json
+import fnmatch
+import config
+from parserRegistry import parsers_by_name, make_parser
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+PROFILES_NAME = "ship_profiles.json"
+
+# layout: dateparse method, as in parseDate.py -p
+LAYOUTS = {"instrument": '1', "scs": '2', "adcp": '3'}
+
+# ship prefix: ShipProfile, compiled by load_profiles
+profiles = None
+
+# cruise ID: ShipProfile and cruise ID: ship prefix, filled as they are used
+_cruise_profiles = {}
+_abbreviations = {}
+
+
+class ShipProfile(object):
+    """
+    The compiled profile of one ship
+
+    abbreviation: The ship prefix
+    spec: The ship's entry of ship_profiles.json, merged with the defaults
+    """
+
+    def __init__(self, abbreviation, spec):
+        self.abbreviation = abbreviation
+        self.layout = spec["layout"]
+        if self.layout not in LAYOUTS:
+            raise ValueError("Unknown layout {0} for ship {1}".format(
+                self.layout, abbreviation))
+        self.dateparse_method = LAYOUTS[self.layout]
+        self.instrument_path = spec["instrument_path"]
+        self.cruise_regex = re.compile(
+            spec["cruise_pattern"].replace("{ship}", abbreviation))
+        self.lowercase = spec.get("lowercase", False)
+        device_glob = spec.get("device_glob")
+        self.device_regex = (re.compile(fnmatch.translate(device_glob))
+                             if device_glob else None)
+        self.device_subpath = spec.get("device_subpath", "")
+        self.filename_regex = compile_regex(spec.get("filename_regex"))
+        self.parser = profile_parser(spec["parser"])
+        self.devices = {}  # device: (filename regex, parser)
+        for device, device_spec in spec.get("devices", {}).items():
+            self.devices[device] = (
+                compile_regex(device_spec.get("filename_regex")),
+                profile_parser(device_spec.get("parser", spec["parser"])))
+
+    def regex_for(self, device=''):
+        """
+        Returns the compiled regex the files of a device must match, or
+        None for all files
+        """
+        if device in self.devices:
+            return self.devices[device][0]
+        return self.filename_regex
+
+    def parser_for(self, device=''):
+        """
+        Returns the FilenameParser of a device's files
+        """
+        if device in self.devices:
+            return self.devices[device][1]
+        return self.parser
+
+
+def compile_regex(pattern):
+    if not pattern:
+        return None
+    return re.compile(pattern)
+
+
+def profile_parser(spec):
+    """
+    Returns the parser a profile names, or makes the one it describes
+    """
+    if isinstance(spec, dict):
+        return make_parser(spec["pattern"], spec.get("fields", "calendar"))
+    return parsers_by_name[spec]
+
+
+def native_strings(value):
+    """
+    Returns a JSON value with its strings made str, which on Python 2 keeps
+    the paths built from them, and the filenames listed under those paths,
+    byte strings
+    """
+    if str is bytes and isinstance(value, type(u"")):
+        return value.encode('utf-8')
+    if isinstance(value, dict):
+        return dict((native_strings(key), native_strings(item))
+                    for key, item in value.items())
+    if isinstance(value, list):
+        return [native_strings(item) for item in value]
+    return value
+
+
+def load_profiles(profiles_path=None):
+    """
+    Compiles the ship profiles and returns the table of them
+
+    profiles_path: The ship profiles JSON file, defaults to
+        ship_profiles_path from config or ship_profiles.json next to this file
+    """
+    global profiles
+    if profiles_path is None:
+        profiles_path = getattr(config, "ship_profiles_path", None) or \
+            os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         PROFILES_NAME)
+    f = open(profiles_path)
+    try:
+        document = native_strings(json.load(f))
+    finally:
+        f.close()
+    defaults = document.get("defaults", {})
+    ships = document.get("ships", {})
+    regex_by_cruise = getattr(config, "regex_by_cruise", {})
+    path_identifier = getattr(config, "path_identifier", {})
+    dateparser_by_cruise = getattr(config, "dateparser_by_cruise", {})
+    methods = dict((method, layout) for layout, method in LAYOUTS.items())
+
+    table = {}
+    for ship in set(ships) | set(regex_by_cruise) | set(path_identifier) | \
+            set(dateparser_by_cruise):
+        spec = dict(defaults)
+        if regex_by_cruise.get(ship):
+            spec["filename_regex"] = regex_by_cruise[ship]
+        if ship in dateparser_by_cruise:
+            spec["layout"] = methods.get(dateparser_by_cruise[ship],
+                                         dateparser_by_cruise[ship])
+        entry = ships.get(ship, {})
+        spec.update(entry)
+        spec["devices"] = dict(defaults.get("devices", {}))
+        spec["devices"].update(entry.get("devices", {}))
+        table[ship] = ShipProfile(ship, spec)
+    profiles = table
+    _cruise_profiles.clear()
+    return table
+
+
+def ship_profile(abbreviation):
+    """
+    Returns the ShipProfile of a ship prefix, raising KeyError for a ship
+    without one
+    """
+    if profiles is None:
+        load_profiles()
+    return profiles[abbreviation]
+
+
+def has_profile(abbreviation):
+    if profiles is None:
+        load_profiles()
+    return abbreviation in profiles
+
+
+def cruise_profile(cruise):
+    """
+    Returns the ShipProfile of a cruise, raising KeyError for a ship
+    without one
+
+    cruise: The cruise ID, in any case
+    """
+    profile = _cruise_profiles.get(cruise)
+    if profile is None:
+        profile = ship_profile(get_ship_abbreviation(cruise.upper()))
+        _cruise_profiles[cruise] = profile
+    return profile
+
+
+def get_ship_abbreviation(cruise):  # returns 2-letter ship ID
+    """
+    Returns the ship prefix of a cruise ID, the letters before its first
+    digit
+    """
+    abbreviation = _abbreviations.get(cruise)
+    if abbreviation is None:
+        abbreviation = ''
+        for char in cruise:  # iterates through cruise ID
+            if char.isdigit():
+                break
+            abbreviation = abbreviation + char  # appends letters
+        _abbreviations[cruise] = abbreviation
+    return abbreviation
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+"""
+This program contains the stage profile of parseDate.py --profile, which
+shows where the time of a slow run goes. Each device's time is split into
+the stages of a parse:
+
+- list: listing its directory
+- filter: matching the names against the ship's filename regex
+- parse: reading the start dates from the names, of which match is the
+  parser's regex match and datetime building the dates
+- sort: sorting the dates and storing them
+- sql: building the file update SQL
+- write: writing the SQL and CSV files, or applying the database updates
+
+Stages are timed around whole directories, and SQL in chunks of CHUNK
+lines, so a run costs a few clock reads per device rather than per file.
+The split of parse into match and datetime comes from timing both on up
+to SAMPLE names of the directory, and scaling to the whole of it.
+Directories are parsed in worker processes with -j, so the times of a
+unit travel back with its first result.
+
+The breakdown is written to [run]_profile.csv, per device and summed per
+cruise and for the run, and to [run]_profile.folded as collapsed stacks
+(dateparse;cruise;device;stage microseconds) for flamegraph.pl or
+speedscope. --pstats [file] also runs cProfile in the main process and
+dumps its pstats to [file], at a much higher cost.
+"""
+
+import time
+import itertools
+import parseFunctions
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+# the most precise clock there is
+clock = getattr(time, "perf_counter", time.time)
+
+STAGES = ("list", "filter", "parse", "match", "datetime", "sort", "sql",
+          "write")
+
+# stages that are part of another, as (stage, parent)
+SUBSTAGES = {"match": "parse", "datetime": "parse"}
+
+# names timed to split parse into match and datetime
+SAMPLE = 256
+
+# SQL lines built between two clock reads
+CHUNK = 1024
+
+PROFILE_HEADER = "cruise,devicetype,stage,seconds\n"
+
+# {stage: seconds} of the unit being parsed, while one is
+unit_times = None
+
+
+def begin_unit():
+    """
+    Starts collecting the stage times of a unit
+    """
+    global unit_times
+    unit_times = {}
+
+
+def end_unit():
+    """
+    Returns the stage times collected since begin_unit
+    """
+    global unit_times
+    times, unit_times = unit_times, None
+    return times
+
+
+def add_stage(stage, seconds):
+    """
+    Adds time to a stage of the unit being parsed, if times are collected
+    """
+    if unit_times is not None:
+        unit_times[stage] = unit_times.get(stage, 0.0) + seconds
+
+
+def split_parse(parser, names, seconds):
+    """
+    Adds the match and datetime shares of a timed parse of names, from
+    timing both on a sample of them
+
+    parser: The FilenameParser the names were parsed with
+    names: The names, a list
+    seconds: The time the whole parse took
+    """
+    if unit_times is None or not names:
+        return
+    step = max(1, len(names) // SAMPLE)
+    sample = names[::step][:SAMPLE]
+    match = parser.match
+    begin = clock()
+    for name in sample:
+        match(name)
+    matched = clock() - begin
+    parse = parser.parse
+    begin = clock()
+    for name in sample:
+        parse(name)
+    parsed = clock() - begin
+    if parsed <= 0:
+        return
+    scale = float(len(names)) / len(sample)
+    match_seconds = min(matched * scale, seconds)
+    add_stage("match", match_seconds)
+    add_stage("datetime", min(max(parsed - matched, 0.0) * scale,
+                              seconds - match_seconds))
+
+
+class StageProfile(object):
+    """
+    The stage times of every device of a run
+
+    stats_path: Also runs cProfile until finish and dumps its pstats here
+    """
+
+    def __init__(self, stats_path=None):
+        self.times = {}  # (cruise, device): {stage: seconds}
+        self.keys = []   # in the order they were first timed
+        self.stats_path = stats_path
+        self.profiler = None
+        if stats_path is not None:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def add(self, cruise, device, stage, seconds):
+        """
+        Adds time to a stage of a device
+        """
+        key = (cruise, device)
+        times = self.times.get(key)
+        if times is None:
+            times = self.times[key] = {}
+            self.keys.append(key)
+        times[stage] = times.get(stage, 0.0) + seconds
+
+    def add_times(self, cruise, device, stage_times):
+        """
+        Adds the {stage: seconds} of a parsed unit to a device
+        """
+        for stage, seconds in stage_times.items():
+            self.add(cruise, device, stage, seconds)
+
+    def write_lines(self, f, lines, cruise, device):
+        """
+        Writes lines, newline terminated, to a file, timing the building of
+        each chunk of CHUNK lines as sql and the writing as write
+
+        f: The open file
+        lines: The lines, any iterable, built as they are read
+        cruise, device: Whose stages the time goes to
+        """
+        lines = iter(lines)
+        built = written = 0.0
+        while True:
+            begin = clock()
+            chunk = [line + '\n' for line in itertools.islice(lines, CHUNK)]
+            middle = clock()
+            f.writelines(chunk)
+            end = clock()
+            built += middle - begin
+            written += end - middle
+            if len(chunk) < CHUNK:
+                break
+        self.add(cruise, device, "sql", built)
+        self.add(cruise, device, "write", written)
+
+    def totals(self):
+        """
+        Returns the rows of the breakdown: (cruise, device, stage, seconds)
+        for every device, then summed per cruise with device "*" and for
+        the run with cruise "*"
+        """
+        rows = []
+        cruises = {}
+        run = {}
+        for cruise, device in self.keys:
+            times = self.times[(cruise, device)]
+            for stage in STAGES:
+                if stage in times:
+                    rows.append((cruise, device, stage, times[stage]))
+                    cruise_times = cruises.setdefault(cruise, {})
+                    cruise_times[stage] = cruise_times.get(stage, 0.0) + \
+                        times[stage]
+                    run[stage] = run.get(stage, 0.0) + times[stage]
+        for cruise in sorted(cruises):
+            if not cruise:
+                continue  # the run's own time, already a row
+            for stage in STAGES:
+                if stage in cruises[cruise]:
+                    rows.append((cruise, "*", stage, cruises[cruise][stage]))
+        for stage in STAGES:
+            if stage in run:
+                rows.append(("*", "*", stage, run[stage]))
+        return rows
+
+    def folded_lines(self):
+        """
+        Returns the collapsed stack lines of the breakdown, in microseconds,
+        with match and datetime under parse
+        """
+        lines = []
+        for cruise, device in self.keys:
+            times = self.times[(cruise, device)]
+            for stage in STAGES:
+                if stage not in times:
+                    continue
+                seconds = times[stage]
+                frames = [stage]
+                if stage in SUBSTAGES:
+                    frames = [SUBSTAGES[stage], stage]
+                elif stage == "parse":  # its own share, less its substages
+                    seconds -= sum(times.get(sub, 0.0) for sub in SUBSTAGES)
+                micros = int(round(max(seconds, 0.0) * 1000000))
+                if micros > 0:
+                    lines.append("dateparse;{0};{1};{2} {3}\n".format(
+                        cruise or "(run)", device or "(run)",
+                        ";".join(frames), micros))
+        return lines
+
+    def finish(self):
+        """
+        Writes the breakdown, the collapsed stacks and the pstats, and says
+        the run totals
+        """
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.stats_path)
+        if parseFunctions.isoDate is None:
+            parseFunctions.begin_run()
+        rows = self.totals()
+        f = open("./{0}_profile.csv".format(parseFunctions.isoDate), "w")
+        try:
+            f.write(PROFILE_HEADER)
+            for cruise, device, stage, seconds in rows:
+                f.write("{0},{1},{2},{3:.6f}\n".format(
+                    cruise or "(run)", device or "(run)", stage, seconds))
+        finally:
+            f.close()
+        f = open("./{0}_profile.folded".format(parseFunctions.isoDate), "w")
+        try:
+            f.writelines(self.folded_lines())
+        finally:
+            f.close()
+        parseFunctions.say("Run time by stage: " + ", ".join(
+            "{0} {1:.3f}s".format(stage, seconds)
+            for cruise, device, stage, seconds in rows if cruise == "*"))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+This program contains the tar archive support, which lets the date parsers
+read cruise shipments that were never extracted. An archive's member names
+are read once, from its headers alone, into a tree of directories that is
+mounted in place of the cruise directory, and scanFunctions answers
+listings under that directory from the tree. Everything downstream, the
+date parsing and the SQL and CSV output, is the same as for an extracted
+cruise.
+
+Uncompressed archives are read by seeking from header to header, so the
+data blocks are never read. Compressed archives have to be decompressed
+as they are read, but nothing is written to disk.
+"""
+
+import os
+import errno
+import tarfile
+import scanFunctions
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz")
+
+
+def archive_cruise(name):
+    """
+    Returns the cruise ID of an archive file name, or None if the name
+    does not end in a tar suffix
+
+    name: The archive file name
+    """
+    for suffix in TAR_SUFFIXES:
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name[:-len(suffix)]
+    return None
+
+
+class ArchiveTree(object):
+    """
+    The directories of one tar archive, from its member names. Each
+    directory, keyed by its path inside the cruise with no leading or
+    trailing '/', holds a list of file names and a list of subdirectory
+    names. A leading directory named after the cruise is dropped, so
+    archives made from the shipment directory or from inside the cruise
+    directory read the same.
+
+    archive_path: The tar archive
+    cruise: The cruise ID the archive holds
+    """
+
+    def __init__(self, archive_path, cruise):
+        self.archive_path = archive_path
+        self.mtime = os.stat(archive_path).st_mtime
+        self.dirs = {"": ([], [])}
+        self.member_count = 0
+        archive = tarfile.open(archive_path, "r:*")
+        try:
+            while True:
+                member = archive.next()
+                if member is None:
+                    break
+                # TarFile keeps every member it reads; only names are needed
+                archive.members = []
+                self.member_count += 1
+                parts = [part for part in member.name.split("/")
+                         if part and part != "."]
+                if parts and parts[0] == cruise:
+                    parts = parts[1:]
+                if not parts:
+                    continue
+                if member.isdir():
+                    self._dir(parts)
+                elif member.isfile() or member.issym() or member.islnk():
+                    self._dir(parts[:-1])[0].append(parts[-1])
+        finally:
+            archive.close()
+        for files, dirs in self.dirs.values():
+            files.sort()
+            dirs.sort()
+
+    def _dir(self, parts):
+        """
+        Returns the (files, dirs) entry of a directory, adding it and any
+        missing parents, since archives need not hold directory members
+        """
+        key = "/".join(parts)
+        entry = self.dirs.get(key)
+        if entry is None:
+            entry = self.dirs[key] = ([], [])
+            self._dir(parts[:-1])[1].append(parts[-1])
+        return entry
+
+    def entries(self, path):
+        """
+        Returns the (files, dirs) of a directory of the archive, raising
+        OSError as os.listdir does if there is no such directory
+
+        path: The directory inside the cruise, '/' separated
+        """
+        entry = self.dirs.get(path.strip("/"))
+        if entry is None:
+            raise OSError(errno.ENOENT, os.strerror(errno.ENOENT),
+                          self.archive_path + ":" + path)
+        return entry
+
+
+def mount_archive(archive_path, mount_path, cruise):
+    """
+    Reads an archive and mounts it in place of a cruise directory
+
+    archive_path: The tar archive
+    mount_path: The cruise directory it stands in for
+    cruise: The cruise ID the archive holds
+    """
+    tree = ArchiveTree(archive_path, cruise)
+    scanFunctions.mounts[os.path.abspath(mount_path)] = tree
+    return tree
+
+
+def mount_archives(cruise_prefix, shipment_path, exact=False):
+    """
+    Mounts the cruise archives of a shipment directory in place of their
+    cruise directories and returns their cruise IDs, sorted
+
+    cruise_prefix: The cruise prefix archives must start with, compared
+        without case as OC cruises are lower case
+    shipment_path: The shipment directory
+    exact: True if cruise_prefix is a whole cruise ID
+    """
+    cruises = []
+    for name in sorted(os.listdir(shipment_path)):
+        cruise = archive_cruise(name)
+        if cruise is None:
+            continue
+        if exact:
+            matched = cruise.upper() == cruise_prefix.upper()
+        else:
+            matched = cruise.upper().startswith(cruise_prefix.upper())
+        if matched and cruise not in cruises:
+            mount_archive(os.path.join(shipment_path, name),
+                          os.path.join(shipment_path, cruise), cruise)
+            cruises.append(cruise)
+    return cruises
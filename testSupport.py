@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+"""
+This program contains what the tests share. setup() writes a config.py
+of the tests' own into a temporary directory, puts it first on the path
+of the tests and of the parseDate.py runs they start, and builds a small
+shipment tree in every ship layout with benchmark.make_shipment_tree. Each
+run is made on a fresh copy of the tree, in a subprocess, and its SQL and
+CSV outputs are read back with outputs().
+
+The files of each device of the tree start at 2019-01-01 00:00:00 and
+are one hour apart, so expected values are worked out with hour().
+"""
+
+import os
+import re
+import sys
+import atexit
+import shutil
+import datetime
+import tempfile
+import unittest
+import subprocess
+
+try:
+    import pytest
+except ImportError:  # Python 2 runs the tests with unittest
+    pytest = None
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+PARSEDATE = os.path.join(PACKAGE_DIR, "parseDate.py")
+
+CONFIG = r"""
+log_dir = {log_dir!r}
+regex_by_cruise = {{'RR': r'_\d{{14}}$', 'OC': r'-\d{{6}}', 'TN': r'-\d{{6}}',
+                   'SKQ': r'\.\d{{8}}T\d{{4}}Z$', 'HLY': r'_\d{{14}}$',
+                   'SP': r'_\d{{14}}$', 'SR': r'_\d{{14}}$',
+                   'RC': r'_\d{{8}}-\d{{4}}', 'BH': r'^gp90'}}
+path_identifier = dict((ship, '') for ship in regex_by_cruise)
+dateparser_by_cruise = {{'RR': '1', 'OC': '1', 'TN': '1', 'SKQ': '1',
+                        'HLY': '1', 'SP': '1', 'SR': '1', 'RC': '2',
+                        'BH': '3'}}
+"""
+
+# the cruise argument of a run over each ship of the tree; HLY cruises are
+# listed from their archives with -a, so its one cruise is named
+SHIP_RUNS = [["RR", "-a"], ["HLY1901"], ["OC", "-a"], ["SKQ", "-a"],
+             ["SP", "-a"], ["TN", "-a"], ["RC", "-a"], ["BH", "-a"]]
+
+OUTPUT_FLAGS = ["-c", "-l", "-m", "-d"]
+
+# files per device, and the devices of each cruise
+FILES = 6
+DEVICES = ("gps", "met", "gyro")
+
+START = datetime.datetime(2019, 1, 1)
+
+# the timestamp a run names its dateranges CSVs with
+RUN_STAMP = re.compile(r'^\d{4}-\d{2}-\d{2}T[\d:.]+_')
+
+# runs parseDate.main with the units of one device failing, with one
+# cruise failing to list, or with the process stopping as a crash would on
+# its Nth unit; BH devices are ADCPn
+FAILING_RUN = """
+import os, sys
+import runFunctions
+mode, device = sys.argv.pop(1), sys.argv.pop(1)
+parse_unit = runFunctions.parse_unit
+list_units = runFunctions.list_units
+calls = [0]
+def failing(unit, *args, **kwargs):
+    calls[0] += 1
+    if mode == "fail" and unit[3] in (device, "ADCP2"):
+        raise RuntimeError("failed on purpose")
+    if mode == "crash" and calls[0] == int(device):
+        os._exit(1)
+    return parse_unit(unit, *args, **kwargs)
+def unlisted(cruise, *args):
+    if mode == "unlisted" and cruise == device:
+        raise OSError("failed on purpose")
+    return list_units(cruise, *args)
+runFunctions.parse_unit = failing
+runFunctions.list_units = unlisted
+import parseDate
+parseDate.main(sys.argv)
+"""
+
+# runs parseDate.main with worker processes started by another method
+START_METHOD_RUN = """
+import sys
+import multiprocessing
+import parseDate
+if __name__ == '__main__':
+    multiprocessing.set_start_method(sys.argv.pop(1))
+    parseDate.main(sys.argv)
+"""
+
+tmp = None
+template = None
+
+
+def setup():
+    """
+    Writes the config and builds the template tree, once per process
+    """
+    global tmp, template
+    if tmp is not None:
+        return
+    tmp = tempfile.mkdtemp(prefix="dateparse_test")
+    atexit.register(shutil.rmtree, tmp, True)
+    config_dir = os.path.join(tmp, "config")
+    log_dir = os.path.join(tmp, "logs")
+    os.mkdir(config_dir)
+    os.mkdir(log_dir)
+    f = open(os.path.join(config_dir, "config.py"), "w")
+    try:
+        f.write(CONFIG.format(log_dir=log_dir))
+    finally:
+        f.close()
+    os.environ["PYTHONPATH"] = os.pathsep.join(
+        [config_dir, PACKAGE_DIR] +
+        [path for path in [os.environ.get("PYTHONPATH")] if path])
+    sys.path.insert(0, config_dir)
+    import benchmark
+    template = os.path.join(tmp, "template")
+    benchmark.make_shipment_tree(template, FILES, DEVICES)
+
+
+def hour(i):
+    """
+    Returns the start of file i of a device of the tree
+    """
+    return START + datetime.timedelta(hours=i)
+
+
+def new_tree(source=None):
+    """
+    Returns a fresh copy of the shipment tree, or an empty directory
+
+    source: The tree to copy, the template by default, "" for none
+    """
+    tree = tempfile.mkdtemp(prefix="shipment", dir=tmp)
+    if source == "":
+        return tree
+    os.rmdir(tree)
+    shutil.copytree(source or template, tree)
+    return tree
+
+
+def run(tree, args, script=None, check=True):
+    """
+    Runs parseDate.py in a shipment tree and returns its exit status
+
+    tree: The shipment directory the run is made in
+    args: The arguments
+    script: Python code to run instead of parseDate.py, which ends by
+        calling parseDate.main with its arguments
+    check: True to fail the test if the run fails
+    """
+    if script is None:
+        command = [sys.executable, PARSEDATE] + args
+    else:
+        command = [sys.executable, "-c", script] + args
+    devnull = open(os.devnull, "w")
+    try:
+        status = subprocess.call(command, cwd=tree, stdout=devnull,
+                                 stderr=devnull)
+    finally:
+        devnull.close()
+    if check and status != 0:
+        raise AssertionError("parseDate.py {0} exited with {1}".format(
+            " ".join(args), status))
+    return status
+
+
+def output(tree, args, script=None):
+    """
+    Runs parseDate.py in a shipment tree and returns what it printed
+    """
+    if script is None:
+        command = [sys.executable, PARSEDATE] + args
+    else:
+        command = [sys.executable, "-c", script] + args
+    process = subprocess.Popen(command, cwd=tree, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT,
+                               universal_newlines=True)
+    return process.communicate()[0]
+
+
+def read(path):
+    f = open(path)
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+
+def outputs(tree):
+    """
+    Returns {name: content} of the SQL and CSV files of a tree, with the
+    run timestamp taken off the names of the CSVs
+    """
+    found = {}
+    for name in os.listdir(tree):
+        if name.endswith(".sql") or name.endswith(".csv"):
+            found[RUN_STAMP.sub("", name)] = read(os.path.join(tree, name))
+    return found
+
+
+def run_ships(flags, runner=None, source=None, ships=None):
+    """
+    Runs every ship of a fresh tree with flags and returns the outputs
+
+    flags: The arguments after the output flags
+    runner: Called as runner(tree, args) for each ship instead of run
+    source: The tree to copy, as for new_tree
+    ships: The cruise arguments to run, SHIP_RUNS by default
+    """
+    tree = new_tree(source)
+    for ship_args in ships or SHIP_RUNS:
+        args = ship_args[:1] + ["x"] + ship_args[1:] + OUTPUT_FLAGS + flags
+        if runner is None:
+            run(tree, args)
+        else:
+            runner(tree, args)
+    return outputs(tree)
+
+
+def shared_tree():
+    """
+    Returns a copy of the tree with a cruise RR1902 whose gps files are
+    the RR1901 files of 03:00 to 05:00, delivered again, and three more
+    files to 08:00
+    """
+    tree = new_tree()
+    first = os.path.join(tree, "RR1901", "data", "SerialInstruments", "gps")
+    second = os.path.join(tree, "RR1902", "data", "SerialInstruments", "gps")
+    os.makedirs(second)
+    for i in range(3, FILES + 3):
+        filename = hour(i).strftime("gps_%Y%m%d%H%M%S")
+        if i < FILES:
+            shutil.copy(os.path.join(first, filename), second)
+        else:
+            open(os.path.join(second, filename), "w").close()
+    return tree
+
+
+def importorskip(name):
+    """
+    pytest.importorskip, or the same with unittest when pytest is missing
+    """
+    if pytest is not None:
+        return pytest.importorskip(name)
+    try:
+        return __import__(name)
+    except ImportError:
+        raise unittest.SkipTest("{0} is not installed".format(name))
+
+
+def nmea_file(path, start, end, padding=0):
+    """
+    Writes a file whose content starts with an NMEA RMC sentence of start
+    and ends with a ZDA sentence of end
+
+    path: The file
+    start, end: The datetimes of the two sentences
+    padding: Bytes of other sentences between the two
+    """
+    f = open(path, "w")
+    try:
+        f.write(start.strftime(
+            "$GPRMC,%H%M%S.00,A,3252.0,N,11714.0,W,0.0,0.0,%d%m%y,,*00\n"))
+        f.write("$GPGGA,,,,,,,,,,,,,,*00\n" * (padding // 24))
+        f.write(end.strftime("$GPZDA,%H%M%S.00,%d,%m,%Y,00,00*00\n"))
+    finally:
+        f.close()
+
+
+def file_sql(cruise, filename, start, end=None):
+    """
+    Returns the file update SQL line a run writes for one file
+    """
+    line = "UPDATE file SET start_time = '{0}'".format(start)
+    if end is not None:
+        line += ", end_time = '{0}'".format(end)
+    return line + " WHERE cruise_id = '{0}' AND path LIKE '%{1}';".format(
+        cruise, filename)
+
+
+def minmax_sql(cruise, start, end):
+    """
+    Returns the cruise range SQL a run writes
+    """
+    return ("UPDATE cruise_issues SET unols_start_date = '{0}', "
+            "unols_end_date = '{1}' WHERE cruise = '{2}';".format(
+                start, end, cruise))
+
+
+class RunTest(unittest.TestCase):
+
+    plain = {}  # flags: outputs of the plain run, made once
+
+    @classmethod
+    def setUpClass(cls):
+        setup()
+
+    def plain_outputs(self, flags=()):
+        key = tuple(flags)
+        if key not in self.plain:
+            self.plain[key] = run_ships(list(flags))
+            self.assertTrue(self.plain[key])
+        return self.plain[key]
+
+    def assertMatchesPlain(self, found, flags=()):
+        expected = self.plain_outputs(flags)
+        self.assertEqual(sorted(found), sorted(expected))
+        for name in expected:
+            self.assertEqual(found[name], expected[name], name)
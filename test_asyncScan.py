@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests of the asyncio scanner of -n, run in subprocesses as parseDate.py
+and in process on the tree behind benchmark.LatencyFS. Needs Python 3.
+
+python -m unittest test_asyncScan, or pytest
+"""
+
+import os
+import unittest
+import testSupport
+from testSupport import (RunTest, run_ships, new_tree, outputs, hour,
+                         file_sql, minmax_sql, FILES)
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+asyncScan = None
+benchmark = None
+runFunctions = None
+
+# the cruises of the in process runs, all of dateparse method 1
+CRUISES = ("RR1901", "TN101", "SKQ201901", "SP1901")
+
+
+def setUpModule():
+    global asyncScan, benchmark, runFunctions
+    testSupport.setup()
+    try:
+        import asyncScan  # imports parseFunctions, which needs the config
+    except (ImportError, SyntaxError):
+        raise unittest.SkipTest("-n needs Python 3")
+    import benchmark
+    import runFunctions
+
+
+class ListingRunTest(RunTest):
+
+    def test_listing_run(self):
+        for listings in ("1", "4"):
+            found = run_ships(["-n", listings])
+            self.assertMatchesPlain(found)
+            self.assertEqual(found["SKQ201901_gps.sql"], "".join(
+                file_sql("SKQ201901", hour(i).strftime("gps.%Y%m%dT%H%MZ"),
+                         hour(i)) + "\n" for i in range(FILES)))
+            self.assertEqual(found["BH1901_MINMAX_UPDATE.sql"],
+                             minmax_sql("BH1901", hour(0), hour(FILES - 1)))
+
+
+class LatencyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tree = new_tree()
+        self.cruise_args = [(cruise, os.path.join(self.tree, ""), "", "1",
+                             True, "") for cruise in CRUISES]
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+
+    def scan(self, run):
+        """
+        Runs run in a new output directory with every directory call
+        waiting and returns (outputs, most calls waiting at once)
+        """
+        os.chdir(new_tree(""))
+        with benchmark.LatencyFS(0.02) as latency:
+            run()
+        return outputs(os.getcwd()), latency.most_in_flight
+
+    def test_listings_overlap(self):
+        serial, serial_most = self.scan(lambda: runFunctions.run_units(
+            self.cruise_args, False, True, True))
+        self.assertEqual(serial_most, 1)
+        self.assertEqual(sorted(serial), sorted(
+            "{0}_{1}.sql".format(cruise, name) for cruise in CRUISES
+            for name in ("gps", "met", "gyro", "MINMAX_UPDATE")))
+        self.assertEqual(serial["RR1901_met.sql"], "".join(
+            file_sql("RR1901", hour(i).strftime("met_%Y%m%d%H%M%S"),
+                     hour(i)) + "\n" for i in range(FILES)))
+        self.assertEqual(serial["SP1901_MINMAX_UPDATE.sql"],
+                         minmax_sql("SP1901", hour(0), hour(FILES - 1)))
+
+        for listings in (1, 4):
+            found, most = self.scan(lambda: asyncScan.run_units_async(
+                self.cruise_args, False, True, True, listings))
+            self.assertEqual(found, serial)
+            self.assertEqual(most > 1, listings > 1)
+            self.assertTrue(most <= listings)
+
+
+if __name__ == '__main__':
+    unittest.main()
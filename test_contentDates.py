@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Tests of the content fallback of -f, which dates files from the NMEA or
+instrument timestamps at the head and tail of their content
+
+python -m unittest test_contentDates, or pytest
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import testSupport
+from testSupport import hour
+from contentDates import (READ_BYTES, content_start, content_range,
+                          content_dates, content_ends)
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+START = hour(2).replace(minute=30)
+END = hour(3).replace(minute=15)
+
+
+class ContentDatesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix="content")
+        self.addCleanup(shutil.rmtree, self.path, True)
+        # the ZDA sentence of the large file is only in its tail
+        testSupport.nmea_file(os.path.join(self.path, "EM122_0001.all"),
+                              START, END, 3 * READ_BYTES)
+        testSupport.nmea_file(os.path.join(self.path, "small.raw"),
+                              START, END)
+        f = open(os.path.join(self.path, "blank.raw"), "w")
+        try:
+            f.write("no timestamps\n")
+        finally:
+            f.close()
+
+    def file(self, filename):
+        return os.path.join(self.path, filename)
+
+    def test_start_from_head(self):
+        self.assertEqual(content_start(self.file("EM122_0001.all")), START)
+        self.assertEqual(content_start(self.file("blank.raw")), None)
+        self.assertEqual(content_start(self.file("missing.raw")), None)
+
+    def test_range_from_head_and_tail(self):
+        self.assertEqual(content_range(self.file("EM122_0001.all")),
+                         (START, END))
+        self.assertEqual(content_range(self.file("small.raw")), (START, END))
+        self.assertEqual(content_range(self.file("blank.raw")), None)
+
+    def test_directory_dates(self):
+        names = ["small.raw", "blank.raw", "EM122_0001.all"]
+        self.assertEqual(content_dates(self.path, names),
+                         [(START, "small.raw"), (START, "EM122_0001.all")])
+        self.assertEqual(content_ends(self.path, names),
+                         {"small.raw": END, "EM122_0001.all": END})
+        self.assertEqual(content_dates(self.path, []), [])
+        self.assertEqual(content_ends(self.path, []), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
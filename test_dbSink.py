@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+"""
+Tests of the database sink of -D, applied to an SQLite file table
+
+python -m unittest test_dbSink, or pytest
+"""
+
+import os
+import sqlite3
+import unittest
+import testSupport
+from testSupport import hour, new_tree, run, FILES
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+NAMES = [hour(i).strftime("gps_%Y%m%d%H%M%S") for i in range(5)]
+
+dbSink = None
+
+
+def setUpModule():
+    global dbSink
+    testSupport.setup()
+    import dbSink  # imports parseFunctions, which needs the config
+
+
+def make_tables(path, cruises=("RR1901", "RR1902"), names=NAMES):
+    """
+    Creates the file and cruise_issues tables the updates apply to, with a
+    row per name for each cruise
+    """
+    db = sqlite3.connect(path)
+    try:
+        db.execute("CREATE TABLE file (id INTEGER PRIMARY KEY, "
+                   "cruise_id TEXT, path TEXT, start_time TIMESTAMP, "
+                   "end_time TIMESTAMP)")
+        db.execute("CREATE TABLE cruise_issues (cruise TEXT, "
+                   "unols_start_date TIMESTAMP, unols_end_date TIMESTAMP)")
+        for cruise in cruises:
+            db.executemany(
+                "INSERT INTO file (cruise_id, path, end_time) "
+                "VALUES (?, ?, 'old')",
+                [(cruise, "{0}/data/SerialInstruments/gps/{1}".format(
+                    cruise, name)) for name in names])
+            db.execute("INSERT INTO cruise_issues (cruise) VALUES (?)",
+                       (cruise,))
+        db.commit()
+    finally:
+        db.close()
+
+
+def query(path, statement):
+    db = sqlite3.connect(path)
+    try:
+        return db.execute(statement).fetchall()
+    finally:
+        db.close()
+
+
+class FlakyConnection(object):
+    """
+    An sqlite3 connection whose executemany fails while a row holds one of
+    the names in broken, and which records the names of every executemany
+
+    path: The SQLite file
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.broken = set()
+        self.batches = []
+
+    def cursor(self):
+        return FlakyCursor(self.connection.cursor(), self)
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def close(self):
+        self.connection.close()
+
+
+class FlakyCursor(object):
+
+    def __init__(self, cursor, connection):
+        self.cursor = cursor
+        self.connection = connection
+
+    def execute(self, *args):
+        return self.cursor.execute(*args)
+
+    def executemany(self, statement, rows):
+        rows = list(rows)
+        names = [row[1] for row in rows]
+        self.connection.batches.append(names)
+        if self.connection.broken.intersection(names):
+            raise sqlite3.OperationalError("broken on purpose")
+        return self.cursor.executemany(statement, rows)
+
+
+class DatabaseSinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(new_tree(""), "r2r.db")
+        make_tables(self.path)
+        self.file_dates = [(hour(i), name) for i, name in enumerate(NAMES)]
+
+    def sink(self, paramstyle="qmark", batch_size=2, connect=None):
+        return dbSink.DatabaseSink(
+            connect or (lambda: sqlite3.connect(self.path)), paramstyle,
+            batch_size, retries=1, retry_delay=0)
+
+    def start_times(self, cruise="RR1901"):
+        return query(self.path, "SELECT start_time, end_time FROM file "
+                     "WHERE cruise_id = '{0}' ORDER BY id".format(cruise))
+
+    def test_file_dates_in_batches(self):
+        sink = self.sink()
+        sink.apply_file_dates("RR1901", "gps", self.file_dates)
+        sink.close()
+        self.assertEqual((sink.rows, sink.batches, sink.failed), (5, 3, []))
+        self.assertEqual(self.start_times(),
+                         [(str(hour(i)), "old") for i in range(5)])
+        self.assertEqual(self.start_times("RR1902"), [(None, "old")] * 5)
+
+    def test_file_end_times(self):
+        sink = self.sink()
+        ends = [hour(i + 1) for i in range(4)] + [None]
+        sink.apply_file_dates("RR1901", "gps", self.file_dates, ends)
+        sink.close()
+        self.assertEqual(self.start_times(),
+                         [(str(hour(i)), str(hour(i + 1))) for i in range(4)] +
+                         [(str(hour(4)), "old")])
+
+    def test_cruise_range(self):
+        sink = self.sink()
+        sink.apply_cruise_range("RR1902", hour(0), hour(4))
+        sink.close()
+        self.assertEqual(
+            query(self.path, "SELECT * FROM cruise_issues ORDER BY cruise"),
+            [("RR1901", None, None), ("RR1902", str(hour(0)), str(hour(4)))])
+
+    def test_paramstyles(self):
+        # sqlite3 takes qmark, numeric and named parameters
+        for paramstyle in ("qmark", "numeric", "named"):
+            self.path = os.path.join(new_tree(""), "r2r.db")
+            make_tables(self.path)
+            sink = self.sink(paramstyle)
+            sink.apply_file_dates("RR1901", "gps", self.file_dates)
+            sink.apply_cruise_range("RR1901", hour(0), hour(4))
+            sink.close()
+            self.assertEqual(sink.failed, [], paramstyle)
+            self.assertEqual(self.start_times(),
+                             [(str(hour(i)), "old") for i in range(5)])
+            self.assertEqual(query(
+                self.path, "SELECT unols_end_date FROM cruise_issues WHERE "
+                "cruise = 'RR1901'"), [(str(hour(4)),)])
+
+    def test_to_paramstyle(self):
+        statement = "UPDATE t SET a = ? WHERE b LIKE '%x' AND c = ?"
+        self.assertEqual(dbSink.to_paramstyle(statement, "qmark"), statement)
+        for paramstyle in ("format", "pyformat"):
+            self.assertEqual(
+                dbSink.to_paramstyle(statement, paramstyle),
+                "UPDATE t SET a = %s WHERE b LIKE '%%x' AND c = %s")
+        self.assertEqual(dbSink.to_paramstyle(statement, "numeric"),
+                         "UPDATE t SET a = :1 WHERE b LIKE '%x' AND c = :2")
+        self.assertEqual(dbSink.to_paramstyle(statement, "named"),
+                         "UPDATE t SET a = :p1 WHERE b LIKE '%x' AND c = :p2")
+        self.assertEqual(dbSink.to_params((1, 2), "named"),
+                         {"p1": 1, "p2": 2})
+        self.assertEqual(dbSink.to_params((1, 2), "format"), (1, 2))
+        self.assertRaises(ValueError, dbSink.to_paramstyle, statement, "other")
+        self.assertRaises(ValueError, dbSink.DatabaseSink, None, "other")
+
+    def test_retry_failed_reruns_only_failed_batches(self):
+        connection = FlakyConnection(self.path)
+        connection.broken.add(NAMES[2])
+        sink = self.sink(connect=lambda: connection)
+        sink.apply_file_dates("RR1901", "gps", self.file_dates)
+        self.assertEqual(len(sink.failed), 1)
+        self.assertEqual((sink.rows, sink.batches, sink.retried), (3, 2, 1))
+        self.assertEqual(self.start_times()[2:4], [(None, "old")] * 2)
+
+        connection.broken.clear()
+        del connection.batches[:]
+        self.assertTrue(sink.retry_failed())
+        self.assertEqual(connection.batches, [NAMES[2:4]])
+        self.assertEqual((sink.rows, sink.batches, sink.failed), (5, 3, []))
+        sink.close()
+        self.assertEqual(self.start_times(),
+                         [(str(hour(i)), "old") for i in range(5)])
+
+    def test_retry_failed_keeps_what_still_fails(self):
+        connection = FlakyConnection(self.path)
+        connection.broken.add(NAMES[0])
+        sink = self.sink(connect=lambda: connection)
+        sink.apply_file_dates("RR1901", "gps", self.file_dates)
+        self.assertFalse(sink.retry_failed())
+        self.assertEqual(len(sink.failed), 1)
+        sink.close()
+
+
+class DatabaseRunTest(unittest.TestCase):
+
+    def test_run_applies_to_database(self):
+        tree = new_tree()
+        path = os.path.join(tree, "r2r.db")
+        names = [hour(i).strftime("gps_%Y%m%d%H%M%S") for i in range(FILES)]
+        make_tables(path, ["RR1901"], names)
+        run(tree, ["RR", "x", "-a", "-c", "-l", "-m", "-D", path])
+        self.assertEqual(
+            query(path, "SELECT start_time FROM file ORDER BY id"),
+            [(str(hour(i)),) for i in range(FILES)])
+        self.assertEqual(query(path, "SELECT * FROM cruise_issues"),
+                         [("RR1901", str(hour(0)), str(hour(FILES - 1)))])
+        self.assertEqual([name for name in os.listdir(tree)
+                          if name.endswith(".sql")], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
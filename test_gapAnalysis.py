@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Tests of the cadence, gap, duplicate and out of order analysis of -G
+
+python -m unittest test_gapAnalysis, or pytest
+"""
+
+import datetime
+import unittest
+from gapAnalysis import StreamStats, store_stream, LISTED
+from resultStore import FileDates
+from manifestCache import to_seconds
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+START = to_seconds(datetime.datetime(2019, 1, 1))
+
+# hourly files with a gap of two files after a03, a duplicate of a02, and
+# a04 dated after a06, as after a logger clock was reset
+FILES = [(0, "a00"), (1, "a01"), (2, "a02"), (2, "a02b"), (3, "a03"),
+         (6, "a06"), (7, "a04"), (8, "a08")]
+
+
+def stream(files=FILES):
+    return [(START + hours * 3600, filename) for hours, filename in files]
+
+
+class StreamStatsTest(unittest.TestCase):
+
+    def test_report_lines(self):
+        stats = StreamStats(2.0)
+        for seconds, filename in stream():
+            stats.add(seconds, filename)
+        stats.finish()
+        self.assertEqual(stats.report_lines("gps"), [
+            "gps,files,2019-01-01 00:00:00,2019-01-01 08:00:00,3600,8,"
+            "hourly\n",
+            "gps,gaps,,,10800,1,\n",
+            "gps,duplicates,,,,1,\n",
+            "gps,out_of_order,,,,1,\n",
+            "gps,gap,2019-01-01 03:00:00,2019-01-01 06:00:00,10800,2,a06\n",
+            "gps,duplicate,2019-01-01 02:00:00,2019-01-01 02:00:00,0,1,"
+            "a02b\n",
+            "gps,out_of_order,2019-01-01 07:00:00,2019-01-01 06:00:00,3600,"
+            "1,a04\n"])
+
+    def test_gap_factor(self):
+        stats = StreamStats(3.0)
+        for seconds, filename in stream():
+            stats.add(seconds, filename)
+        stats.finish()
+        self.assertEqual((stats.cadence, stats.gap_count, stats.gaps),
+                         (3600, 0, []))
+
+    def test_listed_per_kind(self):
+        stats = StreamStats()
+        for i in range(LISTED + 5):
+            stats.add(START, "a{0:04d}".format(i))
+        stats.finish()
+        self.assertEqual(stats.duplicate_count, LISTED + 4)
+        self.assertEqual(len(stats.duplicates), LISTED)
+        self.assertEqual(stats.cadence, None)
+        self.assertEqual(stats.report_lines("gps")[0],
+                         "gps,files,2019-01-01 00:00:00,2019-01-01 00:00:00,"
+                         ",105,\n")
+
+    def test_no_files(self):
+        self.assertEqual(StreamStats().finish().report_lines("gps"), [])
+
+    def test_store_stream(self):
+        stored = FileDates()
+        stats = store_stream(stream(), stored, 2.0)
+        self.assertEqual(list(stored.seconds_pairs()), stream())
+        self.assertEqual((stats.files, stats.gap_count,
+                          stats.duplicate_count, stats.out_of_order_count),
+                         (8, 1, 1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Tests of the inventory index, filled by inventoryIndex.update and by
+parseDate.py -x
+
+python -m unittest test_inventoryIndex, or pytest
+"""
+
+import os
+import sqlite3
+import unittest
+import testSupport
+from testSupport import hour, new_tree, run
+from manifestCache import to_seconds
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+ADCP_FILES = 5
+
+
+def setUpModule():
+    testSupport.setup()
+
+
+def adcp_tree():
+    """
+    Returns a shipment directory holding one Blue Heron cruise of three
+    ADCP directories, whose gp90 files have the same names
+    """
+    import benchmark
+    tree = new_tree("")
+    bh = [layout for layout in benchmark.shipment_layouts
+          if layout[0] == "BH1901"]
+    benchmark.make_shipment_tree(tree, ADCP_FILES, ("a", "b", "c"), bh)
+    return tree
+
+
+class InventoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tree = adcp_tree()
+
+    def expected_devices(self):
+        start = to_seconds(hour(0))
+        end = to_seconds(hour(ADCP_FILES - 1))
+        return [("BH1901", "ADCP{0}/gp90".format(adcp), start, end,
+                 ADCP_FILES) for adcp in (1, 2, 3)]
+
+    def test_every_adcp_directory_is_a_device(self):
+        from inventoryIndex import Inventory, update
+        inventory = Inventory(os.path.join(self.tree, "inventory.db"))
+        try:
+            self.assertEqual(update(inventory, "BH", self.tree + "/"),
+                             ["BH1901"])
+            self.assertEqual(inventory.devices("BH1901", 0, 2 ** 40),
+                             self.expected_devices())
+            cruise, devices, files, start, end = inventory.summary("BH")[0]
+            self.assertEqual((cruise, devices, files),
+                             ("BH1901", 3, 3 * ADCP_FILES))
+            self.assertEqual(
+                [filename for filename, start in inventory.files(
+                    "BH1901", "ADCP2/gp90", 0, 2 ** 40)],
+                ["gp9019_001_{0:05d}.raw".format(i * 3600)
+                 for i in range(ADCP_FILES)])
+        finally:
+            inventory.close()
+
+    def test_parse_run_indexes_every_adcp_directory(self):
+        run(self.tree, ["BH", "x", "-a", "-c", "-x"])
+        db = sqlite3.connect(os.path.join(self.tree,
+                                          "dateparse_inventory.db"))
+        try:
+            self.assertEqual(
+                db.execute("SELECT cruise, device, start_time, end_time, "
+                           "files FROM devices ORDER BY device").fetchall(),
+                self.expected_devices())
+            self.assertEqual(db.execute("SELECT COUNT(*) FROM files")
+                             .fetchone()[0], 3 * ADCP_FILES)
+        finally:
+            db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Tests of the cross-cruise overlap check of -u, on the testSupport tree
+with a second cruise that shares files with the first
+
+python -m unittest test_overlapCheck, or pytest
+"""
+
+import unittest
+import testSupport
+from testSupport import hour, run_ships, file_sql, FILES
+from resultStore import FileDates
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+overlapCheck = None
+parseFunctions = None
+
+
+def setUpModule():
+    global overlapCheck, parseFunctions
+    testSupport.setup()
+    import overlapCheck  # imports parseFunctions, which needs the config
+    import parseFunctions
+
+
+def gps_name(i):
+    return hour(i).strftime("gps_%Y%m%d%H%M%S")
+
+
+class SweepTest(unittest.TestCase):
+
+    def test_sweep_overlaps(self):
+        intervals = [(0, 5), (3, 8), (9, 10), (4, 4), (10, 12)]
+        self.assertEqual(sorted(overlapCheck.sweep_overlaps(intervals)),
+                         [(0, 1, 3, 5), (0, 3, 4, 4), (1, 3, 4, 4),
+                          (2, 4, 10, 10)])
+        self.assertEqual(overlapCheck.sweep_overlaps([(0, 1), (2, 3)]), [])
+        self.assertEqual(overlapCheck.sweep_overlaps([]), [])
+
+    def test_shared_files(self):
+        first = FileDates([(hour(0), "a"), (hour(1), "b"), (hour(2), "c")])
+        second = FileDates([(hour(1), "b"), (hour(1), "bb"), (hour(2), "c"),
+                            (hour(3), "d")])
+        self.assertEqual(overlapCheck.shared_files(first, second), [0, 2])
+        self.assertEqual(overlapCheck.shared_files(second, first), [1, 2])
+        # the same name at another time is another file
+        self.assertEqual(overlapCheck.shared_files(
+            FileDates([(hour(0), "b")]), second), [])
+        self.assertEqual(overlapCheck.shared_files(FileDates(), second), [])
+
+
+class OverlapCheckTest(unittest.TestCase):
+
+    def test_overlaps(self):
+        tree = testSupport.shared_tree()
+        check = overlapCheck.OverlapCheck()
+        for cruise in ("RR1901", "RR1902"):
+            for result in sorted(parseFunctions.parse_cruise(cruise, tree),
+                                 key=lambda result: result.device):
+                check.add(result, True, True, True)
+        devices = [(entry[0].cruise, entry[0].device)
+                   for entry in check.results]
+        self.assertEqual(devices, [("RR1901", "gps"), ("RR1901", "gyro"),
+                                   ("RR1901", "met"), ("RR1902", "gps")])
+        # only the gps devices of the two cruises overlap
+        self.assertEqual(check.overlaps(), [(0, 3, hour(3), hour(FILES - 1))])
+
+    def test_reports(self):
+        found = run_ships(["-u"], source=testSupport.shared_tree(),
+                          ships=[["RR", "-a"]])
+        self.assertEqual(found["overlaps.csv"],
+                         overlapCheck.OVERLAPS_HEADER +
+                         "gps,RR1902,RR1901,{0},{1},3\n".format(
+                             hour(3), hour(FILES - 1)))
+        self.assertEqual(found["duplicates.csv"],
+                         overlapCheck.DUPLICATES_HEADER + "".join(
+                             "gps,RR1902,RR1901,{0},{1}\n".format(
+                                 hour(i), gps_name(i))
+                             for i in range(3, FILES)))
+        # the files delivered before are only updated for the first cruise
+        self.assertEqual(found["RR1901_gps.sql"].count("\n"), FILES)
+        self.assertEqual(found["RR1902_gps.sql"], "".join(
+            file_sql("RR1902", gps_name(i), hour(i)) + "\n"
+            for i in range(FILES, FILES + 3)))
+        self.assertEqual(found["RR1902_MINMAX_UPDATE.sql"],
+                         testSupport.minmax_sql("RR1902", hour(3),
+                                                hour(FILES + 2)))
+
+    def test_no_overlaps(self):
+        found = run_ships(["-u"], ships=[["RR", "-a"]])
+        self.assertEqual(found["overlaps.csv"], overlapCheck.OVERLAPS_HEADER)
+        self.assertEqual(found["duplicates.csv"],
+                         overlapCheck.DUPLICATES_HEADER)
+        self.assertEqual(found["RR1901_gps.sql"].count("\n"), FILES)
+
+
+if __name__ == '__main__':
+    unittest.main()
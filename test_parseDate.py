@@ -0,0 +1,696 @@
+#!/usr/bin/env python
+"""
+End to end tests of parseDate.py, run on copies of the testSupport tree.
+The plain run is checked against the dates of the tree, and the other
+tests compare the SQL and CSV outputs of each way of running with those
+of a plain serial run of the same flags, along with values of their own.
+
+python -m unittest test_parseDate, or pytest
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import tarfile
+import unittest
+import testSupport
+from parserRegistry import load_numpy
+from manifestCache import to_seconds
+from testSupport import (RunTest, run, run_ships, new_tree, outputs, hour,
+                         file_sql, minmax_sql, OUTPUT_FLAGS, FAILING_RUN,
+                         START_METHOD_RUN, FILES, DEVICES)
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+
+class PlainRunTest(RunTest):
+
+    def test_file_update_sql(self):
+        found = self.plain_outputs()
+        self.assertEqual(found["RR1901_gps.sql"], "".join(
+            file_sql("RR1901", hour(i).strftime("gps_%Y%m%d%H%M%S"),
+                     hour(i)) + "\n" for i in range(FILES)))
+        self.assertEqual(found["SKQ201901_met.sql"].split("\n")[1], file_sql(
+            "SKQ201901", "met.20190101T0100Z", hour(1)))
+        self.assertEqual(found["RC0101_gyro.sql"].split("\n")[2], file_sql(
+            "RC0101", "gyro_20190101-0200.Raw", hour(2)))
+        self.assertEqual(found["BH1901_gp90.sql"].split("\n")[3], file_sql(
+            "BH1901", "gp9019_001_10800.raw", hour(3)))
+
+    def test_cruise_ranges(self):
+        found = self.plain_outputs()
+        for cruise in ("RR1901", "HLY1901", "OC1901", "SKQ201901", "SP1901",
+                       "TN101", "RC0101", "BH1901"):
+            self.assertEqual(found[cruise + "_MINMAX_UPDATE.sql"],
+                             minmax_sql(cruise, hour(0), hour(FILES - 1)))
+            rows = found[cruise + "_dateranges.csv"].split("\n")
+            self.assertEqual(rows[0], "cruise,devicetype,start_date,end_date")
+            self.assertEqual(len(rows), len(DEVICES) + 2)  # and the last \n
+            self.assertTrue(rows[1].endswith(",{0},{1}".format(
+                hour(0), hour(FILES - 1))))
+
+    def test_every_device(self):
+        found = self.plain_outputs()
+        for device in DEVICES:
+            for cruise in ("RR1901", "OC1901", "TN101", "RC0101"):
+                lines = found["{0}_{1}.sql".format(cruise, device)]
+                self.assertEqual(lines.count("\n"), FILES)
+
+
+class ShardTest(RunTest):
+
+    def sharded(self, shards, flags=()):
+        def runner(tree, args):
+            for shard in range(1, shards + 1):
+                run(tree, args + ["--shard", "{0}/{1}".format(shard, shards)])
+            run(tree, ["--merge"] + [
+                "dateparse_shard_{0}of{1}.jsonl".format(shard, shards)
+                for shard in range(1, shards + 1)])
+            for shard in range(1, shards + 1):
+                os.remove(os.path.join(
+                    tree, "dateparse_shard_{0}of{1}.jsonl".format(shard,
+                                                                 shards)))
+        return run_ships(list(flags), runner)
+
+    def test_shards_merge_to_plain_run(self):
+        for shards in (1, 2, 3):
+            self.assertMatchesPlain(self.sharded(shards))
+
+    def test_shards_with_end_times(self):
+        found = self.sharded(2, ["-e"])
+        self.assertMatchesPlain(found, ["-e"])
+        self.assertEqual(found["RR1901_met.sql"].split("\n")[0], file_sql(
+            "RR1901", "met_20190101000000", hour(0), hour(1)))
+
+    def test_shards_with_set_based_sql(self):
+        found = self.sharded(3, ["-s", "values"])
+        self.assertMatchesPlain(found, ["-s", "values"])
+        self.assertIn("('TN101', 'gyro_20190101-050000.Raw', "
+                      "'2019-01-01 05:00:00')", found["TN101_gyro.sql"])
+
+    def test_shard_picks_part_of_the_units(self):
+        tree = new_tree()
+        partials = []
+        for shard in (1, 2, 3):
+            run(tree, ["RR", "x", "-a"] + OUTPUT_FLAGS +
+                ["--shard", "{0}/3".format(shard)])
+            partial = os.path.join(tree,
+                                   "dateparse_shard_{0}of3.jsonl".format(shard))
+            partials.append(testSupport.read(partial).split("\n")[1:-1])
+        self.assertEqual(outputs(tree), {})
+        self.assertEqual(sum(len(lines) for lines in partials), len(DEVICES))
+
+    def test_merge_needs_every_shard(self):
+        tree = new_tree()
+        for shard in (1, 2):
+            run(tree, ["RR", "x", "-a"] + OUTPUT_FLAGS +
+                ["--shard", "{0}/3".format(shard)])
+        run(tree, ["--merge", "dateparse_shard_1of3.jsonl",
+                   "dateparse_shard_2of3.jsonl"])
+        self.assertEqual(outputs(tree), {})
+
+    def test_resumed_shard(self):
+        def runner(tree, args):
+            for shard in (1, 2):
+                shard_args = args + ["--shard", "{0}/2".format(shard)]
+                run(tree, ["fail", "met"] + shard_args + ["--resume"],
+                    FAILING_RUN)
+                run(tree, shard_args + ["--resume"])
+            run(tree, ["--merge", "dateparse_shard_1of2.jsonl",
+                       "dateparse_shard_2of2.jsonl"])
+            for shard in (1, 2):
+                for name in ("dateparse_shard_{0}of2.jsonl",
+                             "dateparse_journal.{0}of2.jsonl"):
+                    os.remove(os.path.join(tree, name.format(shard)))
+        self.assertMatchesPlain(run_ships([], runner))
+
+
+def applied(sql, staging_csv=None):
+    """
+    Returns the (cruise_id, start_time) rows of a file table of RR1901 and
+    RR1902 gps files after the file update SQL of a run is applied to it.
+    The psql \\copy of -s copy is applied by loading staging_csv.
+    """
+    import benchmark
+    db = sqlite3.connect(":memory:")
+    try:
+        benchmark.make_file_table(db, ["RR1901", "RR1902"], FILES)
+        for part in sql.split("\n\\copy "):
+            if part.startswith("file_time_staging FROM"):
+                rows = [line.split(",") for line in
+                        staging_csv.split("\n")[1:-1]]
+                db.executemany("INSERT INTO file_time_staging "
+                               "VALUES (?, ?, ?)", rows)
+                part = part.split("\n", 1)[1]
+            db.executescript(part)
+        return db.execute("SELECT cruise_id, start_time FROM file "
+                          "ORDER BY id").fetchall()
+    finally:
+        db.close()
+
+
+class SetBasedSQLTest(RunTest):
+
+    def test_modes_apply_the_same_dates(self):
+        expected = ([("RR1901", str(hour(i))) for i in range(FILES)] +
+                    [("RR1902", None)] * FILES)
+        for mode in ("line", "values", "copy"):
+            found = run_ships(["-s", mode], ships=[["RR", "-a"]])
+            self.assertEqual(applied(found["RR1901_gps.sql"],
+                                     found.get("RR1901_gps_staging.csv")),
+                             expected, mode)
+
+    def test_values(self):
+        import parseFunctions
+        lines = run_ships(["-s", "values"])["TN101_met.sql"].split("\n")
+        self.assertEqual(lines[0], parseFunctions.STAGING_CREATE_SQL)
+        self.assertEqual(lines[1], "INSERT INTO file_time_staging "
+                         "(cruise_id, filename, start_time) VALUES")
+        self.assertEqual(lines[2:2 + FILES], [
+            "('TN101', '{0}', '{1}'){2}".format(
+                hour(i).strftime("met_%Y%m%d-%H%M%S.Raw"), hour(i),
+                "," if i < FILES - 1 else ";")
+            for i in range(FILES)])
+        self.assertEqual(lines[2 + FILES:], [
+            parseFunctions.STAGING_UPDATE_SQL,
+            parseFunctions.STAGING_DROP_SQL, ""])
+
+    def test_copy(self):
+        found = run_ships(["-s", "copy"])
+        self.assertEqual(found["SKQ201901_gyro_staging.csv"], "".join(
+            ["cruise_id,filename,start_time\n"] +
+            ["SKQ201901,{0},{1}\n".format(
+                hour(i).strftime("gyro.%Y%m%dT%H%MZ"), hour(i))
+             for i in range(FILES)]))
+        self.assertEqual(found["SKQ201901_gyro.sql"].split("\n")[1],
+                         "\\copy file_time_staging FROM "
+                         "'SKQ201901_gyro_staging.csv' "
+                         "WITH (FORMAT csv, HEADER true)")
+
+
+def device_entries(tree):
+    """
+    Returns the run manifest of a tree, keyed by device directory name
+    """
+    f = open(os.path.join(tree, "dateparse_manifest.json"))
+    try:
+        entries = json.load(f)
+    finally:
+        f.close()
+    return dict((os.path.basename(path), entry)
+                for path, entry in entries.items())
+
+
+class IncrementalTest(RunTest):
+
+    args = ["RR", "x", "-a"] + OUTPUT_FLAGS + ["-i"]
+
+    def test_manifest_of_first_run(self):
+        tree = new_tree()
+        run(tree, self.args)
+        self.assertEqual(outputs(tree), run_ships([], ships=[["RR", "-a"]]))
+        entries = device_entries(tree)
+        self.assertEqual(sorted(entries), sorted(DEVICES))
+        self.assertEqual(entries["gps"]["files"], dict(
+            (hour(i).strftime("gps_%Y%m%d%H%M%S"), to_seconds(hour(i)))
+            for i in range(FILES)))
+
+    def test_rerun_parses_only_new_files(self):
+        tree = new_tree()
+        run(tree, self.args)
+        for name in os.listdir(tree):
+            if name.endswith(".sql") or name.endswith(".csv"):
+                os.remove(os.path.join(tree, name))
+        # the cached dates, moved a minute on, show which files were not
+        # parsed again
+        path = os.path.join(tree, "dateparse_manifest.json")
+        entries = json.loads(testSupport.read(path))
+        for entry in entries.values():
+            for filename, seconds in entry["files"].items():
+                entry["files"][filename] = seconds + 60
+        f = open(path, "w")
+        try:
+            json.dump(entries, f)
+        finally:
+            f.close()
+        new_name = hour(FILES).strftime("gps_%Y%m%d%H%M%S")
+        open(os.path.join(tree, "RR1901", "data", "SerialInstruments",
+                          "gps", new_name), "w").close()
+
+        run(tree, self.args)
+        found = outputs(tree)
+        cached = [hour(i).replace(minute=1) for i in range(FILES)]
+        self.assertEqual(found["RR1901_met.sql"], "".join(
+            file_sql("RR1901", hour(i).strftime("met_%Y%m%d%H%M%S"),
+                     cached[i]) + "\n" for i in range(FILES)))
+        self.assertEqual(found["RR1901_gps.sql"].split("\n")[FILES - 1:], [
+            file_sql("RR1901", hour(FILES - 1).strftime("gps_%Y%m%d%H%M%S"),
+                     cached[FILES - 1]),
+            file_sql("RR1901", new_name, hour(FILES)), ""])
+        rows = found["RR1901_dateranges.csv"].split("\n")
+        self.assertIn("RR1901,gps,{0},{1}".format(cached[0], hour(FILES)),
+                      rows)
+        self.assertIn("RR1901,met,{0},{1}".format(cached[0], cached[-1]),
+                      rows)
+        self.assertEqual(device_entries(tree)["gps"]["files"][new_name],
+                         to_seconds(hour(FILES)))
+
+
+class ResumeTest(RunTest):
+
+    def resumed(self, mode, device, flags=(), source=None, ships=None):
+        """
+        Returns the outputs of a FAILING_RUN of mode and device resumed by
+        a plain run, each with --resume. The CSVs of the first run are
+        removed, as the resumed run writes them again.
+        """
+        def runner(tree, args):
+            before = set(os.listdir(tree))
+            run(tree, [mode, device] + args + ["--resume"], FAILING_RUN,
+                check=False)
+            for name in set(os.listdir(tree)) - before:
+                if name.endswith(".csv"):
+                    os.remove(os.path.join(tree, name))
+            run(tree, args + ["--resume"])
+            os.remove(os.path.join(tree, "dateparse_journal.jsonl"))
+        return run_ships(list(flags), runner, source, ships)
+
+    def test_journal_only_with_resume(self):
+        tree = new_tree()
+        run(tree, ["RR", "x", "-a"] + OUTPUT_FLAGS)
+        self.assertEqual([name for name in os.listdir(tree)
+                          if name.startswith("dateparse_journal")], [])
+        run(tree, ["fail", "met", "RR", "x", "-a"] + OUTPUT_FLAGS +
+            ["--resume"], FAILING_RUN)
+        lines = testSupport.read(
+            os.path.join(tree, "dateparse_journal.jsonl")).split("\n")
+        self.assertEqual(json.loads(lines[0]),
+                         {"args": ["RR", "x", "-a"] + OUTPUT_FLAGS})
+        entries = [json.loads(line) for line in lines[1:-1]]
+        self.assertEqual(sorted((entry["unit"], entry["status"])
+                                for entry in entries),
+                         [("RR1901/gps", "finished"),
+                          ("RR1901/gyro", "finished"),
+                          ("RR1901/met", "failed")])
+        self.assertIn({"unit": "RR1901/gps", "status": "finished",
+                       "ranges": [["RR1901", "gps", to_seconds(hour(0)),
+                                   to_seconds(hour(FILES - 1))]],
+                       "gaps": []}, entries)
+
+    def test_resumed_after_crash(self):
+        self.assertMatchesPlain(self.resumed("crash", "2"))
+
+    def test_resumed_after_failed_devices(self):
+        self.assertMatchesPlain(self.resumed("fail", "met"))
+        self.assertMatchesPlain(self.resumed("fail", "gps", ["-j", "2"]))
+
+    @unittest.skipIf(sys.version_info[0] < 3, "-n needs Python 3")
+    def test_resumed_listing_run(self):
+        self.assertMatchesPlain(self.resumed("fail", "gyro", ["-n", "2"]))
+
+    def test_resumed_after_unlisted_cruise(self):
+        ships = [["RR", "-a"]]
+        found = self.resumed("unlisted", "RR1902", [],
+                             testSupport.shared_tree(), ships)
+        self.assertEqual(found, run_ships([], source=testSupport.shared_tree(),
+                                          ships=ships))
+        self.assertEqual(found["RR1902_MINMAX_UPDATE.sql"],
+                         minmax_sql("RR1902", hour(3), hour(FILES + 2)))
+
+    def test_resumed_overlap_check(self):
+        # with -u every unit is parsed again, so the overlaps of the units
+        # finished before are found
+        ships = [["RR", "-a"]]
+        found = self.resumed("fail", "met", ["-u"],
+                             testSupport.shared_tree(), ships)
+        self.assertEqual(found, run_ships(
+            ["-u"], source=testSupport.shared_tree(), ships=ships))
+        self.assertEqual(found["overlaps.csv"].split("\n")[1:], [
+            "gps,RR1902,RR1901,{0},{1},3".format(hour(3), hour(FILES - 1)),
+            ""])
+        self.assertEqual(len(found["duplicates.csv"].split("\n")), 5)
+
+
+class BatchParseTest(RunTest):
+
+    def test_batch_parse(self):
+        testSupport.importorskip("numpy")
+        for flags in ([], ["-e"], ["-G", "2"]):
+            found = run_ships(flags + ["-b"])
+            self.assertMatchesPlain(found, flags)
+            self.assertEqual(found["RC0101_gyro.sql"].split("\n")[2],
+                             self.plain_outputs(flags)[
+                                 "RC0101_gyro.sql"].split("\n")[2])
+
+    def test_batch_parse_gives_file_dates(self):
+        testSupport.importorskip("numpy")
+        import parseFunctions
+        import parserRegistry
+        from resultStore import FileDates
+        names = [hour(i).strftime("gps_%Y%m%d%H%M%S") for i in (2, 0, 1)]
+        mindate, maxdate, file_dates, count = parseFunctions.parse_files_batch(
+            parserRegistry.DEFAULT, "RR1901", names + ["gps_20199999999999"])
+        self.assertTrue(isinstance(file_dates, FileDates))
+        self.assertEqual(list(file_dates.seconds_pairs()), [
+            (to_seconds(hour(i)), name) for i, name in zip((2, 0, 1), names)])
+        self.assertEqual((mindate, maxdate, count), (hour(0), hour(2), 4))
+
+    @unittest.skipIf(load_numpy() is not None, "numpy is installed")
+    def test_batch_parse_needs_numpy(self):
+        tree = new_tree()
+        self.assertIn("-b needs numpy", testSupport.output(
+            tree, ["RR", "x", "-a"] + OUTPUT_FLAGS + ["-b"]))
+        self.assertEqual(outputs(tree), {})
+
+
+def gap_tree():
+    """
+    Returns a copy of the tree whose RR1901 gps files have a gap of two
+    files after 01:00, a duplicate of 05:00, and gp_20190101060000 dated
+    after a file whose name sorts after its own
+    """
+    tree = new_tree()
+    gps = os.path.join(tree, "RR1901", "data", "SerialInstruments", "gps")
+    for i in (2, 3):
+        os.remove(os.path.join(gps, hour(i).strftime("gps_%Y%m%d%H%M%S")))
+    for filename in ("gpsb_20190101050000", "gp_20190101060000"):
+        open(os.path.join(gps, filename), "w").close()
+    return tree
+
+
+GAP_ROWS = [
+    "gps,files,2019-01-01 00:00:00,2019-01-01 06:00:00,3600,6,hourly",
+    "gps,gaps,,,10800,1,",
+    "gps,duplicates,,,,1,",
+    "gps,out_of_order,,,,1,",
+    "gps,gap,2019-01-01 01:00:00,2019-01-01 04:00:00,10800,2,"
+    "gps_20190101040000",
+    "gps,duplicate,2019-01-01 05:00:00,2019-01-01 05:00:00,0,1,"
+    "gpsb_20190101050000",
+    "gps,out_of_order,2019-01-01 06:00:00,2019-01-01 05:00:00,3600,1,"
+    "gp_20190101060000"]
+
+
+class GapReportTest(RunTest):
+
+    def check_rows(self, found):
+        rows = found["RR1901_gaps.csv"].split("\n")
+        self.assertEqual(rows[0], "devicetype,kind,start_date,end_date,"
+                         "seconds,count,filename")
+        self.assertEqual([row for row in rows if row.startswith("gps,")],
+                         GAP_ROWS)
+        self.assertIn("met,files,{0},{1},3600,{2},hourly".format(
+            hour(0), hour(FILES - 1), FILES), rows)
+        self.assertIn("met,gaps,,,0,0,", rows)
+
+    def test_gap_report(self):
+        found = run_ships(["-G", "2"], source=gap_tree(),
+                          ships=[["RR", "-a"]])
+        self.check_rows(found)
+        self.assertIn("RR1901,gps,{0},{1}".format(hour(0), hour(6)),
+                      found["RR1901_dateranges.csv"].split("\n"))
+
+    def test_resumed_gap_report(self):
+        # the resumed run writes the rows of the units finished before it
+        # from the journal, in their place
+        def runner(tree, args):
+            before = set(os.listdir(tree))
+            run(tree, ["fail", "met"] + args + ["--resume"], FAILING_RUN)
+            for name in set(os.listdir(tree)) - before:
+                if name.endswith(".csv"):
+                    os.remove(os.path.join(tree, name))
+            run(tree, args + ["--resume"])
+        found = run_ships(["-G", "2"], runner, gap_tree(), [["RR", "-a"]])
+        self.check_rows(found)
+        self.assertEqual(found, run_ships(["-G", "2"], source=gap_tree(),
+                                          ships=[["RR", "-a"]]))
+
+
+UNDATED_START = hour(2).replace(minute=30)
+UNDATED_END = hour(3).replace(minute=15)
+
+
+def undated_tree():
+    """
+    Returns a copy of the tree with an RR1901 gps file whose name holds no
+    date, so -f dates it from its content, from 02:30 to 03:15. It is the
+    last file by name, and the third by date.
+    """
+    tree = new_tree()
+    testSupport.nmea_file(
+        os.path.join(tree, "RR1901", "data", "SerialInstruments", "gps",
+                     "gps_20199999999999"),
+        UNDATED_START, UNDATED_END)
+    return tree
+
+
+class EndTimesTest(RunTest):
+
+    def last_gps(self, tree):
+        return os.path.join(tree, "RR1901", "data", "SerialInstruments", "gps",
+                            hour(FILES - 1).strftime("gps_%Y%m%d%H%M%S"))
+
+    def test_ends_at_next_start(self):
+        found = run_ships(["-e"], ships=[["RR", "-a"], ["SKQ", "-a"]])
+        self.assertEqual(found["RR1901_gps.sql"], "".join(
+            file_sql("RR1901", hour(i).strftime("gps_%Y%m%d%H%M%S"), hour(i),
+                     hour(i + 1) if i + 1 < FILES else None) + "\n"
+            for i in range(FILES)))
+        self.assertEqual(found["SKQ201901_met.sql"].split("\n")[1], file_sql(
+            "SKQ201901", "met.20190101T0100Z", hour(1), hour(2)))
+        self.assertIn("RR1901,gps,{0},{1}".format(hour(0), hour(FILES - 1)),
+                      found["RR1901_dateranges.csv"].split("\n"))
+
+    def test_last_end_from_content(self):
+        tree = new_tree()
+        end = hour(FILES - 1).replace(minute=40)
+        testSupport.nmea_file(self.last_gps(tree), hour(FILES - 1), end)
+        found = run_ships(["-e"], source=tree, ships=[["RR", "-a"]])
+        lines = found["RR1901_gps.sql"].split("\n")
+        self.assertEqual(lines[FILES - 2], file_sql(
+            "RR1901", hour(FILES - 2).strftime("gps_%Y%m%d%H%M%S"),
+            hour(FILES - 2), hour(FILES - 1)))
+        self.assertEqual(lines[FILES - 1], file_sql(
+            "RR1901", hour(FILES - 1).strftime("gps_%Y%m%d%H%M%S"),
+            hour(FILES - 1), end))
+        rows = found["RR1901_dateranges.csv"].split("\n")
+        self.assertIn("RR1901,gps,{0},{1}".format(hour(0), end), rows)
+        self.assertIn("RR1901,met,{0},{1}".format(hour(0), hour(FILES - 1)),
+                      rows)
+
+    def test_content_end_before_start(self):
+        tree = new_tree()
+        testSupport.nmea_file(self.last_gps(tree), hour(0), hour(1))
+        found = run_ships(["-e"], source=tree, ships=[["RR", "-a"]])
+        self.assertEqual(found["RR1901_gps.sql"].split("\n")[FILES - 1],
+                         file_sql("RR1901",
+                                  hour(FILES - 1).strftime("gps_%Y%m%d%H%M%S"),
+                                  hour(FILES - 1)))
+
+
+class ContentFallbackTest(RunTest):
+
+    def test_undated_raw_file(self):
+        # three times the bytes read from each end, so its end is only in
+        # its tail
+        tree = new_tree()
+        testSupport.nmea_file(
+            os.path.join(tree, "TN101", "scs", "gps",
+                         "gps_20199999-999999.Raw"),
+            UNDATED_START, UNDATED_END, 3 * 8192)
+        run(tree, ["TN", "x", "-a", "-c", "-l", "-m", "-f", "-e"])
+        found = outputs(tree)
+        lines = found["TN101_gps.sql"].split("\n")
+        self.assertEqual(lines[2], file_sql(
+            "TN101", "gps_20190101-020000.Raw", hour(2), UNDATED_START))
+        self.assertEqual(lines[3], file_sql(
+            "TN101", "gps_20199999-999999.Raw", UNDATED_START, UNDATED_END))
+        self.assertEqual(lines[4], file_sql(
+            "TN101", "gps_20190101-030000.Raw", hour(3), hour(4)))
+        self.assertEqual(found["TN101_met.sql"].split("\n")[2], file_sql(
+            "TN101", "met_20190101-020000.Raw", hour(2), hour(3)))
+
+    def test_undated_file_without_end_times(self):
+        found = run_ships(["-f"], source=undated_tree(), ships=[["RR", "-a"]])
+        self.assertEqual(found["RR1901_gps.sql"].split("\n")[3], file_sql(
+            "RR1901", "gps_20199999999999", UNDATED_START))
+        self.assertEqual(found["RR1901_gps.sql"].count("\n"), FILES + 1)
+
+
+class ParallelTest(RunTest):
+
+    def test_parallel_run(self):
+        self.assertMatchesPlain(run_ships(["-j", "2"]))
+
+    def test_parallel_run_of_each_output(self):
+        for flags in (["-e"], ["-s", "values"], ["-s", "copy"], ["-G", "2"]):
+            self.assertMatchesPlain(run_ships(flags + ["-j", "2"]), flags)
+
+
+# a cruise of each parser, for the runs made once per flag
+SPAWN_SHIPS = [["RR", "-a"], ["RC", "-a"], ["BH", "-a"]]
+
+
+@unittest.skipIf(sys.version_info[0] < 3, "Python 2 workers are always forked")
+class SpawnTest(RunTest):
+    """
+    Workers started with spawn or forkserver are given the settings of the
+    run by runFunctions.init_worker, so each flag that sets one gives the
+    same outputs with them as in a serial run
+    """
+
+    def spawned(self, flags, method="spawn", source=None, runner=None):
+        def spawn_runner(tree, args):
+            args = [method] + args + ["-j", "2"]
+            if runner is None:
+                run(tree, args, START_METHOD_RUN)
+            else:
+                runner(tree, args, START_METHOD_RUN)
+        return run_ships(flags, spawn_runner, source, SPAWN_SHIPS)
+
+    def assertSpawnedMatches(self, flags, source=None, runner=None):
+        def serial_runner(tree, args, script=None):
+            if runner is None:
+                run(tree, args)
+            else:
+                runner(tree, args)
+        found = self.spawned(flags, source=source, runner=runner)
+        self.assertEqual(found, run_ships(flags, serial_runner, source,
+                                          SPAWN_SHIPS))
+        return found
+
+    def test_start_methods(self):
+        for method in ("spawn", "forkserver"):
+            self.assertMatchesPlain(run_ships(
+                ["-j", "2"], lambda tree, args: run(
+                    tree, [method] + args + ["-j", "2"], START_METHOD_RUN)))
+
+    def test_end_times(self):
+        found = self.assertSpawnedMatches(["-e"])
+        self.assertEqual(found["RR1901_gps.sql"].split("\n")[0], file_sql(
+            "RR1901", "gps_20190101000000", hour(0), hour(1)))
+
+    def test_gap_report(self):
+        found = self.assertSpawnedMatches(["-G", "2"])
+        self.assertTrue([name for name in found if name.endswith("_gaps.csv")])
+
+    def test_streamed_sql(self):
+        found = self.assertSpawnedMatches(["-w", "filename", "-f"],
+                                          undated_tree())
+        self.assertEqual(found["RR1901_gps.sql"].split("\n")[FILES], file_sql(
+            "RR1901", "gps_20199999999999", UNDATED_START))
+
+    def test_content_fallback(self):
+        found = self.assertSpawnedMatches(["-f"], undated_tree())
+        self.assertEqual(found["RR1901_gps.sql"].split("\n")[3], file_sql(
+            "RR1901", "gps_20199999999999", UNDATED_START))
+
+    def test_batch_parse(self):
+        testSupport.importorskip("numpy")
+        self.assertSpawnedMatches(["-b"])
+
+    def test_incremental_run(self):
+        def twice(tree, args, script=None):
+            # the second run parses nothing, and gives the dates of the
+            # manifest of the first, moved a minute on
+            before = set(os.listdir(tree))
+            run(tree, args, script)
+            for name in set(os.listdir(tree)) - before:
+                if name.endswith(".sql") or name.endswith(".csv"):
+                    os.remove(os.path.join(tree, name))
+            path = os.path.join(tree, "dateparse_manifest.json")
+            f = open(path)
+            try:
+                entries = json.load(f)
+            finally:
+                f.close()
+            for entry in entries.values():
+                for filename, seconds in entry["files"].items():
+                    entry["files"][filename] = seconds + 60
+            f = open(path, "w")
+            try:
+                json.dump(entries, f)
+            finally:
+                f.close()
+            run(tree, args, script)
+        found = self.assertSpawnedMatches(["-i"], runner=twice)
+        self.assertEqual(found["RR1901_gps.sql"].split("\n")[0], file_sql(
+            "RR1901", "gps_20190101000000", hour(0).replace(minute=1)))
+
+    def test_stage_profile(self):
+        def stages(found):
+            rows = found.pop("profile.csv").split("\n")[1:-1]
+            return sorted(set(",".join(row.split(",")[:3]) for row in rows))
+        tree = new_tree()
+        run(tree, ["spawn", "RR", "x", "-a", "-c", "-l", "-j", "2",
+                   "--profile"], START_METHOD_RUN)
+        found = outputs(tree)
+        spawned = stages(found)
+        self.assertIn("RR1901,gps,parse", spawned)
+        tree = new_tree()
+        run(tree, ["RR", "x", "-a", "-c", "-l", "--profile"])
+        self.assertEqual(spawned, stages(outputs(tree)))
+
+
+def archive_tree():
+    """
+    Returns a shipment directory holding every cruise of the template tree
+    as [cruise].tar, and no cruise directories
+    """
+    tree = new_tree("")
+    for cruise in sorted(os.listdir(testSupport.template)):
+        archive = tarfile.open(os.path.join(tree, cruise + ".tar"), "w")
+        try:
+            archive.add(os.path.join(testSupport.template, cruise), cruise)
+        finally:
+            archive.close()
+    return tree
+
+
+def sorted_rows(found):
+    """
+    Returns outputs with the rows of the CSVs sorted. Archive listings are
+    sorted, while extracted directories come in scandir order, so the
+    devices of a cruise can be in another order.
+    """
+    return dict((name, sorted(content.split("\n"))
+                 if name.endswith(".csv") else content)
+                for name, content in found.items())
+
+
+class ArchiveTest(RunTest):
+
+    def test_archived_cruises(self):
+        found = run_ships(["-t"], source=archive_tree())
+        self.assertEqual(sorted_rows(found), sorted_rows(self.plain_outputs()))
+        self.assertEqual(found["RR1901_dateranges.csv"].split("\n")[1:-1], [
+            "RR1901,{0},{1},{2}".format(device, hour(0), hour(FILES - 1))
+            for device in sorted(DEVICES)])
+
+    def test_archived_cruises_in_parallel(self):
+        expected = run_ships(["-t"], source=archive_tree())
+        self.assertEqual(
+            run_ships(["-t", "-j", "2"], source=archive_tree()), expected)
+
+    @unittest.skipIf(sys.version_info[0] < 3,
+                     "Python 2 workers are always forked")
+    def test_archived_cruises_in_spawned_workers(self):
+        expected = run_ships(["-t"], source=archive_tree())
+        for method in ("spawn", "forkserver"):
+            def runner(tree, args):
+                run(tree, [method] + args, START_METHOD_RUN)
+            self.assertEqual(run_ships(["-t", "-j", "2"], runner,
+                                       archive_tree()), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
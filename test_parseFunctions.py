@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""
+Tests of parseFunctions called as a library, without parseDate.py
+
+python -m unittest test_parseFunctions, or pytest
+"""
+
+import os
+import unittest
+import testSupport
+from testSupport import hour, new_tree, file_sql, FILES
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+parseFunctions = None
+
+
+def setUpModule():
+    global parseFunctions
+    testSupport.setup()
+    import parseFunctions  # needs the config
+
+
+class LibraryTest(unittest.TestCase):
+    """
+    Runs each test in a fresh copy of the tree, with the module settings
+    it changes put back afterwards
+    """
+
+    def setUp(self):
+        self.tree = new_tree()
+        self.output = new_tree("")
+        cwd = os.getcwd()
+        os.chdir(self.tree)
+        self.addCleanup(os.chdir, cwd)
+        for name in ("stream_order", "sql_mode", "content_fallback",
+                     "end_times", "gap_factor", "manifest"):
+            self.addCleanup(setattr, parseFunctions, name,
+                            getattr(parseFunctions, name))
+
+    def written(self, path):
+        return sorted(name for name in os.listdir(path)
+                      if name.endswith(".sql") or name.endswith(".csv"))
+
+
+class SQLFileWriterTest(LibraryTest):
+
+    def test_output_path(self):
+        writer = parseFunctions.SQLFileWriter(
+            "RR1901", "gps", memory_rows=2,
+            output_path=os.path.join(self.output, ""))
+        for i in (2, 0, 3, 1):
+            writer.add(hour(i), "gps_{0}".format(i))
+        sql_path = os.path.join(self.output, "RR1901_gps.sql")
+        self.assertEqual(writer.close(), [sql_path])
+        self.assertEqual(testSupport.read(sql_path), "".join(
+            file_sql("RR1901", "gps_{0}".format(i), hour(i)) + "\n"
+            for i in range(4)))
+        self.assertEqual(self.written(self.tree), [])
+
+    def test_staging_csv_in_output_path(self):
+        writer = parseFunctions.SQLFileWriter(
+            "RR1901", "gps", "copy", output_path=os.path.join(self.output, ""))
+        writer.add(hour(0), "gps_0")
+        self.assertEqual(len(writer.close()), 2)
+        self.assertEqual(self.written(self.output),
+                         ["RR1901_gps.sql", "RR1901_gps_staging.csv"])
+        self.assertEqual(testSupport.read(os.path.join(
+            self.output, "RR1901_gps_staging.csv")).split("\n")[1],
+            "RR1901,gps_0,2019-01-01 00:00:00")
+
+    def test_writers_of_one_file(self):
+        # as the ADCP directories of a Blue Heron cruise, parsed at once
+        output_path = os.path.join(self.output, "")
+        first = parseFunctions.SQLFileWriter("BH1901", "gp90",
+                                             output_path=output_path)
+        second = parseFunctions.SQLFileWriter("BH1901", "gp90",
+                                              output_path=output_path)
+        first.add(hour(0), "gp90_0")
+        second.add(hour(1), "gp90_1")
+        first.close()
+        second.close()
+        self.assertEqual(os.listdir(self.output), ["BH1901_gp90.sql"])
+        self.assertEqual(testSupport.read(os.path.join(
+            self.output, "BH1901_gp90.sql")),
+            file_sql("BH1901", "gp90_1", hour(1)) + "\n")
+
+    def test_discard(self):
+        writer = parseFunctions.SQLFileWriter(
+            "RR1901", "gps", "copy", output_path=os.path.join(self.output, ""))
+        writer.add(hour(0), "gps_0")
+        writer.discard()
+        self.assertEqual(os.listdir(self.output), [])
+
+    def test_write_result_moves_streamed_sql(self):
+        # the SQL is streamed during the parse, before the directory
+        # write_result writes to is known
+        parseFunctions.stream_order = "date"
+        results = parseFunctions.parse_unit(
+            ("1", "RR1901", "./", "gps", ""))
+        self.assertEqual(results[0].file_dates, None)
+        parseFunctions.write_result(results[0], False, False, True,
+                                    os.path.join(self.output, ""))
+        self.assertEqual(self.written(self.tree), [])
+        self.assertEqual(self.written(self.output), ["RR1901_gps.sql"])
+        self.assertEqual(testSupport.read(os.path.join(
+            self.output, "RR1901_gps.sql")).split("\n")[FILES - 1], file_sql(
+                "RR1901", hour(FILES - 1).strftime("gps_%Y%m%d%H%M%S"),
+                hour(FILES - 1)))
+
+
+def gps_dates():
+    """
+    Returns the (start date, filename) pairs of the gps files of RR1901
+    """
+    return [(hour(i), hour(i).strftime("gps_%Y%m%d%H%M%S"))
+            for i in range(FILES)]
+
+
+class ParseCruiseTest(LibraryTest):
+
+    def test_results(self):
+        results = parseFunctions.parse_cruise("RR1901", self.tree)
+        self.assertEqual(sorted(result.device for result in results),
+                         ["gps", "gyro", "met"])
+        gps = [result for result in results if result.device == "gps"][0]
+        self.assertEqual(list(gps.file_dates), gps_dates())
+        self.assertEqual((gps.cruise, gps.mindate, gps.maxdate),
+                         ("RR1901", hour(0), hour(FILES - 1)))
+        self.assertEqual((gps.file_ends, gps.stream_stats), (None, None))
+        results = parseFunctions.parse_cruise("BH1901", self.tree,
+                                              ["ADCP2"])
+        self.assertEqual([(result.device, result.device_dir)
+                          for result in results], [("gp90", "ADCP2")])
+
+    def test_run_settings_not_used(self):
+        # as a run with -w date -f -e -G 2 leaves them
+        parseFunctions.stream_order = "date"
+        parseFunctions.content_fallback = True
+        parseFunctions.end_times = True
+        parseFunctions.gap_factor = 2.0
+        testSupport.nmea_file(
+            os.path.join("RR1901", "data", "SerialInstruments", "gps",
+                         "gps_20199999999999"), hour(2), hour(3))
+        gps = parseFunctions.parse_cruise("RR1901", self.tree, ["gps"])[0]
+        self.assertEqual(list(gps.file_dates), gps_dates())
+        self.assertEqual((gps.file_ends, gps.stream_stats), (None, None))
+        self.assertEqual(self.written(self.tree), [])
+        self.assertEqual((parseFunctions.stream_order,
+                          parseFunctions.content_fallback,
+                          parseFunctions.end_times,
+                          parseFunctions.gap_factor),
+                         ("date", True, True, 2.0))
+
+    def test_settings(self):
+        testSupport.nmea_file(
+            os.path.join("RR1901", "data", "SerialInstruments", "gps",
+                         "gps_20199999999999"),
+            hour(2).replace(minute=30), hour(3))
+        gps = parseFunctions.parse_cruise(
+            "RR1901", self.tree, ["gps"], content_fallback=True,
+            end_times=True, gap_factor=2.0)[0]
+        self.assertEqual(list(gps.file_dates)[3],
+                         (hour(2).replace(minute=30), "gps_20199999999999"))
+        self.assertEqual(gps.file_ends, [hour(i + 1) for i in range(2)] + [
+            hour(2).replace(minute=30), hour(3)] +
+            [hour(i + 1) for i in range(3, FILES - 1)] + [None])
+        self.assertEqual((gps.stream_stats.files, gps.stream_stats.gap_count),
+                         (FILES + 1, 0))
+        self.assertEqual(parseFunctions.content_fallback, False)
+
+
+class FileEndDatesTest(LibraryTest):
+
+    def setUp(self):
+        LibraryTest.setUp(self)
+        self.gps = os.path.join(self.tree, "RR1901", "data",
+                                "SerialInstruments", "gps")
+        # gps_1b is a second file of the same start
+        self.file_dates = [(hour(0), "gps_0"), (hour(1), "gps_1"),
+                           (hour(1), "gps_1b"), (hour(2), "gps_2")]
+        for filedate, filename in self.file_dates:
+            open(os.path.join(self.gps, filename), "w").close()
+
+    def test_next_later_start(self):
+        self.assertEqual(parseFunctions.file_end_dates(self.file_dates,
+                                                       self.gps),
+                         [hour(1), hour(2), hour(2), None])
+        self.assertEqual(parseFunctions.file_end_dates([], self.gps), [])
+
+    def test_last_end_from_content(self):
+        end = hour(2).replace(minute=40)
+        testSupport.nmea_file(os.path.join(self.gps, "gps_2"), hour(2), end)
+        file_ends = parseFunctions.file_end_dates(self.file_dates, self.gps)
+        self.assertEqual(file_ends, [hour(1), hour(2), hour(2), end])
+        self.assertEqual(parseFunctions.last_end(hour(2), file_ends), end)
+        self.assertEqual(parseFunctions.last_end(hour(2), [None]), hour(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
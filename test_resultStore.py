@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Tests of resultStore.FileDates, the store of the start times of a device
+
+python -m unittest test_resultStore, or pytest
+"""
+
+import datetime
+import unittest
+from resultStore import FileDates, seconds_pairs
+from manifestCache import to_seconds
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+START = datetime.datetime(2019, 1, 1)
+
+PAIRS = [(START + datetime.timedelta(hours=2), "gps_20190101020000"),
+         (START, "met_20190101000000"),
+         (START, "gps_20190101000000"),
+         (START + datetime.timedelta(hours=1), "gps_20190101010000")]
+
+
+class FileDatesTest(unittest.TestCase):
+
+    def test_reads_as_pairs(self):
+        stored = FileDates(PAIRS)
+        self.assertEqual(list(stored), PAIRS)
+        self.assertEqual(stored[1], PAIRS[1])
+        self.assertEqual(stored[-1], PAIRS[-1])
+        self.assertEqual(stored[1:3], PAIRS[1:3])
+        self.assertEqual(list(stored.filenames()),
+                         [filename for filedate, filename in PAIRS])
+
+    def test_from_seconds_pairs(self):
+        stored = FileDates.from_seconds_pairs(
+            (to_seconds(filedate), filename) for filedate, filename in PAIRS)
+        self.assertEqual(list(stored), PAIRS)
+        self.assertEqual(list(seconds_pairs(stored)),
+                         list(seconds_pairs(PAIRS)))
+
+    def test_sort_and_extend(self):
+        stored = FileDates(PAIRS[:2])
+        stored.extend(PAIRS[2:])
+        stored.sort()
+        self.assertEqual(list(stored), sorted(PAIRS))
+        stored.append(START - datetime.timedelta(hours=1), "gyro_x")
+        self.assertEqual(stored[0][1], "gps_20190101000000")
+        stored.sort()
+        self.assertEqual(stored[0][1], "gyro_x")
+        self.assertEqual(stored.filename(2), "met_20190101000000")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+Tests of the watch daemon, driven one batch at a time with a PollWatcher
+on a copy of the testSupport tree
+
+python -m unittest test_watchDaemon, or pytest
+"""
+
+import os
+import time
+import unittest
+import testSupport
+from testSupport import hour, new_tree, file_sql, FILES
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+parseFunctions = None
+watchDaemon = None
+
+
+def setUpModule():
+    global parseFunctions, watchDaemon
+    testSupport.setup()
+    import parseFunctions  # needs the config
+    import watchDaemon
+
+
+class ShipmentWatchTest(unittest.TestCase):
+
+    def setUp(self):
+        from rangeAggregator import RangeAggregator
+        self.tree = new_tree()
+        self.output = new_tree("")
+        cwd = os.getcwd()
+        os.chdir(self.tree)
+        self.addCleanup(os.chdir, cwd)
+        for name in ("content_fallback", "range_aggregator", "isoDate"):
+            self.addCleanup(setattr, parseFunctions, name,
+                            getattr(parseFunctions, name))
+        parseFunctions.begin_run()
+        parseFunctions.range_aggregator = RangeAggregator()
+        self.gps = os.path.join(self.tree, "RR1901", "data",
+                                "SerialInstruments", "gps")
+        self.watch = watchDaemon.ShipmentWatch(
+            watchDaemon.PollWatcher(0.01), "RR1901",
+            os.path.join(self.tree, ""), "", all_devices=True)
+        self.parsed = []  # the names of every parse_unit call
+        parse_unit = watchDaemon.parse_unit
+
+        def recording(unit, listing=None):
+            self.parsed.append(sorted(listing[1]))
+            return parse_unit(unit, listing)
+        watchDaemon.parse_unit = recording
+        self.addCleanup(setattr, watchDaemon, "parse_unit", parse_unit)
+
+    def drop(self, *filenames):
+        for filename in filenames:
+            open(os.path.join(self.gps, filename), "w").close()
+        # a later mtime than the poll saw, on filesystems of coarse mtimes
+        later = time.time() + 10
+        os.utime(self.gps, (later, later))
+
+    def batch(self):
+        """
+        Parses what changed since the last batch and returns the outputs
+        of the batch written for it, or None if there was nothing to write
+        """
+        self.watch.changed(self.watch.watcher.wait(1))
+        results = self.watch.parse_dirty()
+        if not results:
+            return None
+        return testSupport.outputs(watchDaemon.write_batch(
+            results, self.output, True, True, True))
+
+    def test_new_file_batch(self):
+        self.watch.start()
+        found = testSupport.outputs(watchDaemon.write_batch(
+            self.watch.parse_dirty(), self.output, True, True, True))
+        self.assertEqual(found["RR1901_gps.sql"].count("\n"), FILES)
+        del self.parsed[:]
+
+        name = hour(FILES).strftime("gps_%Y%m%d%H%M%S")
+        self.drop(name)
+        found = self.batch()
+        self.assertEqual(self.parsed, [[name]])
+        self.assertEqual(found["RR1901_gps.sql"],
+                         file_sql("RR1901", name, hour(FILES)) + "\n")
+        self.assertEqual(sorted(found), ["RR1901_MINMAX_UPDATE.sql",
+                                         "RR1901_dateranges.csv",
+                                         "RR1901_gps.sql"])
+        # the range covers every file seen since start up
+        self.assertIn("RR1901,gps,{0},{1}".format(hour(0), hour(FILES)),
+                      found["RR1901_dateranges.csv"].split("\n"))
+
+    def test_names_the_regex_leaves_out(self):
+        parseFunctions.content_fallback = True
+        self.watch.start()
+        self.watch.parse_dirty()
+        del self.parsed[:]
+
+        # notes.txt is left out by the RR regex; the undated file has no
+        # timestamps until it is written
+        self.drop("notes.txt", "gps_20199999999999")
+        self.assertEqual(self.batch()["RR1901_gps.sql"], "")
+        self.assertEqual(self.parsed, [["gps_20199999999999"]])
+        self.assertIn("notes.txt", self.watch.known[self.gps])
+        self.assertNotIn("gps_20199999999999", self.watch.known[self.gps])
+
+        testSupport.nmea_file(os.path.join(self.gps, "gps_20199999999999"),
+                              hour(2), hour(3))
+        self.drop()
+        found = self.batch()
+        self.assertEqual(self.parsed, [["gps_20199999999999"]] * 2)
+        self.assertEqual(found["RR1901_gps.sql"], file_sql(
+            "RR1901", "gps_20199999999999", hour(2)) + "\n")
+
+        self.drop()
+        self.assertEqual(self.batch(), None)
+        self.assertEqual(len(self.parsed), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
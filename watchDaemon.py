@@ -0,0 +1,633 @@
+#!/usr/bin/env python
+"""
+This program contains the watch daemon, which dates the files of a
+shipment directory as they arrive instead of in scheduled runs over the
+whole directory. The shipment directory, the instrument directory of each
+cruise and every device directory are watched, with inotify where the
+kernel has it, else by polling the directory mtimes. Changes are gathered
+for a short window, then only the new files of the changed directories are
+parsed, and their SQL, CSV and database updates are written as one batch.
+An idle daemon is blocked in the kernel, or makes one stat per directory
+per poll interval.
+
+./watchDaemon.py [cruise or ship prefix] [filepattern] [flags]: run in the
+    shipment directory; watches one cruise, or with -a every cruise of the
+    ship, including cruises that appear later
+
+-c: watches all devices
+-a: watches all cruises matching the ship prefix
+-l, -m, -d: write the file update SQL, the date range SQL and the date
+    range CSV, as for parseDate.py; with none of them only the CSV is
+    written
+-D [database]: applies the -l and -m updates to the database, as for
+    parseDate.py
+-f: dates files whose names hold no date from their content
+-k: files already there at start up are parsed but not written out
+-w [seconds]: the batch window, 2 by default
+-P [seconds]: polls directory mtimes at this interval even if inotify
+    is available
+-O [directory]: where batches are written, ./dateparse_watch by default,
+    each in a subdirectory named by the time it was written; a directory
+    in the shipment directory is never taken for a cruise
+-R [hours]: with -a, a cruise that no new files arrived for in this long
+    is finished; it is no longer watched and the files seen in it are
+    forgotten. 168 (a week) by default, 0 to never finish cruises. A
+    cruise whose directory is removed is always finished.
+
+Each batch holds the file update SQL of the new files only. Date ranges
+cover every file seen since start up, so the range SQL and CSV of a batch
+replace those of earlier batches.
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import signal
+import ctypes
+import ctypes.util
+import datetime
+import parseFunctions
+from parseFunctions import (listCruises, list_units, parse_unit, unit_path,
+                            unit_regex, device_path, write_result,
+                            generate_cruise_startend_sql, say)
+from scanFunctions import scan_files, path_mtime
+from runFunctions import finish_run
+from dbSink import DatabaseSink, connect_spec
+from rangeAggregator import RangeAggregator
+from shipProfiles import cruise_profile
+
+__author__ = "David Dempsey"
+__copyright__ = "Copyright 2020, Rolling Deck to Repository"
+__credits__ = "David Dempsey"
+
+__license__ = "No license"
+__version__ = "1.0.0"
+__maintainer__ = "David Dempsey"
+__email__ = "ddempsey@ucsd.edu"
+__status__ = "Development"
+
+DEFAULT_WINDOW = 2.0
+DEFAULT_POLL_INTERVAL = 5.0
+DEFAULT_RETIRE_HOURS = 168.0
+OUTPUT_DIR = "dateparse_watch"
+
+# inotify events that change the names in a directory, or the content of
+# a file in it, and the overflow and removed watch events
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+EVENT_HEADER = 16  # int wd; uint32 mask, cookie, len
+
+
+class InotifyWatcher(object):
+    """
+    Directory watches through the Linux inotify calls of libc. Raises
+    OSError when inotify is not available.
+    """
+
+    def __init__(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            inotify_init = libc.inotify_init
+        except (OSError, AttributeError):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.libc = libc
+        self.fd = inotify_init()
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.paths = {}  # watch descriptor: directory
+        self.polling = False
+
+    def watch(self, path):
+        """
+        Watches a directory, raising OSError if it cannot be watched
+
+        path: The directory
+        """
+        name = path
+        if not isinstance(name, bytes):
+            name = name.encode(sys.getfilesystemencoding())
+        wd = self.libc.inotify_add_watch(self.fd, name, INOTIFY_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        self.paths[wd] = path
+
+    def unwatch(self, path):
+        """
+        Stops watching a directory, if it is watched
+        """
+        for wd, watched in list(self.paths.items()):
+            if watched == path:
+                del self.paths[wd]
+                self.libc.inotify_rm_watch(self.fd, wd)
+
+    def wait(self, timeout):
+        """
+        Waits up to timeout seconds, forever if None, for changes and
+        returns the set of directories that changed, or None if events
+        were lost and everything has to be listed again
+        """
+        try:
+            readable = select.select([self.fd], [], [], timeout)[0]
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return set()
+            raise
+        if not readable:
+            return set()
+        data = os.read(self.fd, 65536)
+        changed = set()
+        offset = 0
+        while offset + EVENT_HEADER <= len(data):
+            wd, mask, cookie, length = struct.unpack_from("iIII", data, offset)
+            offset += EVENT_HEADER + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            path = self.paths.get(wd)
+            if path is None:
+                continue
+            if mask & IN_IGNORED:  # the directory is gone
+                del self.paths[wd]
+            changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollWatcher(object):
+    """
+    Directory watches by comparing directory mtimes every interval, for
+    systems and network filesystems without inotify. A directory's mtime
+    changes when files are added to it or renamed into it.
+
+    interval: The seconds between polls
+    """
+
+    def __init__(self, interval=DEFAULT_POLL_INTERVAL):
+        self.interval = interval
+        self.mtimes = {}
+        self.polling = True
+
+    def watch(self, path):
+        """
+        Watches a directory, raising OSError if it cannot be read
+
+        path: The directory
+        """
+        self.mtimes[path] = path_mtime(path)
+
+    def unwatch(self, path):
+        """
+        Stops watching a directory, if it is watched
+        """
+        self.mtimes.pop(path, None)
+
+    def wait(self, timeout):
+        """
+        Polls until a directory changes or timeout seconds pass, forever
+        if None, and returns the set of directories that changed
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            changed = set()
+            for path, mtime in list(self.mtimes.items()):
+                try:
+                    current = path_mtime(path)
+                except OSError:
+                    del self.mtimes[path]  # the directory is gone
+                    current = None
+                if current != mtime:
+                    if current is not None:
+                        self.mtimes[path] = current
+                    changed.add(path)
+            if changed:
+                return changed
+            if deadline is None:
+                time.sleep(self.interval)
+                continue
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return changed
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        self.mtimes = {}
+
+
+def make_watcher(poll_interval=None):
+    """
+    Returns an InotifyWatcher, or a PollWatcher when inotify is not
+    available or poll_interval is given
+
+    poll_interval: The seconds between polls, None for inotify
+    """
+    if poll_interval is None:
+        try:
+            return InotifyWatcher()
+        except OSError:
+            poll_interval = DEFAULT_POLL_INTERVAL
+    return PollWatcher(poll_interval)
+
+
+class ShipmentWatch(object):
+    """
+    The watched directories of a shipment directory and the files already
+    dated in each. Device directories are keyed by their unit_path.
+
+    watcher: The InotifyWatcher or PollWatcher to watch with
+    cruise_arg: The cruise ID, or ship prefix when all_cruises is set
+    shipment_path: The shipment directory, ending in '/'
+    filepattern: The device to watch when not watching all devices
+    all_devices: True if watching all devices of each cruise
+    all_cruises: True if watching every cruise matching cruise_arg
+    retire_after: With all_cruises, the seconds after the last new file
+        of a cruise it is finished in, None to never finish cruises
+    exclude: Names in the shipment directory that are not cruises, such
+        as the directory batches are written to
+    """
+
+    def __init__(self, watcher, cruise_arg, shipment_path, filepattern,
+                 all_devices=False, all_cruises=False, retire_after=None,
+                 exclude=()):
+        self.watcher = watcher
+        self.cruise_arg = cruise_arg
+        self.shipment_path = shipment_path
+        self.filepattern = filepattern
+        self.all_devices = all_devices
+        self.all_cruises = all_cruises
+        self.retire_after = retire_after
+        self.exclude = set(exclude)
+        self.cruises = {}   # instrument directory: cruise ID
+        self.units = {}     # device directory: unit
+        self.known = {}     # device directory: set of names already parsed
+        self.ranges = {}    # (cruise, device): (mindate, maxdate)
+        self.last_files = {}  # cruise ID: time its last new files came
+        self.finished = set()  # cruise IDs no longer watched
+        self.pending = set()  # device directories that could not be watched
+        self.pending_cruises = set()  # cruises that could not be watched
+        self.dirty = set()  # device directories to list again
+
+    def start(self):
+        """
+        Watches the shipment directory and every cruise in it, and marks
+        every device directory to be parsed
+        """
+        if self.all_cruises:
+            self.watcher.watch(self.shipment_path)
+            self.add_cruises()
+        else:
+            self.add_cruise(self.cruise_arg)
+
+    def add_cruises(self):
+        """
+        Watches the cruises matching the ship prefix not watched yet
+        """
+        watched = set(self.cruises.values()) | self.pending_cruises | \
+            self.finished | self.exclude
+        for cruise in listCruises(self.cruise_arg, self.shipment_path):
+            if cruise not in watched:
+                self.add_cruise(cruise)
+
+    def add_cruise(self, cruise):
+        """
+        Watches the instrument directory of a cruise and its devices
+        """
+        path = self.instrument_path(cruise)
+        try:
+            self.watcher.watch(path)
+        except OSError:
+            if cruise not in self.pending_cruises:
+                say("Unable to watch cruise {0} at {1} yet".format(cruise, path))
+                self.pending_cruises.add(cruise)
+            return
+        self.pending_cruises.discard(cruise)
+        self.cruises[path] = cruise
+        self.last_files[cruise] = time.time()
+        self.add_units(cruise)
+
+    def instrument_path(self, cruise):
+        """
+        Returns the directory the device directories of a cruise are in
+        """
+        if self.dateparse_method(cruise) == '1':
+            return os.path.dirname(device_path(cruise.upper(),
+                                               self.shipment_path, ""))
+        return self.shipment_path + cruise
+
+    def dateparse_method(self, cruise):
+        return cruise_profile(cruise).dateparse_method
+
+    def add_units(self, cruise):
+        """
+        Watches the device directories of a cruise not watched yet
+        """
+        for unit in list_units(cruise, self.shipment_path, self.filepattern,
+                               self.dateparse_method(cruise),
+                               self.all_devices):
+            path = unit_path(unit)
+            if path not in self.units:
+                self.units[path] = unit
+                self.known[path] = set()
+                self.pending.add(path)
+        self.watch_pending()
+
+    def waiting(self):
+        """
+        Returns True if some directory could not be watched yet
+        """
+        return bool(self.pending or self.pending_cruises)
+
+    def watch_pending(self):
+        """
+        Watches the cruises and device directories that could not be
+        watched before, such as a new cruise whose instrument directory is
+        not there yet, or an ADCP directory without its raw/gp90
+        """
+        for cruise in sorted(self.pending_cruises):
+            self.add_cruise(cruise)
+        for path in sorted(self.pending):
+            try:
+                self.watcher.watch(path)
+            except OSError:
+                continue
+            self.pending.discard(path)
+            self.dirty.add(path)
+
+    def changed(self, paths):
+        """
+        Marks what has to be listed again for a set of changed
+        directories, or for everything when paths is None
+        """
+        if paths is None:
+            paths = set(self.cruises) | set(self.units)
+            if self.all_cruises:
+                paths.add(self.shipment_path)
+        for path in paths:
+            if path == self.shipment_path:
+                self.add_cruises()
+            elif path in self.cruises:
+                if os.path.isdir(path):
+                    self.add_units(self.cruises[path])
+                else:
+                    self.finish(self.cruises[path])  # moved away
+            elif path in self.units:
+                self.dirty.add(path)
+        self.watch_pending()
+
+    def finish_idle(self):
+        """
+        Finishes the cruises no new files arrived for in retire_after
+        """
+        if not self.all_cruises or self.retire_after is None:
+            return
+        idle = time.time() - self.retire_after
+        for cruise in sorted(set(self.cruises.values())):
+            if self.last_files.get(cruise, 0) < idle:
+                self.finish(cruise)
+
+    def finish(self, cruise):
+        """
+        Stops watching a finished cruise and forgets its files, so the
+        daemon only holds the cruises still being delivered. The cruise is
+        not taken up again.
+        """
+        say("Cruise {0} finished, no longer watched".format(cruise))
+        self.finished.add(cruise)
+        self.last_files.pop(cruise, None)
+        for path, watched in list(self.cruises.items()):
+            if watched == cruise:
+                del self.cruises[path]
+                self.watcher.unwatch(path)
+        for path, unit in list(self.units.items()):
+            if unit[1] == cruise:
+                del self.units[path]
+                del self.known[path]
+                self.pending.discard(path)
+                self.dirty.discard(path)
+                self.watcher.unwatch(path)
+        for key in list(self.ranges):
+            if key[0].upper() == cruise.upper():
+                del self.ranges[key]
+
+    def parse_dirty(self):
+        """
+        Parses the new files of every changed device directory and returns
+        their results, in directory order. Date ranges of the results are
+        widened to every file seen, so they can be written as they are.
+        """
+        results = []
+        for path in sorted(self.dirty):
+            known = self.known[path]
+            try:
+                names = [name for name in scan_files(path) if name not in known]
+            except OSError:
+                continue
+            if not names:
+                continue
+            unit = self.units[path]
+            self.last_files[unit[1]] = time.time()
+            # names the regex of the unit leaves out are never parsed
+            regex = unit_regex(unit)
+            if regex is not None:
+                known.update(name for name in names if not regex.search(name))
+                names = [name for name in names if regex.search(name)]
+                if not names:
+                    continue
+            # only the new names are handed to the parse, as its listing
+            unit_results = parse_unit(unit, (None, names))
+            if parseFunctions.content_fallback:
+                # names without a date may get one once the file is written
+                for result in unit_results:
+                    known.update(result.file_dates.filenames())
+            else:
+                known.update(names)
+            for result in unit_results:
+                self.widen(result)
+            results.extend(unit_results)
+        self.dirty = set()
+        return results
+
+    def widen(self, result):
+        """
+        Widens the date range of a result to the range of every file of
+        its device seen so far
+        """
+        key = (result.cruise, result.device)
+        if key in self.ranges:
+            mindate, maxdate = self.ranges[key]
+            result.mindate = min(result.mindate, mindate)
+            result.maxdate = max(result.maxdate, maxdate)
+            result.sql_startend_update = generate_cruise_startend_sql(
+                result.mindate, result.maxdate, result.cruise)
+        self.ranges[key] = (result.mindate, result.maxdate)
+
+
+def write_batch(results, output_dir, csvlog, datelog, filelog):
+    """
+    Writes the results of one batch into a new subdirectory of output_dir
+    and returns it
+
+    results: The DeviceResults of the batch
+    output_dir: The directory batches are written to
+    csvlog, datelog, filelog: As for write_result
+    """
+    batch_dir = os.path.join(output_dir, datetime.datetime.now().strftime(
+        '%Y-%m-%dT%H:%M:%S.%f'))
+    os.makedirs(batch_dir)
+    for result in results:
+        write_result(result, csvlog, datelog, filelog,
+                     os.path.join(batch_dir, ""))
+    parseFunctions.range_aggregator.write()
+    return batch_dir
+
+
+def run(shipment_watch, output_dir, csvlog, datelog, filelog,
+        window=DEFAULT_WINDOW, write_existing=True):
+    """
+    Watches a shipment directory until stopped, writing a batch for each
+    window of changes
+
+    shipment_watch: The ShipmentWatch of the shipment directory
+    output_dir: The directory batches are written to
+    csvlog, datelog, filelog: As for write_result
+    window: The seconds changes are gathered for before a batch is parsed
+    write_existing: False to parse the files there at start up without
+        writing them out
+    """
+    watcher = shipment_watch.watcher
+    shipment_watch.start()
+    results = shipment_watch.parse_dirty()
+    if write_existing and results:
+        say("{0}: {1} devices".format(write_batch(
+            results, output_dir, csvlog, datelog, filelog), len(results)))
+    while True:
+        # directories not there yet are looked for again every poll interval
+        timeout = None
+        if shipment_watch.waiting():
+            timeout = DEFAULT_POLL_INTERVAL
+        if shipment_watch.retire_after is not None:
+            # idle cruises are finished at least this often
+            timeout = min(timeout or shipment_watch.retire_after,
+                          shipment_watch.retire_after)
+        changed = watcher.wait(timeout)
+        shipment_watch.finish_idle()
+        if changed is not None and not changed and not shipment_watch.waiting():
+            continue
+        deadline = time.time() + window
+        while changed is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            more = watcher.wait(remaining)
+            if more is None:
+                changed = None
+            else:
+                changed |= more
+        shipment_watch.changed(changed)
+        begin = time.time()
+        results = shipment_watch.parse_dirty()
+        if results:
+            batch_dir = write_batch(results, output_dir, csvlog, datelog,
+                                    filelog)
+            say("{0}: {1} files in {2} devices, {3:.2f}s".format(
+                batch_dir, sum(result.match_count for result in results),
+                len(results), time.time() - begin))
+
+
+def stop(signum, frame):
+    """
+    Ends the daemon on SIGTERM the way Ctrl-C does, so the run is finished
+    """
+    raise KeyboardInterrupt()
+
+
+def main(argv):
+    """
+    Runs watchDaemon.py with the given command line arguments
+
+    argv: The arguments, as in sys.argv
+    """
+    if len(argv) < 3 or argv[1] == '-h':
+        print(__doc__)
+        return
+
+    cruise_arg = argv[1]
+    filepattern = argv[2]
+    path = os.getcwd() + "/"  # must be called in shipment directory
+    datelog = False
+    filelog = False
+    csvlog = False
+    all_devices = False
+    all_cruises = False
+    write_existing = True
+    window = DEFAULT_WINDOW
+    poll_interval = None
+    output_dir = OUTPUT_DIR
+    retire_hours = DEFAULT_RETIRE_HOURS
+
+    for i in range(2, len(argv)):
+        flag = argv[i]
+        if flag == "-d":
+            csvlog = True
+        if flag == "-m":
+            datelog = True
+        if flag == "-l":
+            filelog = True
+        if flag == "-c":
+            all_devices = True
+        if flag == "-a":
+            all_cruises = True
+        if flag == "-k":
+            write_existing = False
+        if flag == "-f":
+            parseFunctions.content_fallback = True
+        if flag == "-w":
+            window = float(argv[i+1])
+        if flag == "-P":
+            poll_interval = float(argv[i+1])
+        if flag == "-O":
+            output_dir = argv[i+1]
+        if flag == "-R":
+            retire_hours = float(argv[i+1])
+        if flag == "-D":
+            connect, paramstyle = connect_spec(argv[i+1])
+            parseFunctions.db_sink = DatabaseSink(connect, paramstyle)
+
+    parseFunctions.verbose = True
+    parseFunctions.begin_run()
+    parseFunctions.range_aggregator = RangeAggregator()
+    output_dir = os.path.abspath(output_dir)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    exclude = []
+    if os.path.dirname(output_dir) == os.path.abspath(path):
+        exclude.append(os.path.basename(output_dir))
+    retire_after = retire_hours * 3600 if retire_hours > 0 else None
+
+    watcher = make_watcher(poll_interval)
+    say("Watching {0} by {1}".format(
+        path, "polling" if watcher.polling else "inotify"))
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        run(ShipmentWatch(watcher, cruise_arg, path, filepattern,
+                          all_devices, all_cruises, retire_after, exclude),
+            output_dir, csvlog, datelog, filelog, window, write_existing)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        finish_run()
+
+
+if __name__ == '__main__':
+    main(sys.argv)